@@ -0,0 +1,334 @@
+# batching/engine.py
+"""
+Batch formation: groups open OrderItems into COLLECTING PrintBatches.
+
+Items are bucketed by (material, layer_thickness_mm, machine_type) with an
+in-memory hash index, so the whole run is a handful of queries no matter
+how many items are open:
+
+    1. lock the items of open orders                OrderItem
+    2. printers per machine type                    Printer
+       (valid machine types per (material, layer) come from the
+       compatibility index in the reference cache)
+    3. open COLLECTING batches and their fill       PrintBatch / BatchItem
+    4. unbatched quantity of every open item        OrderItem
+    5. bulk_create / bulk_update of the results
+    6. the batched quantities into order progress   OrderItem / Order
+
+The open items are locked before anything is read, so a concurrent run
+waits for this one to commit and then computes the remaining quantities
+from the batches it wrote; without the lock both runs could place the
+same parts, because there may be no COLLECTING batch to lock yet.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from apps.core.reference import reference_data
+from apps.fleet.models import Printer
+from apps.orders import progress
+from apps.orders.models import Order, OrderItem
+from .models import BatchItem, PrintBatch
+
+DEFAULT_BATCH_CAPACITY = 100  # parts per batch before it is marked READY
+
+OPEN_ORDER_STATUSES = ['RECEIVED', 'PROCESSING', 'IN_PRODUCTION']
+
+# Time needed after a batch is scheduled to print, post-process, QC and
+# pack before the order's due date.
+LEAD_TIME = timedelta(hours=24)
+
+# Latest scheduling time for urgent orders, counted from when they arrived
+PRIORITY_WINDOWS = {
+    'RUSH': timedelta(hours=12),
+    'EXPEDITED': timedelta(hours=4),
+}
+
+BULK_BATCH_SIZE = 1000
+
+
+class _OpenBatch:
+    """A COLLECTING batch being filled during one run"""
+    __slots__ = ('batch', 'fill', 'items', 'is_new', 'changed')
+
+    def __init__(self, batch, fill=0, items=None, is_new=False):
+        self.batch = batch
+        self.fill = fill
+        self.items = items or {}  # order_item_id -> BatchItem
+        self.is_new = is_new
+        self.changed = False
+
+
+def schedule_deadline(priority, due_date, received_at):
+    """Latest time an item can be scheduled and still make its due date"""
+    deadlines = []
+    if due_date is not None:
+        deadlines.append(due_date - LEAD_TIME)
+    window = PRIORITY_WINDOWS.get(priority)
+    if window is not None and received_at is not None:
+        deadlines.append(received_at + window)
+    return min(deadlines, default=None)
+
+
+def _compatible_machine_types():
+    """
+    {(material_id, layer_thickness_mm): [machine_type codes]} from the
+    compatibility index. Machine types are ordered by fleet size so new
+    batches go where there is the most printing capacity.
+    """
+    fleet_size = dict(
+        Printer.objects.values_list('machine_type').annotate(n=Count('id')).values_list('machine_type', 'n')
+    )
+    return {
+        key: sorted(machine_types, key=lambda code: (-fleet_size.get(code, 0), code))
+        for key, machine_types in reference_data.compatibility().machine_types_by_item.items()
+    }
+
+
+def _load_open_batches(capacity):
+    """
+    ({(material_id, layer, machine_type_id): [_OpenBatch]}, ready) for
+    COLLECTING batches that still have room, oldest first. Rows are locked
+    so concurrent runs fill batches one at a time. COLLECTING batches that
+    are already at `capacity` (filled by reprints, or a lower capacity than
+    the run that filled them) are marked READY here; `ready` counts them.
+    """
+    batches = list(
+        PrintBatch.objects.select_for_update()
+        .filter(status='COLLECTING')
+        .order_by('created_at')
+    )
+    fill = dict(
+        BatchItem.objects.filter(batch__in=batches)
+        .values_list('batch_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('batch_id', 'total')
+    )
+    items = defaultdict(dict)
+    batch_items = BatchItem.objects.filter(batch__in=batches).only(
+        'id', 'batch_id', 'order_item_id', 'quantity', 'is_reprint'
+    )
+    for batch_item in batch_items:
+        items[batch_item.batch_id][batch_item.order_item_id] = batch_item
+
+    open_batches = defaultdict(list)
+    full = []
+    for batch in batches:
+        if fill.get(batch.id, 0) < capacity:
+            key = (batch.material_id, batch.layer_thickness_mm, batch.machine_type_id)
+            open_batches[key].append(_OpenBatch(batch, fill.get(batch.id, 0), items[batch.id]))
+        else:
+            full.append(batch.id)
+    if full:
+        PrintBatch.objects.filter(pk__in=full).update(status='READY')
+    return open_batches, len(full)
+
+
+def _accepts(current, order_item_id, capacity, is_reprint):
+    """
+    Whether a batch has room for parts of an order item. BatchItem is
+    unique per (batch, item), so a batch holding the item as a reprint
+    cannot take it as ordinary work, and the other way round.
+    """
+    if current.fill >= capacity:
+        return False
+    existing = current.items.get(order_item_id)
+    return existing is None or existing.is_reprint == is_reprint
+
+
+def _lock_open_items():
+    """
+    Lock the OrderItems of open orders (not their orders). The unbatched
+    quantities are a GROUP BY query, which cannot take row locks itself.
+    """
+    return (
+        OrderItem.objects.select_for_update(of=('self',))
+        .filter(order__status__in=OPEN_ORDER_STATUSES)
+        .values_list('id', flat=True)
+    )
+
+
+def _load_open_items():
+    """Open items with quantity not yet placed in a (non-reprint) batch"""
+    return (
+        OrderItem.objects.filter(order__status__in=OPEN_ORDER_STATUSES)
+        .annotate(
+            batched=Coalesce(
+                Sum('batch_items__quantity', filter=Q(batch_items__is_reprint=False)), 0
+            )
+        )
+        .filter(quantity__gt=F('batched'))
+        .values_list(
+            'id', 'material_id', 'layer_thickness_mm', 'quantity', 'batched',
+            'order__priority', 'order__due_date', 'order__received_at'
+        )
+    )
+
+
+class _Placement:
+    """
+    One run of parts being placed into COLLECTING batches, shared by batch
+    formation and reprint requeue (reprints.py). Creating it locks the items
+    of open orders and the COLLECTING batches; group() picks the (material,
+    layer, machine_type) group for parts, place() spreads them over that
+    group's batches and save() writes everything with bulk operations.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        list(_lock_open_items())
+        self.machine_types = _compatible_machine_types()
+        self.open_batches, self.already_full = _load_open_batches(capacity)
+        self.chosen = {}  # (material, layer) -> machine type, or None if none can print it
+        self.positions = defaultdict(int)  # group -> batches before this index are full
+        self.touched = []  # _OpenBatch that received parts, in fill order
+        self.new_items = []
+        self.bumped_items = {}  # pk -> existing BatchItem whose quantity grew
+
+    def group(self, material_id, layer):
+        """(material, layer, machine_type) to place the parts in, or None when no machine type prints them"""
+        key = (material_id, layer)
+        if key not in self.chosen:
+            candidates = self.machine_types.get(key, [])
+            # Prefer a machine type that already has a batch to top up
+            self.chosen[key] = next(
+                (code for code in candidates if self.open_batches.get((material_id, layer, code))),
+                candidates[0] if candidates else None
+            )
+        machine_type = self.chosen[key]
+        return None if machine_type is None else (material_id, layer, machine_type)
+
+    def place(self, group, order_item_id, quantity, priority, deadline, is_reprint=False, original_failure_id=None):
+        """
+        Put `quantity` parts of an order item into the group's batches,
+        splitting them when a batch fills up and opening new batches as
+        needed. Returns the first batch used.
+        """
+        rank = Order.PRIORITY_RANK
+        queue = self.open_batches[group]
+        first_batch = None
+
+        while quantity:
+            index = self.positions[group]
+            while index < len(queue) and not _accepts(queue[index], order_item_id, self.capacity, is_reprint):
+                index += 1
+            if index == len(queue):
+                material_id, layer, machine_type = group
+                queue.append(_OpenBatch(
+                    PrintBatch(material_id=material_id, layer_thickness_mm=layer, machine_type_id=machine_type),
+                    is_new=True
+                ))
+            current = queue[index]
+            batch = current.batch
+            take = min(quantity, self.capacity - current.fill)
+            quantity -= take
+            current.fill += take
+            if not current.changed:
+                current.changed = True
+                self.touched.append(current)
+            if first_batch is None:
+                first_batch = batch
+
+            batch_item = current.items.get(order_item_id)
+            if batch_item is None:
+                batch_item = BatchItem(
+                    batch=batch, order_item_id=order_item_id, quantity=take,
+                    is_reprint=is_reprint, original_failure_id=original_failure_id
+                )
+                current.items[order_item_id] = batch_item
+                self.new_items.append(batch_item)
+            else:
+                batch_item.quantity += take
+                if batch_item.pk is not None:
+                    self.bumped_items[batch_item.pk] = batch_item
+
+            if rank.get(priority, 0) > rank.get(batch.priority, 0):
+                batch.priority = priority
+            if deadline is not None and (batch.must_schedule_by is None or deadline < batch.must_schedule_by):
+                batch.must_schedule_by = deadline
+            if current.fill >= self.capacity:
+                batch.status = 'READY'
+                position = self.positions[group]
+                while position < len(queue) and queue[position].fill >= self.capacity:
+                    position += 1
+                self.positions[group] = position
+
+        return first_batch
+
+    def save(self, summary):
+        """Write the batches and batch items, and fill in the batch counts of `summary`"""
+        created = [current.batch for current in self.touched if current.is_new]
+        updated = [current.batch for current in self.touched if not current.is_new]
+        summary['batches_created'] = len(created)
+        summary['batches_updated'] = len(updated)
+        summary['batches_ready'] = self.already_full + sum(
+            1 for current in self.touched if current.batch.status == 'READY'
+        )
+
+        PrintBatch.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        PrintBatch.objects.bulk_update(
+            updated, ['status', 'priority', 'must_schedule_by'], batch_size=BULK_BATCH_SIZE
+        )
+        BatchItem.objects.bulk_create(self.new_items, batch_size=BULK_BATCH_SIZE)
+        BatchItem.objects.bulk_update(self.bumped_items.values(), ['quantity'], batch_size=BULK_BATCH_SIZE)
+
+
+def form_batches(capacity=DEFAULT_BATCH_CAPACITY, dry_run=False):
+    """
+    Place every open, unbatched OrderItem into a COLLECTING PrintBatch.
+
+    Items are grouped by (material, layer_thickness_mm, machine_type) and
+    placed most urgent first (Order.priority, then deadline). Existing
+    COLLECTING batches are topped up before new ones are opened, an item
+    is split across batches when it does not fit, and a batch that reaches
+    `capacity` parts is marked READY. Each batch takes the highest priority
+    and the earliest must_schedule_by of the items it holds.
+
+    With dry_run=True all work is done and reported, then rolled back.
+    """
+    rank = Order.PRIORITY_RANK
+    summary = {
+        'items_batched': 0,
+        'quantity_batched': 0,
+        'batches_created': 0,
+        'batches_updated': 0,
+        'batches_ready': 0,
+        'unbatchable_items': 0,
+    }
+
+    with transaction.atomic():
+        placement = _Placement(capacity)
+
+        # Hash index: (material, layer, machine_type) -> items
+        groups = defaultdict(list)
+        for row in _load_open_items():
+            item_id, material_id, layer, quantity, batched, priority, due_date, received_at = row
+            group = placement.group(material_id, layer)
+            if group is None:
+                summary['unbatchable_items'] += 1
+                continue
+
+            deadline = schedule_deadline(priority, due_date, received_at)
+            urgency = (-rank.get(priority, 0), deadline.timestamp() if deadline else float('inf'))
+            groups[group].append((urgency, item_id, quantity - batched, priority, deadline))
+
+        batched = progress.changes()
+        for group, items in groups.items():
+            items.sort(key=lambda item: item[0])
+            for _, item_id, remaining, priority, deadline in items:
+                summary['items_batched'] += 1
+                summary['quantity_batched'] += remaining
+                placement.place(group, item_id, remaining, priority, deadline)
+                batched[item_id]['quantity_batched'] += remaining
+
+        placement.save(summary)
+        progress.record(batched)
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return summary
@@ -0,0 +1,81 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.batching.engine import form_batches
+from apps.core.benchmarking import Stopwatch, rate, scratch_database
+from apps.core.models import MachineType, Material, PrintSetting
+from apps.core.reference import reference_data
+from apps.orders.models import Order, OrderItem
+
+MATERIAL_CODES = ['FLGPGR05', 'FLGPCL05', 'FLTO2001', 'FLDUCL02', 'FLRG1011', 'FLFL8001']
+MACHINE_TYPES = ['FORM-4-0', 'FORM-4L-0', 'FORM-3-0']
+LAYERS = ['0.025', '0.05', '0.1']
+
+
+def seed(item_count, items_per_order=10):
+    Material.objects.bulk_create([
+        Material(code=code, label=code, material_type='SLA') for code in MATERIAL_CODES
+    ])
+    MachineType.objects.bulk_create([
+        MachineType(code=code, label=code, build_volume_x=200, build_volume_y=125, build_volume_z=210, printer_family='SLA')
+        for code in MACHINE_TYPES
+    ])
+    PrintSetting.objects.bulk_create([
+        PrintSetting(machine_type=machine_type, material_id=material, layer_thickness_mm=layer)
+        for machine_type in MACHINE_TYPES
+        for material in MATERIAL_CODES
+        for layer in LAYERS
+    ])
+    # bulk_create sends no signals
+    reference_data.invalidate()
+
+    rng = random.Random(0)
+    now = timezone.now()
+    orders = [
+        Order(
+            external_id=f'bench-{n}',
+            customer_email='bench@example.com',
+            customer_name='Bench',
+            shipping_address='1 Main St',
+            priority=rng.choice(['STANDARD'] * 8 + ['RUSH', 'EXPEDITED']),
+            due_date=now + timedelta(days=rng.randint(2, 10)),
+        )
+        for n in range(item_count // items_per_order)
+    ]
+    Order.objects.bulk_create(orders, batch_size=1000)
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(
+                order=order,
+                model_file_url='https://files.example.com/part.stl',
+                model_file_name='part.stl',
+                quantity=rng.randint(1, 4),
+                material_id=rng.choice(MATERIAL_CODES),
+                layer_thickness_mm=rng.choice(LAYERS),
+            )
+            for order in orders
+            for _ in range(items_per_order)
+        ],
+        batch_size=1000
+    )
+
+
+class Command(BaseCommand):
+    help = "Time batch formation over a seeded set of open order items (uses a scratch DB)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=50_000)
+
+    def handle(self, *args, **options):
+        item_count = options['items']
+
+        with scratch_database():
+            seed(item_count)
+            with Stopwatch() as run:
+                summary = form_batches()
+
+        self.stdout.write(f"{item_count} open items -> {summary['batches_created']} batches")
+        self.stdout.write(f"  formation: {run.elapsed:8.2f}s  {rate(summary['items_batched'], run.elapsed):10.0f} items/s")
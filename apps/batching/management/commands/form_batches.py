@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.batching.engine import DEFAULT_BATCH_CAPACITY, form_batches
+
+
+class Command(BaseCommand):
+    help = "Group open order items into COLLECTING print batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacity', type=int, default=DEFAULT_BATCH_CAPACITY, help='Parts per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change, then roll back')
+
+    def handle(self, *args, **options):
+        summary = form_batches(capacity=options['capacity'], dry_run=options['dry_run'])
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.batching.engine import DEFAULT_BATCH_CAPACITY
+from apps.batching.reprints import requeue_failures
+
+
+class Command(BaseCommand):
+    help = "Requeue unrequeued failed parts into COLLECTING print batches as reprints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacity', type=int, default=DEFAULT_BATCH_CAPACITY, help='Parts per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change, then roll back')
+
+    def handle(self, *args, **options):
+        summary = requeue_failures(capacity=options['capacity'], dry_run=options['dry_run'])
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,26 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:34
+
+from django.db import migrations, models
+
+from apps.core.compatibility import normalize_layer_column
+
+
+def normalize_layer_thickness(apps, schema_editor):
+    """Rewrite free-form values ('0.1', ' 0.10mm') as plain numbers before the column type changes"""
+    normalize_layer_column(apps.get_model('batching', 'PrintBatch'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batching', '0003_alter_printbatch_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_layer_thickness, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='printbatch',
+            name='layer_thickness_mm',
+            field=models.DecimalField(decimal_places=3, max_digits=5),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batching', '0004_alter_printbatch_layer_thickness_mm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='printbatch',
+            index=models.Index(fields=['status', 'must_schedule_by'], name='batch_status_deadline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printbatch',
+            index=models.Index(condition=models.Q(('status', 'COLLECTING')), fields=['created_at'], name='batch_collecting_idx'),
+        ),
+    ]
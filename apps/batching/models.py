@@ -16,16 +16,24 @@ class PrintBatch(models.Model):
     
     # Print settings for this batch
     material = models.ForeignKey('core.Material', on_delete=models.PROTECT)
-    layer_thickness_mm = models.CharField(max_length=20)
+    layer_thickness_mm = models.DecimalField(max_digits=5, decimal_places=3)
     machine_type = models.ForeignKey('core.MachineType', on_delete=models.PROTECT)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='COLLECTING')
     priority = models.CharField(max_length=20, default='STANDARD')
     must_schedule_by = models.DateTimeField(null=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     scheduled_at = models.DateTimeField(null=True)
 
+    class Meta:
+        indexes = [
+            # Batches by state and deadline (READY batches most urgent first)
+            models.Index(fields=['status', 'must_schedule_by'], name='batch_status_deadline_idx'),
+            # COLLECTING batches batch formation tops up, oldest first
+            models.Index(fields=['created_at'], condition=models.Q(status='COLLECTING'), name='batch_collecting_idx'),
+        ]
+
 
 class BatchItem(models.Model):
     """Links order items to batches"""
@@ -0,0 +1,116 @@
+# batching/reprints.py
+"""
+Reprint requeue: puts every unrequeued FailedPartRecord back into a
+COLLECTING PrintBatch as a reprint BatchItem.
+
+Reprints are on the critical path to the ship date, so they go in ahead
+of ordinary work: a failure counts as one priority level above its order,
+and the batch it lands in takes that priority. Placement otherwise goes
+through the same engine._Placement as batch formation: failures are
+grouped by (material, layer_thickness_mm, machine_type), the most urgent
+first, COLLECTING batches are topped up before new ones are opened and a
+full batch is marked READY.
+
+The failures are locked with select_for_update for the whole run, and
+_Placement locks the items of open orders and the COLLECTING batches as
+batch formation does, so a concurrent requeue or batch formation run
+waits for this one. Two runs therefore cannot requeue the same failure
+twice: the second finds those records already requeued.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+
+from apps.orders.models import Order
+from apps.production.models import FailedPartRecord
+from .engine import BULK_BATCH_SIZE, DEFAULT_BATCH_CAPACITY, _Placement, schedule_deadline
+
+# Failures of orders in these states are left alone
+CLOSED_ORDER_STATUSES = ['SHIPPED', 'CANCELLED']
+
+
+def elevated_priority(priority):
+    """The priority one level above `priority` (the top level stays put)"""
+    rank = Order.PRIORITY_RANK
+    target = min(rank.get(priority, 0) + 1, max(rank.values()))
+    return next(name for name, value in rank.items() if value == target)
+
+
+def _load_failures():
+    """Unrequeued failures of open orders, oldest first; the records are locked"""
+    return (
+        FailedPartRecord.objects.select_for_update(of=('self',))
+        .filter(requeued=False)
+        .exclude(order_item__order__status__in=CLOSED_ORDER_STATUSES)
+        .order_by('created_at')
+        .values_list(
+            'id', 'order_item_id', 'quantity',
+            'order_item__material_id', 'order_item__layer_thickness_mm',
+            'order_item__order__priority', 'order_item__order__due_date', 'order_item__order__received_at'
+        )
+    )
+
+
+def requeue_failures(capacity=DEFAULT_BATCH_CAPACITY, dry_run=False):
+    """
+    Requeue every unrequeued FailedPartRecord as reprint BatchItems.
+
+    Returns a summary. Failures whose material and layer no machine type
+    can print stay unrequeued and are counted as unbatchable. A failure
+    may be split across batches; requeued_to_batch records the first.
+    A BatchItem is unique per (batch, order item), so a failure never
+    joins a batch that already holds the item as ordinary work, and
+    several failures of one item in the same batch share one reprint row.
+
+    With dry_run=True all work is done and reported, then rolled back.
+    """
+    rank = Order.PRIORITY_RANK
+    summary = {
+        'failures_requeued': 0,
+        'quantity_requeued': 0,
+        'batches_created': 0,
+        'batches_updated': 0,
+        'batches_ready': 0,
+        'unbatchable_failures': 0,
+    }
+
+    with transaction.atomic():
+        failures = list(_load_failures())
+        if not failures:
+            return summary
+        placement = _Placement(capacity)
+
+        groups = defaultdict(list)
+        for failure_id, order_item_id, quantity, material_id, layer, priority, due_date, received_at in failures:
+            group = placement.group(material_id, layer)
+            if group is None:
+                summary['unbatchable_failures'] += 1
+                continue
+
+            priority = elevated_priority(priority)
+            deadline = schedule_deadline(priority, due_date, received_at)
+            urgency = (-rank[priority], deadline.timestamp() if deadline else float('inf'))
+            groups[group].append((urgency, failure_id, order_item_id, quantity, priority, deadline))
+
+        requeued = []
+        for group, items in groups.items():
+            items.sort(key=lambda item: item[0])
+            for _, failure_id, order_item_id, quantity, priority, deadline in items:
+                summary['failures_requeued'] += 1
+                summary['quantity_requeued'] += quantity
+                first_batch = placement.place(
+                    group, order_item_id, quantity, priority, deadline,
+                    is_reprint=True, original_failure_id=failure_id
+                )
+                requeued.append(FailedPartRecord(id=failure_id, requeued=True, requeued_to_batch=first_batch))
+
+        placement.save(summary)
+        FailedPartRecord.objects.bulk_update(
+            requeued, ['requeued', 'requeued_to_batch'], batch_size=BULK_BATCH_SIZE
+        )
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return summary
@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from .models import PrintBatch, BatchItem
 
-from apps.core.serializers import MaterialSerializer, MachineTypeSerializer
+from apps.core.reference import reference_data
+from apps.core.serializers import ReferenceField
 from apps.orders.serializers import OrderItemSerializer
+from apps.production.layout import DEFAULT_SPACING_MM
+from .engine import DEFAULT_BATCH_CAPACITY
 # from apps.production.serializers import FailedPartRecordSerializer
 
 class BatchItemSerializer(serializers.ModelSerializer):
@@ -43,9 +46,10 @@ class BatchItemSerializer(serializers.ModelSerializer):
     
 class PrintBatchSerializer(serializers.ModelSerializer):
     # Helper fields for the frontend table view
-    item_count = serializers.IntegerField(source='items.count', read_only=True)
-    material_name = serializers.CharField(source='material.name', read_only=True)
-    machine_name = serializers.CharField(source='machine_type.name', read_only=True)
+    # Annotated by PrintBatchViewSet.get_queryset
+    item_count = serializers.IntegerField(read_only=True)
+    material_name = serializers.CharField(source='material.label', read_only=True)
+    machine_name = serializers.CharField(source='machine_type.label', read_only=True)
 
     class Meta:
         model = PrintBatch
@@ -65,10 +69,23 @@ class PrintBatchSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
 
+    def validate(self, data):
+        """The batch's machine/material/layer must be a known print setting"""
+        machine_type = data.get('machine_type', getattr(self.instance, 'machine_type', None))
+        material = data.get('material', getattr(self.instance, 'material', None))
+        layer = data.get('layer_thickness_mm', getattr(self.instance, 'layer_thickness_mm', None))
+        if None not in (machine_type, material, layer) and not reference_data.compatibility().is_valid(
+            machine_type.pk, material.pk, layer
+        ):
+            raise serializers.ValidationError({
+                'layer_thickness_mm': [f"No print setting for {material.pk} at {layer} mm on {machine_type.pk}."]
+            })
+        return data
+
 class PrintBatchDetailSerializer(serializers.ModelSerializer):
     # Nest the items here
     items = BatchItemSerializer(many=True, read_only=True)
-    material = MaterialSerializer(read_only=True) 
+    material = ReferenceField('material', source='material_id')
 
     class Meta:
         model = PrintBatch
@@ -83,4 +100,15 @@ class PrintBatchDetailSerializer(serializers.ModelSerializer):
             'scheduled_at', 
             'created_at',
             'items' # <--- The nested list of items
-        ]
\ No newline at end of file
+        ]
+
+
+class BatchFormationSerializer(serializers.Serializer):
+    """Options for POST /print-batch/form/ and /print-batch/requeue/"""
+    capacity = serializers.IntegerField(min_value=1, default=DEFAULT_BATCH_CAPACITY)
+    dry_run = serializers.BooleanField(default=False)
+
+
+class BatchLayoutSerializer(serializers.Serializer):
+    """Options for POST /print-batch/{id}/layout/"""
+    spacing_mm = serializers.FloatField(min_value=0, default=DEFAULT_SPACING_MM)
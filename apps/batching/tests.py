@@ -1,3 +1,145 @@
 from django.test import TestCase
 
-# Create your tests here.
+from apps.core.testing import make_order, reference_fixture
+from apps.orders.models import Order, OrderItem
+from apps.production.models import FailedPartRecord
+from .engine import _lock_open_items, form_batches
+from .models import BatchItem, PrintBatch
+from .reprints import requeue_failures
+
+
+class ReprintRowTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.item = make_order(items=[(5, 'FLGPGR05', '0.1')]).items.get()
+
+    def test_ordinary_work_never_joins_a_reprint_row(self):
+        FailedPartRecord.objects.create(order_item=self.item, quantity=4, failure_type='PRINT_FAILED')
+        requeue_failures()
+
+        for _ in range(3):
+            form_batches()
+
+        reprint = BatchItem.objects.get(order_item=self.item, is_reprint=True)
+        ordinary = BatchItem.objects.get(order_item=self.item, is_reprint=False)
+        self.assertEqual(reprint.quantity, 4)
+        self.assertEqual(ordinary.quantity, 5)
+        self.assertNotEqual(reprint.batch_id, ordinary.batch_id)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity_batched, 5)
+
+    def test_reprint_skips_the_batch_of_ordinary_work_and_splits(self):
+        form_batches(capacity=6)
+        ordinary = BatchItem.objects.get()
+        failure = FailedPartRecord.objects.create(order_item=self.item, quantity=8, failure_type='PRINT_FAILED')
+
+        summary = requeue_failures(capacity=6)
+
+        self.assertEqual(summary['batches_created'], 2)
+        self.assertEqual(summary['batches_ready'], 1)
+        reprints = list(BatchItem.objects.filter(is_reprint=True).order_by('-quantity'))
+        self.assertEqual([reprint.quantity for reprint in reprints], [6, 2])
+        self.assertNotIn(ordinary.batch_id, [reprint.batch_id for reprint in reprints])
+        failure.refresh_from_db()
+        self.assertEqual(failure.requeued_to_batch_id, reprints[0].batch_id)
+
+    def test_second_run_batches_nothing(self):
+        FailedPartRecord.objects.create(order_item=self.item, quantity=4, failure_type='PRINT_FAILED')
+        requeue_failures()
+
+        self.assertEqual(form_batches()['quantity_batched'], 5)
+        self.assertEqual(form_batches()['quantity_batched'], 0)
+        self.assertEqual(OrderItem.objects.get().quantity_batched, 5)
+
+
+class FormBatchesTests(TestCase):
+    def setUp(self):
+        reference_fixture(materials=('FLGPGR05', 'FLGPCL05'))
+
+    def test_items_are_grouped_by_material_and_layer(self):
+        make_order('a', items=[(3, 'FLGPGR05', '0.1'), (2, 'FLGPCL05', '0.1')])
+        make_order('b', items=[(4, 'FLGPGR05', '0.1')])
+
+        summary = form_batches()
+
+        self.assertEqual(summary['items_batched'], 3)
+        self.assertEqual(summary['quantity_batched'], 9)
+        self.assertEqual(summary['batches_created'], 2)
+        fills = {
+            batch.material_id: sum(item.quantity for item in batch.items.all())
+            for batch in PrintBatch.objects.prefetch_related('items')
+        }
+        self.assertEqual(fills, {'FLGPGR05': 7, 'FLGPCL05': 2})
+        self.assertEqual(form_batches()['items_batched'], 0)
+
+    def test_item_without_a_print_setting_is_unbatchable(self):
+        make_order(items=[(1, 'FLGPGR05', '0.05')])
+
+        summary = form_batches()
+
+        self.assertEqual(summary['unbatchable_items'], 1)
+        self.assertFalse(PrintBatch.objects.exists())
+
+    def test_full_batch_is_ready_and_the_rest_spills_over(self):
+        make_order(items=[(7, 'FLGPGR05', '0.1')])
+
+        summary = form_batches(capacity=5)
+
+        self.assertEqual(summary['batches_created'], 2)
+        self.assertEqual(summary['batches_ready'], 1)
+        statuses = sorted(
+            (batch.status, batch.items.get().quantity) for batch in PrintBatch.objects.all()
+        )
+        self.assertEqual(statuses, [('COLLECTING', 2), ('READY', 5)])
+
+    def test_existing_batch_is_topped_up_before_a_new_one_opens(self):
+        make_order('a', items=[(2, 'FLGPGR05', '0.1')])
+        form_batches(capacity=5)
+        make_order('b', items=[(3, 'FLGPGR05', '0.1')])
+
+        summary = form_batches(capacity=5)
+
+        self.assertEqual(summary['batches_created'], 0)
+        self.assertEqual(summary['batches_updated'], 1)
+        self.assertEqual(PrintBatch.objects.get().status, 'READY')
+
+    def test_collecting_batch_loaded_at_capacity_is_marked_ready(self):
+        make_order(items=[(4, 'FLGPGR05', '0.1')])
+        form_batches(capacity=5)
+        batch = PrintBatch.objects.get()
+        self.assertEqual(batch.status, 'COLLECTING')
+
+        summary = form_batches(capacity=4)
+
+        self.assertEqual(summary['batches_ready'], 1)
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'READY')
+
+    def test_rush_order_is_placed_first_and_sets_the_batch_priority(self):
+        make_order('normal', items=[(4, 'FLGPGR05', '0.1')])
+        rush = make_order('rush', items=[(3, 'FLGPGR05', '0.1')], priority='RUSH')
+
+        form_batches(capacity=5)
+
+        ready = PrintBatch.objects.get(status='READY')
+        self.assertEqual(ready.priority, 'RUSH')
+        self.assertIsNotNone(ready.must_schedule_by)
+        self.assertEqual(ready.items.get(order_item__order=rush).quantity, 3)
+
+    def test_items_of_open_orders_are_locked(self):
+        item = make_order('open', items=[(2, 'FLGPGR05', '0.1')]).items.get()
+        shipped = make_order('shipped', items=[(2, 'FLGPGR05', '0.1')])
+        Order.objects.filter(pk=shipped.pk).update(status='SHIPPED')
+
+        locked = _lock_open_items()
+
+        self.assertTrue(locked.query.select_for_update)
+        self.assertEqual(locked.query.select_for_update_of, ('self',))
+        self.assertEqual(list(locked), [item.id])
+
+    def test_dry_run_rolls_back(self):
+        make_order(items=[(2, 'FLGPGR05', '0.1')])
+
+        self.assertEqual(form_batches(dry_run=True)['quantity_batched'], 2)
+        self.assertFalse(PrintBatch.objects.exists())
+        self.assertEqual(OrderItem.objects.get().quantity_batched, 0)
@@ -1,17 +1,76 @@
 from django.shortcuts import render
 
+from django.db.models import Count
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from apps.production.layout import layout_batch
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
+from .engine import form_batches
+from .reprints import requeue_failures
 from .models import PrintBatch, BatchItem
-from .serializers import BatchItemSerializer, PrintBatchDetailSerializer, PrintBatchSerializer
+from .serializers import (
+    BatchFormationSerializer,
+    BatchLayoutSerializer,
+    BatchItemSerializer,
+    PrintBatchDetailSerializer,
+    PrintBatchSerializer
+)
 
-class PrintBatchViewSet(viewsets.ModelViewSet):
+class PrintBatchViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    cursor_ordering = ('-created_at', '-id')
+    query_budget = {'list': 1, 'retrieve': 3}
     queryset = PrintBatch.objects.all().select_related('material', 'machine_type')
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return queryset.prefetch_related('items__order_item')
+        return queryset.annotate(item_count=Count('items'))
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PrintBatchDetailSerializer
+        if self.action in ('form', 'requeue'):
+            return BatchFormationSerializer
+        if self.action == 'layout':
+            return BatchLayoutSerializer
         return PrintBatchSerializer
 
-class BatchItemViewSet(viewsets.ModelViewSet):
-    queryset = BatchItem.objects.all()
+    @action(detail=False, methods=['post'])
+    def form(self, request):
+        """
+        Run the batching engine over all open order items.
+        Accepts optional 'capacity' and 'dry_run'; returns the run summary.
+        """
+        serializer = BatchFormationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(form_batches(**serializer.validated_data))
+
+    @action(detail=False, methods=['post'])
+    def requeue(self, request):
+        """
+        Put every unrequeued failed part back into a batch as a reprint.
+        Accepts optional 'capacity' and 'dry_run'; returns the run summary.
+        """
+        serializer = BatchFormationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(requeue_failures(**serializer.validated_data))
+
+    @action(detail=True, methods=['post'])
+    def layout(self, request, pk=None):
+        """
+        Pack the batch's parts onto build plates locally and store the
+        result as Scenes. Reports plate count, packing density and time.
+        """
+        batch = self.get_object()
+        serializer = BatchLayoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(layout_batch(batch, **serializer.validated_data))
+
+class BatchItemViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    query_budget = {'list': 1, 'retrieve': 1}
+    # order_item feeds order_item_details
+    queryset = BatchItem.objects.all().select_related('order_item')
     serializer_class = BatchItemSerializer  
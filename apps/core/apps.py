@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'apps.core'
+
+    def ready(self):
+        # Installs the per-connection query recorder
+        from . import instrumentation  # noqa: F401
+        from . import signals  # noqa: F401
@@ -0,0 +1,47 @@
+# core/benchmarking.py
+"""
+Helpers shared by the benchmark_* management commands.
+
+Benchmarks never touch the configured database: they run against a
+throwaway test database that is created and destroyed around the run.
+"""
+
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+
+from .reference import reference_data
+
+
+@contextmanager
+def scratch_database(alias='default'):
+    """Create a fresh, migrated test database for the duration of the block."""
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    # The cached reference rows belong to the database being swapped out
+    reference_data.invalidate()
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        reference_data.invalidate()
+
+
+class Stopwatch:
+    """Context manager that records wall-clock seconds in .elapsed"""
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self.elapsed = 0.0
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._start
+        return False
+
+
+def rate(count, seconds):
+    """Rows (or operations) per second, safe for zero durations."""
+    return count / seconds if seconds > 0 else float('inf')
@@ -0,0 +1,117 @@
+# core/compatibility.py
+"""
+Which (machine type, material, layer thickness) combinations can print.
+
+PrintSetting rows are the source of truth. CompatibilityIndex turns them
+into dicts so every question is a single lookup:
+
+    setting(machine_type, material, layer)   -> PrintSetting or None
+    machine_types_for(material, layer)       -> machine type codes
+    machine_types_for_material(material)     -> machine type codes
+    materials_for_machine_type(machine_type) -> material codes
+
+The index is built with each reference-data snapshot (core.reference), so
+it is rebuilt whenever a setting, material or machine type changes; get
+the current one with reference_data.compatibility().
+
+Layer thicknesses are Decimals with LAYER_DECIMAL_PLACES places; use
+normalize_layer() on anything that came from a request or a string.
+normalize_layer_column() does the same to a stored column, for the
+migrations that turned free-form text into DecimalFields.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+LAYER_DECIMAL_PLACES = 3
+
+_LAYER_QUANTUM = Decimal(1).scaleb(-LAYER_DECIMAL_PLACES)
+
+
+def normalize_layer(value):
+    """Decimal layer thickness in mm from '0.1', '0.100 mm', 0.1 or Decimal; ValueError if not a number"""
+    if isinstance(value, str):
+        value = value.strip().lower().removesuffix('mm').strip()
+    try:
+        layer = Decimal(str(value)).quantize(_LAYER_QUANTUM)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Not a layer thickness: {value!r}") from None
+    if not layer.is_finite() or layer <= 0:
+        raise ValueError(f"Not a layer thickness: {value!r}")
+    return layer
+
+
+def normalize_layer_column(model, unique_with=()):
+    """
+    Data migration step: rewrite `model`.layer_thickness_mm text ('.1',
+    ' 0.10mm') as plain numbers, one UPDATE per distinct spelling. When
+    the column is part of a unique constraint with `unique_with`, rows
+    that become the same key keep the lowest pk and the others are
+    deleted first.
+    """
+    canonical = {}
+    for raw in model.objects.values_list('layer_thickness_mm', flat=True).distinct():
+        try:
+            canonical[raw] = str(normalize_layer(raw))
+        except ValueError:
+            raise ValueError(f"{model.__name__}.layer_thickness_mm {raw!r} is not a number") from None
+
+    if unique_with:
+        kept = set()
+        duplicates = []
+        for pk, raw, *key in model.objects.order_by('pk').values_list('pk', 'layer_thickness_mm', *unique_with):
+            key = (*key, canonical[raw])
+            if key in kept:
+                duplicates.append(pk)
+            else:
+                kept.add(key)
+        model.objects.filter(pk__in=duplicates).delete()
+
+    for raw, value in canonical.items():
+        if value != raw:
+            model.objects.filter(layer_thickness_mm=raw).update(layer_thickness_mm=value)
+
+
+class CompatibilityIndex:
+    """Immutable lookup tables over a set of PrintSettings"""
+
+    def __init__(self, print_settings, machine_types):
+        """
+        `print_settings`: PrintSetting rows. `machine_types`: the known
+        machine type codes; settings naming any other machine type are
+        ignored (PrintSetting.machine_type is a plain code, not a key).
+        """
+        settings = {}
+        by_item = {}
+        by_material = {}
+        by_machine_type = {}
+        for setting in print_settings:
+            if setting.machine_type not in machine_types:
+                continue
+            layer = normalize_layer(setting.layer_thickness_mm)
+            settings[(setting.machine_type, setting.material_id, layer)] = setting
+            by_item.setdefault((setting.material_id, layer), set()).add(setting.machine_type)
+            by_material.setdefault(setting.material_id, set()).add(setting.machine_type)
+            by_machine_type.setdefault(setting.machine_type, set()).add(setting.material_id)
+
+        self._settings = settings
+        # Sorted tuples so callers get a stable order
+        self.machine_types_by_item = {key: tuple(sorted(codes)) for key, codes in by_item.items()}
+        self._by_material = {key: frozenset(codes) for key, codes in by_material.items()}
+        self._by_machine_type = {key: frozenset(codes) for key, codes in by_machine_type.items()}
+
+    def setting(self, machine_type, material, layer):
+        """The PrintSetting for this combination, or None if it cannot print"""
+        return self._settings.get((machine_type, material, normalize_layer(layer)))
+
+    def is_valid(self, machine_type, material, layer):
+        return self.setting(machine_type, material, layer) is not None
+
+    def machine_types_for(self, material, layer):
+        """Machine type codes that can print `material` at `layer`; empty if none"""
+        return self.machine_types_by_item.get((material, normalize_layer(layer)), ())
+
+    def machine_types_for_material(self, material):
+        return self._by_material.get(material, frozenset())
+
+    def materials_for_machine_type(self, machine_type):
+        return self._by_machine_type.get(machine_type, frozenset())
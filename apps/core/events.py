@@ -0,0 +1,242 @@
+# core/events.py
+"""
+Change bus for live dashboards.
+
+Model saves publish small deltas ({'type', 'id', 'changes', ...}) after the
+transaction commits; every connected client (see core.views.event_stream)
+holds a Subscription that receives them on its own event loop.
+
+Backpressure: a subscription keeps at most one pending delta per object,
+so a slow client always gets the latest state rather than a growing
+backlog. If even that overflows, the oldest deltas are dropped and the
+client is sent a 'resync' event telling it to reload.
+
+Deltas cross processes through the shared cache, so the ones published by
+a worker (the scheduler, poll_preform_operations, telemetry flushes) reach
+clients connected to the web processes. Each delta is stored for
+EVENT_TTL_S under a sequence number from a SharedVersion counter
+(core.versioning). A process with subscribers runs a relay thread that
+reads the new numbers every RELAY_INTERVAL_S and delivers the deltas other
+processes published. A delta that expired or was evicted before it was
+read becomes a 'resync'. The shared cache is Redis when REDIS_URL is set;
+without it every process has its own cache, and the bus is per process.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from django.utils import timezone
+
+from .versioning import SharedVersion
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 5000
+
+EVENT_SEQUENCE_KEY = 'core:events:sequence'
+EVENT_KEY_PREFIX = 'core:events:'
+
+# How long a published delta waits in the shared cache for the relays
+EVENT_TTL_S = 60
+RELAY_INTERVAL_S = 0.5
+
+# Deltas read per relay pass; a relay further behind resyncs its clients
+RELAY_MAX_BATCH = 5000
+
+
+class Subscription:
+    """One client's view of the bus; all methods except close() run on its loop"""
+
+    def __init__(self, bus, loop, kinds=None, maxsize=DEFAULT_MAX_PENDING):
+        self.bus = bus
+        self.loop = loop
+        self.kinds = kinds
+        self.maxsize = maxsize
+        self._pending = OrderedDict()  # (type, id) -> latest event
+        self._overflowed = False
+        self._wake = asyncio.Event()
+
+    def wants(self, event):
+        return self.kinds is None or event['type'] in self.kinds
+
+    def _push(self, event):
+        key = (event['type'], event['id'])
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            # Coalesce: merge so no changed field is lost
+            event = dict(event, changes={**previous['changes'], **event['changes']})
+        self._pending[key] = event
+        while len(self._pending) > self.maxsize:
+            self._pending.popitem(last=False)
+            self._overflowed = True
+        self._wake.set()
+
+    def _resync(self):
+        self._overflowed = True
+        self._wake.set()
+
+    async def get(self, timeout=None):
+        """Wait for deltas; returns them (oldest first), or [] on timeout"""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except TimeoutError:
+            return []
+
+        self._wake.clear()
+        events = list(self._pending.values())
+        self._pending.clear()
+        if self._overflowed:
+            self._overflowed = False
+            events.insert(0, {'type': 'resync', 'id': None, 'changes': {}, 'at': timezone.now()})
+        return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class ChangeBus:
+    """
+    Fans deltas out to this process's subscriptions and, through the
+    shared cache, to the other processes'. With relay=False nothing is
+    read from other processes unless relay_once() is called.
+    """
+
+    def __init__(self, relay=True):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self.origin = uuid.uuid4().hex
+        self._sequence = SharedVersion(EVENT_SEQUENCE_KEY, check_interval=0)
+        self._relay = relay
+        self._relay_thread = None
+        self._relayed = None  # last sequence number read from the shared cache
+
+    def subscribe(self, kinds=None, maxsize=DEFAULT_MAX_PENDING):
+        """Register a subscription bound to the running event loop"""
+        subscription = Subscription(self, asyncio.get_running_loop(), kinds, maxsize)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            start_relay = self._relayed is None
+            if start_relay:
+                # Only what is published from now on
+                self._relayed = self._sequence.get()
+        if start_relay and self._relay:
+            self._relay_thread = threading.Thread(target=self._run_relay, name='change-bus-relay', daemon=True)
+            self._relay_thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _deliver(self, event=None):
+        """Push `event` to every interested local subscription, or a resync if None"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if event is not None and not subscription.wants(event):
+                continue
+            callback = (subscription._resync,) if event is None else (subscription._push, event)
+            try:
+                subscription.loop.call_soon_threadsafe(*callback)
+            except RuntimeError:
+                # The client's loop is gone
+                self.unsubscribe(subscription)
+
+    def publish(self, event):
+        """Fan an event out to every interested subscription, here and in other processes (thread-safe)"""
+        self._deliver(event)
+        try:
+            sequence = self._sequence.bump()
+            cache.set(f'{EVENT_KEY_PREFIX}{sequence}', (self.origin, event), EVENT_TTL_S)
+        except Exception:
+            # Live updates are best effort; the save that caused them stands
+            logger.exception("Publishing a change to the shared cache failed")
+
+    def relay_once(self):
+        """Deliver what other processes published since the last pass; returns how many deltas"""
+        with self._lock:
+            relayed = self._relayed
+        if relayed is None:
+            return 0
+        current = self._sequence.get()
+        if current <= relayed:
+            if current < relayed:
+                # The counter was evicted and started over
+                with self._lock:
+                    self._relayed = current
+            return 0
+
+        first = max(relayed + 1, current - RELAY_MAX_BATCH + 1)
+        keys = [f'{EVENT_KEY_PREFIX}{sequence}' for sequence in range(first, current + 1)]
+        stored = cache.get_many(keys)
+        with self._lock:
+            self._relayed = current
+
+        if first > relayed + 1 or len(stored) < len(keys):
+            self._deliver(None)
+        delivered = 0
+        for key in keys:
+            origin, event = stored.get(key, (self.origin, None))
+            if origin != self.origin:
+                self._deliver(event)
+                delivered += 1
+        return delivered
+
+    def _run_relay(self):
+        while True:
+            time.sleep(RELAY_INTERVAL_S)
+            try:
+                self.relay_once()
+            except Exception:
+                logger.exception("Change bus relay pass failed")
+
+    def publish_on_commit(self, event):
+        """Publish once the surrounding transaction (if any) commits"""
+        transaction.on_commit(lambda: self.publish(event))
+
+
+change_bus = ChangeBus()
+
+
+def delta(kind, pk, changes, **context):
+    """Build a bus event"""
+    return {'type': kind, 'id': pk, 'changes': changes, 'at': timezone.now(), **context}
+
+
+def track_changes(model, kind, fields, context=()):
+    """
+    Publish a delta whenever any of `fields` changes on a save of `model`.
+
+    The loaded values are remembered at post_init (deferred fields are
+    skipped, never fetched). `context` names attributes sent with every
+    delta, e.g. a foreign key id.
+    """
+
+    def snapshot(instance):
+        return {field: instance.__dict__[field] for field in fields if field in instance.__dict__}
+
+    def remember(sender, instance, **kwargs):
+        instance._change_snapshot = snapshot(instance)
+
+    def announce(sender, instance, created, **kwargs):
+        before = getattr(instance, '_change_snapshot', {})
+        after = snapshot(instance)
+        changes = {
+            field: value
+            for field, value in after.items()
+            if created or field not in before or before[field] != value
+        }
+        instance._change_snapshot = after
+        if changes:
+            extra = {name: getattr(instance, name) for name in context}
+            change_bus.publish_on_commit(delta(kind, instance.pk, changes, **extra))
+
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=f'track_changes_init_{kind}')
+    post_save.connect(announce, sender=model, weak=False, dispatch_uid=f'track_changes_save_{kind}')
@@ -0,0 +1,145 @@
+# core/fieldsets.py
+"""
+Sparse fieldsets: ?fields=id,status,printer_name on list and detail views.
+
+The requested names narrow the serializer (unrequested fields are never
+rendered) and the SQL: the queryset is cut down with .only() to the
+columns those fields read, joins and prefetches that no requested field
+uses are dropped, and relations the remaining fields traverse are joined.
+
+A field whose source cannot be traced to columns (a model property, a
+SerializerMethodField, source='*') leaves the queryset as it is, so
+narrowing never trades a wide SELECT for per-row queries.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def _lookup_root(lookup):
+    return getattr(lookup, 'prefetch_through', lookup).split('__')[0]
+
+
+def narrow_queryset(queryset, fields, keep=()):
+    """
+    Restrict `queryset` to what the bound serializer `fields` read.
+    `keep` names extra columns to load (e.g. the pagination sort key).
+    """
+    model = queryset.model
+    columns = {model._meta.pk.name, *keep}
+    joins = set()
+    prefetches = set()
+
+    for field in fields:
+        if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            return queryset
+
+        current = model
+        path = []
+        for depth, attr in enumerate(field.source_attrs):
+            if depth == 0 and attr in queryset.query.annotations:
+                break
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                if not path:
+                    # A property or method of the model itself
+                    return queryset
+                # A property of a related object: load that object whole
+                joins.add('__'.join(path))
+                break
+
+            if model_field.many_to_many or model_field.one_to_many or not model_field.concrete:
+                # Reverse or many-to-many relation: fetched by prefetch
+                if path:
+                    joins.add('__'.join(path))
+                prefetches.add('__'.join(path + [attr]))
+                break
+
+            if model_field.is_relation and attr == model_field.attname != model_field.name:
+                # The raw foreign key column (e.g. material_id): no join
+                if path:
+                    joins.add('__'.join(path))
+                else:
+                    columns.add(model_field.name)
+                break
+
+            if model_field.is_relation:
+                path.append(attr)
+                is_last = depth == len(field.source_attrs) - 1
+                if is_last:
+                    if not isinstance(field, (serializers.PrimaryKeyRelatedField, serializers.ManyRelatedField)):
+                        joins.add('__'.join(path))
+                    break
+                current = model_field.related_model
+                continue
+
+            if path:
+                joins.add('__'.join(path))
+            else:
+                columns.add(attr)
+            break
+
+        if path:
+            columns.add(path[0])
+
+    roots = {path.split('__')[0] for path in joins | prefetches}
+    kept_prefetches = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if _lookup_root(lookup) in roots
+    ]
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if joins:
+        queryset = queryset.select_related(*joins)
+    if kept_prefetches:
+        queryset = queryset.prefetch_related(*kept_prefetches)
+    return queryset.only(*columns)
+
+
+class SparseFieldsetMixin:
+    """
+    ViewSet mixin adding ?fields= to list and retrieve.
+    Unknown field names are a 400.
+    """
+    fields_query_param = 'fields'
+    sparse_actions = ('list', 'retrieve')
+
+    def requested_fields(self):
+        if getattr(self, 'action', None) not in self.sparse_actions:
+            return None
+        raw = self.request.query_params.get(self.fields_query_param)
+        if not raw:
+            return None
+        return [name.strip() for name in raw.split(',') if name.strip()]
+
+    def _sparse_fields(self, serializer):
+        """The serializer's bound fields limited to the requested ones"""
+        requested = self.requested_fields()
+        available = serializer.fields
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise ValidationError({self.fields_query_param: f"Unknown field(s): {', '.join(unknown)}"})
+        return [available[name] for name in requested]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.requested_fields():
+            return queryset
+
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        keep = [
+            key.lstrip('-') for key in getattr(self, 'cursor_ordering', ())
+            if key.lstrip('-') != 'pk'
+        ]
+        return narrow_queryset(queryset, self._sparse_fields(serializer), keep=keep)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.requested_fields():
+            target = getattr(serializer, 'child', serializer)
+            wanted = {field.field_name for field in self._sparse_fields(target)}
+            for name in list(target.fields):
+                if name not in wanted:
+                    target.fields.pop(name)
+        return serializer
@@ -0,0 +1,239 @@
+# core/instrumentation.py
+"""
+Per-request SQL and serialization metrics with per-endpoint query budgets.
+
+Every database connection gets an execute wrapper (installed once, when it
+connects) that charges each query to the RequestMetrics of the request in
+progress, found through a context variable. Context variables follow a
+request into sync_to_async threads, so this works under WSGI and ASGI.
+
+RequestMetricsMiddleware reports the numbers on every response:
+
+    X-DB-Queries               queries issued while handling the request
+    X-DB-Time-ms               time spent in those queries
+    X-Serialization-Queries    queries issued after serialization started;
+                               anything above zero on a read is an N+1
+    X-Serialization-Time-ms    from the view's first get_serializer() to
+                               the rendered body (for writes this includes
+                               validation and save)
+    Server-Timing              the same timings for browser dev tools
+
+and keeps per-endpoint totals for GET /api/core/metrics/.
+
+Viewsets using InstrumentedViewMixin declare budgets per action:
+
+    query_budget = {'list': 3, 'retrieve': 4}
+
+A request over its budget is logged and flagged with X-Query-Budget; tests
+fail on it through apps.core.testing.assert_query_budget and the
+check_query_budgets command.
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_started = None
+        self.queries_before_serialization = 0
+        self.serialization_time = 0.0
+        self.total_time = 0.0
+        self.query_budget = None
+
+    @property
+    def serialization_queries(self):
+        if self.serialization_started is None:
+            return 0
+        return self.queries - self.queries_before_serialization
+
+    @property
+    def over_budget(self):
+        return self.query_budget is not None and self.queries > self.query_budget
+
+    def start_serialization(self):
+        if self.serialization_started is None:
+            self.serialization_started = time.perf_counter()
+            self.queries_before_serialization = self.queries
+
+    def finish(self):
+        now = time.perf_counter()
+        self.total_time = now - self.started
+        if self.serialization_started is not None:
+            self.serialization_time = now - self.serialization_started
+
+    def headers(self):
+        headers = {
+            'X-DB-Queries': str(self.queries),
+            'X-DB-Time-ms': f'{self.db_time * 1000:.1f}',
+            'X-Serialization-Queries': str(self.serialization_queries),
+            'X-Serialization-Time-ms': f'{self.serialization_time * 1000:.1f}',
+            'Server-Timing': (
+                f'db;dur={self.db_time * 1000:.1f}, '
+                f'serialize;dur={self.serialization_time * 1000:.1f}, '
+                f'total;dur={self.total_time * 1000:.1f}'
+            ),
+        }
+        if self.query_budget is not None:
+            headers['X-Query-Budget'] = str(self.query_budget)
+        return headers
+
+
+def current_metrics():
+    """RequestMetrics of the request being handled, or None"""
+    return _current_metrics.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def _instrument_connection(sender, connection, **kwargs):
+    # The wrapper list outlives reconnects, so only add it once
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class EndpointStats:
+    """Process-wide totals per (method, URL name)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, key, metrics):
+        with self._lock:
+            stats = self._stats.setdefault(key, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'serialization_queries': 0,
+                'db_time_ms': 0.0,
+                'serialization_time_ms': 0.0,
+                'total_time_ms': 0.0,
+                'max_total_time_ms': 0.0,
+                'query_budget': None,
+                'over_budget': 0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += metrics.queries
+            stats['max_queries'] = max(stats['max_queries'], metrics.queries)
+            stats['serialization_queries'] += metrics.serialization_queries
+            stats['db_time_ms'] += metrics.db_time * 1000
+            stats['serialization_time_ms'] += metrics.serialization_time * 1000
+            stats['total_time_ms'] += metrics.total_time * 1000
+            stats['max_total_time_ms'] = max(stats['max_total_time_ms'], metrics.total_time * 1000)
+            stats['query_budget'] = metrics.query_budget
+            stats['over_budget'] += metrics.over_budget
+
+    def snapshot(self):
+        """Per-endpoint totals plus per-request averages, slowest first"""
+        with self._lock:
+            rows = [dict(stats, endpoint=key) for key, stats in self._stats.items()]
+        for row in rows:
+            count = row['requests']
+            row['avg_queries'] = row['queries'] / count
+            row['avg_db_time_ms'] = row['db_time_ms'] / count
+            row['avg_serialization_time_ms'] = row['serialization_time_ms'] / count
+            row['avg_total_time_ms'] = row['total_time_ms'] / count
+        return sorted(rows, key=lambda row: row['total_time_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+endpoint_stats = EndpointStats()
+
+
+class RequestMetricsMiddleware:
+    """Measures each request; see the module docstring"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self._report(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self._report(request, response, metrics)
+
+    def _report(self, request, response, metrics):
+        metrics.finish()
+        for header, value in metrics.headers().items():
+            response[header] = value
+        # The test client hands back this same object
+        response.request_metrics = metrics
+
+        match = request.resolver_match
+        if match is not None and not response.streaming:
+            endpoint_stats.record(f'{request.method} {match.view_name}', metrics)
+        if metrics.over_budget:
+            logger.warning(
+                "%s %s issued %d queries (budget %d, %d during serialization)",
+                request.method, request.path, metrics.queries,
+                metrics.query_budget, metrics.serialization_queries
+            )
+        return response
+
+
+class InstrumentedViewMixin:
+    """
+    ViewSet mixin: marks where serialization starts and applies the
+    action's entry in `query_budget`.
+    """
+    query_budget = {}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.query_budget = self.query_budget.get(self.action)
+
+    def get_serializer(self, *args, **kwargs):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.start_serialization()
+        return super().get_serializer(*args, **kwargs)
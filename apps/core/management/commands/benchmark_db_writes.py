@@ -0,0 +1,116 @@
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+from apps.core.benchmarking import Stopwatch, rate, scratch_database
+from apps.orders.models import Order
+
+MODES = ('sqlite', 'sqlite-tuned', 'postgresql')
+
+BENCH_ALIAS = 'benchmark_writes'
+
+
+def _write(alias, writer, n):
+    """
+    One floor-style write transaction: read, then insert. Reading first is
+    what turns a deferred SQLite transaction into a lock upgrade, the case
+    that fails with "database is locked" instead of waiting.
+    """
+    with transaction.atomic(using=alias):
+        Order.objects.using(alias).filter(customer_name=f'writer-{writer}').count()
+        Order.objects.using(alias).create(
+            external_id=f'w{writer}-{n}',
+            customer_email='bench@example.com',
+            customer_name=f'writer-{writer}',
+            shipping_address='1 Main St',
+        )
+
+
+def run_writers(alias, writers, writes):
+    """(committed, failed, seconds) for `writers` threads doing `writes` transactions each"""
+    committed = [0] * writers
+    failed = [0] * writers
+    start = threading.Barrier(writers + 1)
+
+    def work(writer):
+        try:
+            start.wait()
+            for n in range(writes):
+                try:
+                    _write(alias, writer, n)
+                    committed[writer] += 1
+                except OperationalError:
+                    failed[writer] += 1
+        finally:
+            connections[alias].close()
+
+    threads = [threading.Thread(target=work, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    with Stopwatch() as run:
+        start.wait()
+        for thread in threads:
+            thread.join()
+    return sum(committed), sum(failed), run.elapsed
+
+
+def _sqlite_settings(path, options):
+    return connections.configure_settings({
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'OPTIONS': options},
+    })['default']
+
+
+def bench_sqlite(options, writers, writes):
+    """Run against a fresh SQLite file opened with `options`"""
+    with tempfile.TemporaryDirectory() as directory:
+        connections.settings[BENCH_ALIAS] = _sqlite_settings(Path(directory) / 'bench.sqlite3', options)
+        try:
+            with connections[BENCH_ALIAS].schema_editor() as editor:
+                editor.create_model(Order)
+            connections[BENCH_ALIAS].close()
+            return run_writers(BENCH_ALIAS, writers, writes)
+        finally:
+            connections[BENCH_ALIAS].close()
+            del connections[BENCH_ALIAS]
+            del connections.settings[BENCH_ALIAS]
+
+
+def bench_postgresql(writers, writes):
+    """Run against a scratch copy of the configured PostgreSQL database"""
+    if connections['default'].vendor != 'postgresql':
+        raise CommandError("The postgresql mode needs DB_ENGINE=postgresql")
+    with scratch_database():
+        return run_writers('default', writers, writes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent write throughput: N threads each committing read-then-insert "
+        "transactions, per database mode (uses scratch databases)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--writes', type=int, default=200, help="Transactions per writer")
+        parser.add_argument(
+            '--modes', nargs='+', choices=MODES, default=['sqlite', 'sqlite-tuned'],
+            help="sqlite: driver defaults; sqlite-tuned: settings.SQLITE_TUNED_OPTIONS; "
+                 "postgresql: the configured database"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"  {'mode':<14} {'writers':>7} {'committed':>9} {'failed':>7} {'writes/s':>10}")
+        for mode in options['modes']:
+            for writers in options['writers']:
+                if mode == 'postgresql':
+                    committed, failed, seconds = bench_postgresql(writers, options['writes'])
+                else:
+                    sqlite_options = settings.SQLITE_TUNED_OPTIONS if mode == 'sqlite-tuned' else {}
+                    committed, failed, seconds = bench_sqlite(sqlite_options, writers, options['writes'])
+                self.stdout.write(
+                    f"  {mode:<14} {writers:>7} {committed:>9} {failed:>7} {rate(committed, seconds):10.0f}"
+                )
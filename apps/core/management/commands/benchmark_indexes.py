@@ -0,0 +1,202 @@
+import random
+import statistics
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from apps.batching.management.commands.benchmark_batch_formation import LAYERS, MACHINE_TYPES, MATERIAL_CODES
+from apps.batching.management.commands.benchmark_batch_formation import seed as seed_reference
+from apps.batching.models import PrintBatch
+from apps.core.benchmarking import Stopwatch, scratch_database
+from apps.fleet.models import Printer
+from apps.orders.models import Order, OrderItem
+from apps.production.models import AsyncOperation, FailedPartRecord, PrintJob
+from apps.qc.models import QCInspection
+from apps.shipping.models import Shipment
+
+BULK_BATCH_SIZE = 2000
+
+# Models whose Meta.indexes are dropped for the "before" run
+INDEXED_MODELS = [Order, PrintBatch, PrintJob, Printer, AsyncOperation, FailedPartRecord, QCInspection, Shipment]
+
+
+def _weighted(rng, weights):
+    """A status drawn from {status: weight}"""
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def seed_history(jobs, printers=50):
+    """
+    A floor that has been running a while: `jobs` print jobs and matching
+    volumes of orders, batches, inspections, shipments, failures and
+    PreForm operations, almost all of them finished. The queue queries
+    look for the small active remainder.
+    """
+    rng = random.Random(0)
+    now = timezone.now()
+    seed_reference(0)
+
+    orders = Order.objects.bulk_create([
+        Order(
+            external_id=f'history-{n}',
+            customer_email='bench@example.com',
+            customer_name='Bench',
+            shipping_address='1 Main St',
+            status=_weighted(rng, {'SHIPPED': 90, 'RECEIVED': 3, 'PROCESSING': 2, 'IN_PRODUCTION': 3, 'PACKING': 2}),
+            priority=_weighted(rng, {'STANDARD': 85, 'RUSH': 10, 'EXPEDITED': 5}),
+            due_date=now + timedelta(hours=rng.randint(-2000, 200)),
+        )
+        for n in range(jobs // 2)
+    ], batch_size=BULK_BATCH_SIZE)
+    items = OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, model_file_url='https://files.example.com/part.stl', model_file_name='part.stl',
+            quantity=2, material_id=rng.choice(MATERIAL_CODES), layer_thickness_mm=rng.choice(LAYERS),
+        )
+        for order in orders
+    ], batch_size=BULK_BATCH_SIZE)
+
+    fleet = Printer.objects.bulk_create([
+        Printer(
+            id=f'BENCH-{n}', name=f'bench-{n}', machine_type_id=rng.choice(MACHINE_TYPES),
+            tank_material_id=rng.choice(MATERIAL_CODES), is_connected=rng.random() < 0.9,
+            status=_weighted(rng, {'IDLE': 40, 'PRINTING': 45, 'OFFLINE': 10, 'MAINTENANCE': 3, 'ERROR': 2}),
+        )
+        for n in range(printers)
+    ])
+
+    batches = PrintBatch.objects.bulk_create([
+        PrintBatch(
+            material_id=rng.choice(MATERIAL_CODES), layer_thickness_mm=rng.choice(LAYERS),
+            machine_type_id=rng.choice(MACHINE_TYPES),
+            status=_weighted(rng, {'CLOSED': 94, 'COLLECTING': 2, 'READY': 2, 'SCHEDULED': 1, 'RUNNING': 1}),
+            must_schedule_by=now + timedelta(hours=rng.randint(-2000, 100)),
+        )
+        for _ in range(jobs // 4)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    print_jobs = PrintJob.objects.bulk_create([
+        PrintJob(
+            batch=rng.choice(batches), printer=rng.choice(fleet), job_name=f'history-{n}',
+            status=_weighted(rng, {'COMPLETED': 93, 'FAILED': 2, 'CANCELLED': 1, 'PENDING': 1, 'READY': 1,
+                                   'QUEUED': 1, 'PRINTING': 1}),
+        )
+        for n in range(jobs)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    QCInspection.objects.bulk_create([
+        QCInspection(print_job=job, status=_weighted(rng, {'COMPLETED': 96, 'PENDING': 3, 'IN_PROGRESS': 1}))
+        for job in print_jobs
+        if job.status == 'COMPLETED'
+    ], batch_size=BULK_BATCH_SIZE)
+    Shipment.objects.bulk_create([
+        Shipment(order=order, status=_weighted(rng, {'DELIVERED': 80, 'SHIPPED': 15, 'PACKING': 3, 'READY': 2}))
+        for order in orders
+        if order.status in ('SHIPPED', 'PACKING')
+    ], batch_size=BULK_BATCH_SIZE)
+    FailedPartRecord.objects.bulk_create([
+        FailedPartRecord(
+            order_item=rng.choice(items), original_job=rng.choice(print_jobs), quantity=1,
+            failure_type='QC_DEFECT', requeued=rng.random() < 0.97,
+        )
+        for _ in range(jobs // 10)
+    ], batch_size=BULK_BATCH_SIZE)
+    AsyncOperation.objects.bulk_create([
+        AsyncOperation(
+            operation_id=uuid.uuid4(), operation_type='AUTO_LAYOUT',
+            status=_weighted(rng, {'SUCCEEDED': 98, 'FAILED': 1, 'IN_PROGRESS': 1}),
+        )
+        for _ in range(jobs)
+    ], batch_size=BULK_BATCH_SIZE)
+
+    # Spread creation times (auto_now_add ignores values passed to bulk_create)
+    # so "oldest first" orderings have work to do
+    for model in (PrintJob, PrintBatch, AsyncOperation):
+        pks = list(model.objects.values_list('pk', flat=True))
+        for hour, start in enumerate(range(0, len(pks), 500)):
+            model.objects.filter(pk__in=pks[start:start + 500]).update(created_at=now - timedelta(hours=hour))
+    return fleet
+
+
+def hot_queries(fleet):
+    """(label, queryset) for the queue queries the indexes are meant for"""
+    busy_printer = fleet[0].pk
+    return [
+        ('open orders by urgency', Order.objects.filter(status='RECEIVED', priority='RUSH').order_by('due_date')),
+        ('READY jobs, oldest first', PrintJob.objects.filter(status='READY').order_by('created_at')),
+        ('one printer\'s queue', PrintJob.objects.filter(printer_id=busy_printer, status__in=['QUEUED', 'PRINTING'])),
+        ('COLLECTING batches', PrintBatch.objects.filter(status='COLLECTING').order_by('created_at')),
+        ('READY batches by deadline', PrintBatch.objects.filter(status='READY').order_by('must_schedule_by')),
+        ('available printers', Printer.objects.filter(is_connected=True).exclude(
+            status__in=['OFFLINE', 'MAINTENANCE', 'ERROR'])),
+        ('in-progress operations', AsyncOperation.objects.filter(status='IN_PROGRESS').order_by('created_at')),
+        ('pending reprints', FailedPartRecord.objects.filter(requeued=False).order_by('created_at')),
+        ('QC queue', QCInspection.objects.filter(status='PENDING')),
+        ('packing shipments', Shipment.objects.filter(status='PACKING')),
+    ]
+
+
+def _set_indexes(enabled):
+    with connection.schema_editor() as editor:
+        for model in INDEXED_MODELS:
+            for index in model._meta.indexes:
+                if enabled:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        # Refresh planner statistics (SQLite and PostgreSQL both accept this)
+        cursor.execute('ANALYZE')
+
+
+def _measure(queries, repeat):
+    """{label: (median seconds, EXPLAIN text)}"""
+    results = {}
+    for label, queryset in queries:
+        # Only primary keys, so the timing is the database's, not model building
+        keys = queryset.values_list('pk', flat=True)[:100]
+        timings = []
+        for _ in range(repeat):
+            with Stopwatch() as run:
+                list(keys.all())  # a fresh clone each run, not the result cache
+            timings.append(run.elapsed)
+        results[label] = (statistics.median(timings), queryset[:100].explain())
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a long-running floor and time the hot queue queries with and without "
+        "the Meta.indexes, printing EXPLAIN plans (uses a scratch DB)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=50_000, help="Print jobs to seed; other tables scale with it")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query; the median is reported")
+        parser.add_argument('--plans', action='store_true', help="Print the EXPLAIN plans")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            with Stopwatch() as seeding:
+                fleet = seed_history(options['jobs'])
+            self.stdout.write(f"seeded {options['jobs']} jobs and history in {seeding.elapsed:.1f}s ({connection.vendor})")
+
+            queries = hot_queries(fleet)
+            _set_indexes(False)
+            before = _measure(queries, options['repeat'])
+            _set_indexes(True)
+            after = _measure(queries, options['repeat'])
+
+        self.stdout.write(f"  {'query':<28} {'before':>10} {'after':>10} {'speedup':>8}")
+        for label, _ in queries:
+            old, new = before[label][0], after[label][0]
+            speedup = old / new if new > 0 else float('inf')
+            self.stdout.write(f"  {label:<28} {old * 1000:8.2f}ms {new * 1000:8.2f}ms {speedup:7.1f}x")
+            if options['plans']:
+                for title, plan in (('before', before[label][1]), ('after', after[label][1])):
+                    self.stdout.write(f"    {title}:")
+                    for line in plan.splitlines():
+                        self.stdout.write(f"      {line}")
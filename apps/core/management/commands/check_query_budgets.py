@@ -0,0 +1,150 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from rest_framework.test import APIClient
+
+from apps.batching.engine import form_batches
+from apps.batching.management.commands.benchmark_batch_formation import seed
+from apps.batching.models import BatchItem, PrintBatch
+from apps.core.benchmarking import scratch_database
+from apps.core.models import Material
+from apps.core.reference import reference_data
+from apps.employees.models import Employee, Permission, Role
+from apps.fleet.models import CartridgeData, Printer
+from apps.orders.models import Order
+from apps.production.models import PrintJob, PrintJobItem
+from apps.qc.models import QCInspection, QCItemResult
+from apps.shipping.models import Shipment, ShipmentItem
+
+
+def seed_floor(rows):
+    """`rows` orders, batches, jobs, printers, inspections, shipments and employees, all linked"""
+    seed(rows * 10)
+    form_batches()
+
+    permissions = Permission.objects.bulk_create([
+        Permission(codename=codename, description=codename) for codename in ('can_print', 'can_qc', 'can_ship')
+    ])
+    role = Role.objects.create(name='operator')
+    role.permissions.set(permissions[:2])
+    users = User.objects.bulk_create([User(username=f'operator-{n}') for n in range(rows)])
+    employees = Employee.objects.bulk_create([
+        Employee(user=user, employee_id=f'E{n}', shift=1) for n, user in enumerate(users)
+    ])
+    for employee in employees:
+        employee.roles.add(role)
+        employee.extra_permissions.add(permissions[2])
+
+    materials = list(Material.objects.values_list('code', flat=True))
+    batches = list(PrintBatch.objects.all()[:rows])
+    printers = Printer.objects.bulk_create([
+        Printer(id=f'SN-{n}', name=f'printer-{n}', machine_type_id=batch.machine_type_id,
+                tank_material_id=batch.material_id)
+        for n, batch in enumerate(batches)
+    ])
+    CartridgeData.objects.bulk_create([
+        CartridgeData(printer=printer, slot=slot, material_id=materials[0],
+                      volume_dispensed_ml=100, original_volume_ml=1000)
+        for printer in printers
+        for slot in ('A', 'B')
+    ])
+
+    jobs = PrintJob.objects.bulk_create([
+        PrintJob(batch=batch, printer=printer, job_name=f'job-{n}', assigned_to=employees[n % len(employees)])
+        for n, (batch, printer) in enumerate(zip(batches, printers))
+    ])
+    job_items = PrintJobItem.objects.bulk_create([
+        PrintJobItem(job=job, batch_item=batch_item, quantity=batch_item.quantity)
+        for job in jobs
+        for batch_item in BatchItem.objects.filter(batch_id=job.batch_id)
+    ])
+    inspections = QCInspection.objects.bulk_create([
+        QCInspection(print_job=job, inspected_by=employees[n % len(employees)])
+        for n, job in enumerate(jobs)
+    ])
+    inspection_by_job = {inspection.print_job_id: inspection for inspection in inspections}
+    QCItemResult.objects.bulk_create([
+        QCItemResult(inspection=inspection_by_job[item.job_id], print_job_item=item, quantity_passed=item.quantity)
+        for item in job_items
+    ])
+
+    orders = list(Order.objects.prefetch_related('items')[:rows])
+    shipments = Shipment.objects.bulk_create([
+        Shipment(order=order, packed_by=employees[n % len(employees)]) for n, order in enumerate(orders)
+    ])
+    ShipmentItem.objects.bulk_create([
+        ShipmentItem(shipment=shipment, order_item=item, quantity=item.quantity)
+        for shipment, order in zip(shipments, orders)
+        for item in order.items.all()
+    ])
+
+
+def budgeted_endpoints(patterns=None):
+    """(url name, viewset class, action) for every routed action with a query budget"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    seen = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from budgeted_endpoints(pattern.url_patterns)
+            continue
+        if not isinstance(pattern, URLPattern) or pattern.name in seen:
+            continue
+        callback = pattern.callback
+        viewset = getattr(callback, 'cls', None)
+        action = (getattr(callback, 'actions', None) or {}).get('get')
+        if viewset is None or action not in getattr(viewset, 'query_budget', {}):
+            continue
+        seen.add(pattern.name)
+        yield pattern.name, viewset, action
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every list/detail endpoint that declares a query_budget against seeded "
+        "data (uses a scratch DB) and fail if any goes over"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20, help="Rows per model to seed")
+
+    def handle(self, *args, **options):
+        # The test client's 'testserver' host must be allowed, as under the test runner
+        setup_test_environment()
+        try:
+            failures = self.check_endpoints(options['rows'])
+        finally:
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError(f"{len(failures)} endpoint(s) failed or exceeded their query budget")
+
+    def check_endpoints(self, rows):
+        with scratch_database():
+            seed_floor(rows)
+            # As at server startup, so no endpoint is charged for loading it
+            reference_data.warm()
+
+            client = APIClient()
+            client.force_authenticate(User.objects.create_superuser('budget-check', password=None))
+
+            failures = []
+            for name, viewset, action in budgeted_endpoints():
+                if action == 'retrieve':
+                    instance = viewset.queryset.model.objects.first()
+                    path = reverse(name, kwargs={viewset.lookup_field: instance.pk})
+                else:
+                    path = reverse(name)
+
+                response = client.get(path)
+                metrics = response.request_metrics
+                over = response.status_code != 200 or metrics.over_budget
+                self.stdout.write(
+                    f"{'FAIL' if over else 'ok  '} {path:<60} {response.status_code} "
+                    f"{metrics.queries:>3} / {metrics.query_budget} queries "
+                    f"({metrics.serialization_queries} serializing) {metrics.total_time * 1000:7.1f} ms"
+                )
+                if over:
+                    failures.append(path)
+        return failures
@@ -13,7 +13,7 @@ class PrintSetting(models.Model):
     machine_type = models.CharField(max_length=20)
     material = models.ForeignKey(Material, on_delete=models.CASCADE)
     print_setting_name = models.CharField(max_length=50, default='DEFAULT')
-    layer_thickness_mm = models.CharField(max_length=20)
+    layer_thickness_mm = models.DecimalField(max_digits=5, decimal_places=3)
     
     class Meta:
         unique_together = ['machine_type', 'material', 'layer_thickness_mm']
@@ -0,0 +1,28 @@
+# core/pagination.py
+"""
+Keyset (cursor) pagination for every list endpoint.
+
+Pages are fetched with WHERE sort_key < last_seen ORDER BY sort_key LIMIT n,
+so page 10,000 costs the same as page 1 as long as the sort key is
+indexed. Views name their ordering in `cursor_ordering`, most recent
+first, ending with the primary key; views without one page by primary
+key.
+
+The cursor (DRF's CursorPagination) holds only the first field's value
+on the last row returned, plus how many rows sharing that value were
+already returned. The later fields only make the order within a tie
+stable, so paging across equal sort keys neither skips nor repeats a
+row, but a long run of equal keys is stepped through with OFFSET.
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-pk',)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
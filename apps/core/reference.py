@@ -0,0 +1,180 @@
+# core/reference.py
+"""
+Process-local cache of reference data: Material, MachineType, PrintSetting.
+
+These tables change a few times a year but are read by nearly every
+request, so each process keeps a snapshot of all three together with
+their pre-serialized representations (the dicts MaterialSerializer etc.
+produce). Serializers nest materials and machine types through
+ReferenceField, which copies in the cached fragment instead of joining,
+order ingest checks material codes against the snapshot, and the
+snapshot's CompatibilityIndex (see compatibility.py) answers which
+machine types can print a material at a given layer thickness.
+
+Saving or deleting any row bumps a SharedVersion (see signals.py); each
+process reloads its snapshot (three queries) the next time it reads after
+noticing the new version, within VERSION_CHECK_S. Writes that bypass
+signals (bulk_create, update()) must call reference_data.invalidate().
+A lookup that misses also reloads, at most once per VERSION_CHECK_S, so
+a row added that way is still found.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError
+
+from .compatibility import CompatibilityIndex
+from .models import MachineType, Material, PrintSetting
+from .versioning import SharedVersion
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'core:reference:version'
+
+VERSION_CHECK_S = 1.0
+
+KINDS = ('material', 'machine_type', 'print_setting')
+
+
+class ReferenceSnapshot:
+    """Everything loaded for one version; never mutated after load"""
+
+    def __init__(self, version, materials, machine_types, print_settings, fragments):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.materials = materials  # code -> Material
+        self.machine_types = machine_types  # code -> MachineType
+        self.print_settings = print_settings  # id -> PrintSetting (material attached)
+        self.fragments = fragments  # kind -> {key: serialized dict}
+        self.compatibility = CompatibilityIndex(print_settings.values(), machine_types.keys())
+        # Content hashes, so ETags stay right even if the counter is reset
+        self.digests = {
+            kind: hashlib.sha256(
+                json.dumps(fragments[kind], cls=DjangoJSONEncoder, sort_keys=True).encode()
+            ).hexdigest()[:32]
+            for kind in KINDS
+        }
+
+    def rows(self, kind):
+        return {
+            'material': self.materials,
+            'machine_type': self.machine_types,
+            'print_setting': self.print_settings,
+        }[kind]
+
+
+class ReferenceCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held for a whole rebuild: threads that find the same snapshot out
+        # of date wait for one load instead of each running their own
+        self._load_lock = threading.Lock()
+        self._snapshot = None
+        self._version = SharedVersion(VERSION_KEY, VERSION_CHECK_S)
+
+    def _load(self, version, stale=None):
+        """Rebuild the snapshot for `version` unless another thread replaced `stale` with it meanwhile"""
+        with self._load_lock:
+            current = self._snapshot
+            if current is not None and current is not stale and current.version == version:
+                return current
+            return self._build(version)
+
+    def _build(self, version):
+        # Imported here: core.serializers imports this module
+        from .serializers import MachineTypeSerializer, MaterialSerializer, PrintSettingSerializer
+
+        materials = {material.code: material for material in Material.objects.all()}
+        machine_types = {machine_type.code: machine_type for machine_type in MachineType.objects.all()}
+        print_settings = {}
+        for setting in PrintSetting.objects.all():
+            setting.material = materials[setting.material_id]
+            print_settings[setting.id] = setting
+
+        # Setting fragments nest material fragments; the serializers find
+        # the ones built so far through the context
+        fragments = {}
+        context = {'reference_fragments': fragments}
+        fragments['material'] = {
+            code: dict(MaterialSerializer(row, context=context).data) for code, row in materials.items()
+        }
+        fragments['machine_type'] = {
+            code: dict(MachineTypeSerializer(row, context=context).data) for code, row in machine_types.items()
+        }
+        fragments['print_setting'] = {
+            setting_id: dict(PrintSettingSerializer(row, context=context).data)
+            for setting_id, row in print_settings.items()
+        }
+
+        snapshot = ReferenceSnapshot(version, materials, machine_types, print_settings, fragments)
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        """The current snapshot, reloaded if another process changed the data"""
+        version = self._version.get()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = self._load(version, stale=snapshot)
+        return snapshot
+
+    def _refresh_for_miss(self, snapshot):
+        """Reload once per VERSION_CHECK_S when a key is not found"""
+        if time.monotonic() - snapshot.loaded_at < VERSION_CHECK_S:
+            return snapshot
+        return self._load(snapshot.version, stale=snapshot)
+
+    def get(self, kind, key):
+        """The cached row, or None if there is none"""
+        snapshot = self.snapshot()
+        row = snapshot.rows(kind).get(key)
+        if row is None:
+            row = self._refresh_for_miss(snapshot).rows(kind).get(key)
+        return row
+
+    def fragment(self, kind, key):
+        """The row's serialized representation, or None if there is none"""
+        snapshot = self.snapshot()
+        fragment = snapshot.fragments[kind].get(key)
+        if fragment is None:
+            fragment = self._refresh_for_miss(snapshot).fragments[kind].get(key)
+        return fragment
+
+    def missing(self, kind, keys):
+        """The subset of `keys` with no row"""
+        snapshot = self.snapshot()
+        missing = set(keys) - snapshot.rows(kind).keys()
+        if missing:
+            missing -= self._refresh_for_miss(snapshot).rows(kind).keys()
+        return missing
+
+    def compatibility(self):
+        """The CompatibilityIndex for the current print settings"""
+        return self.snapshot().compatibility
+
+    def etag(self, kind):
+        return self.snapshot().digests[kind]
+
+    def invalidate(self):
+        """Make every process reload before its next read"""
+        self._version.bump()
+        with self._lock:
+            self._snapshot = None
+
+    def warm(self):
+        """Load now (at startup) so the first request doesn't pay for it"""
+        try:
+            self.snapshot()
+        except DatabaseError:
+            # e.g. tables not migrated yet; the first read will load instead
+            logger.warning("Reference data not preloaded", exc_info=True)
+
+
+reference_data = ReferenceCache()
@@ -2,6 +2,29 @@
 
 from rest_framework import serializers
 from .models import Material, PrintSetting, MachineType
+from .reference import reference_data
+
+
+class ReferenceField(serializers.Field):
+    """
+    Read-only nested Material / MachineType, copied from the reference
+    cache (core.reference) instead of joined or prefetched.
+
+    Point `source` at the foreign key column, e.g.
+    ReferenceField('material', source='material_id').
+    """
+
+    def __init__(self, kind, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.kind = kind
+
+    def to_representation(self, value):
+        # While the cache itself is loading it passes its fragments in
+        loading = self.context.get('reference_fragments')
+        if loading is not None:
+            return loading[self.kind].get(value)
+        return reference_data.fragment(self.kind, value)
 
 
 class MaterialSerializer(serializers.ModelSerializer):
@@ -17,8 +40,8 @@ class MachineTypeSerializer(serializers.ModelSerializer):
 
 
 class PrintSettingSerializer(serializers.ModelSerializer):
-    material = MaterialSerializer(read_only=True)
-    
+    material = ReferenceField('material', source='material_id')
+
     class Meta:
         model = PrintSetting
-        fields = ['id', 'machine_type', 'material', 'print_setting_name', 'layer_thickness_mm']
\ No newline at end of file
+        fields = ['id', 'machine_type', 'material', 'print_setting_name', 'layer_thickness_mm']
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import MachineType, Material, PrintSetting
+from .reference import reference_data
+
+
+def _invalidate():
+    # Now, so this request sees the change, and again after commit, so no
+    # process reloads the old rows in between
+    reference_data.invalidate()
+    transaction.on_commit(reference_data.invalidate)
+
+
+@receiver(post_save, sender=Material)
+@receiver(post_save, sender=MachineType)
+@receiver(post_save, sender=PrintSetting)
+@receiver(post_delete, sender=Material)
+@receiver(post_delete, sender=MachineType)
+@receiver(post_delete, sender=PrintSetting)
+def reference_row_changed(sender, **kwargs):
+    _invalidate()
@@ -0,0 +1,83 @@
+# core/testing.py
+"""
+Test helpers.
+
+    response = assert_query_budget(client, 'get', '/api/orders/order/')
+
+fails when the request issues more queries than its viewset declares for
+the action (or than an explicit `budget`), listing the SQL it ran (see
+core.instrumentation).
+
+reference_fixture() and make_order() build the rows most tests start
+from: materials, machine types and print settings, then orders.
+"""
+
+from decimal import Decimal
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from .models import MachineType, Material, PrintSetting
+from .reference import reference_data
+
+
+def reference_fixture(materials=('FLGPGR05',), machine_types=('FORM-4-0',), layers=('0.1',)):
+    """Materials, machine types and a print setting for every combination; resets the reference cache"""
+    Material.objects.bulk_create([Material(code=code, label=code, material_type='SLA') for code in materials])
+    MachineType.objects.bulk_create([
+        MachineType(code=code, label=code, build_volume_x=200, build_volume_y=125, build_volume_z=210,
+                    printer_family='SLA')
+        for code in machine_types
+    ])
+    PrintSetting.objects.bulk_create([
+        PrintSetting(machine_type=machine_type, material_id=material, layer_thickness_mm=Decimal(layer))
+        for machine_type in machine_types
+        for material in materials
+        for layer in layers
+    ])
+    # bulk_create sends no signals, and a previous test's snapshot may be cached
+    reference_data.invalidate()
+
+
+def make_order(external_id='order-1', items=((1, 'FLGPGR05', '0.1'),), **fields):
+    """An Order with one OrderItem per (quantity, material, layer) in `items`"""
+    # Imported here: orders imports core
+    from apps.orders.models import Order, OrderItem
+
+    order = Order.objects.create(
+        external_id=external_id,
+        customer_email='customer@example.com',
+        customer_name='Customer',
+        shipping_address='1 Main St',
+        **fields
+    )
+    for n, (quantity, material, layer) in enumerate(items):
+        OrderItem.objects.create(
+            order=order,
+            model_file_url=f'https://files.example.com/{external_id}-{n}.stl',
+            model_file_name=f'part-{n}.stl',
+            quantity=quantity,
+            material_id=material,
+            layer_thickness_mm=Decimal(layer),
+        )
+    return order
+
+
+def assert_query_budget(client, method, path, budget=None, **kwargs):
+    """Make the request and fail if it exceeds its query budget; returns the response"""
+    with CaptureQueriesContext(connections['default']) as captured:
+        response = getattr(client, method.lower())(path, **kwargs)
+
+    metrics = response.request_metrics
+    budget = metrics.query_budget if budget is None else budget
+    if budget is None:
+        raise AssertionError(f"{method.upper()} {path} has no declared query budget")
+    if metrics.queries > budget:
+        statements = '\n'.join(
+            f'{number}. {query["sql"]}' for number, query in enumerate(captured.captured_queries, 1)
+        )
+        raise AssertionError(
+            f"{method.upper()} {path} issued {metrics.queries} queries, budget is {budget} "
+            f"({metrics.serialization_queries} during serialization):\n{statements}"
+        )
+    return response
@@ -1,3 +1,436 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import importlib.util
+import os
+import threading
+import time
+import unittest
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.fleet.models import Printer
+from formnow import settings as project_settings
+from .compatibility import normalize_layer
+from .events import EVENT_KEY_PREFIX, ChangeBus, delta
+from .exports import accepts_gzip
+from .management.commands.benchmark_indexes import INDEXED_MODELS, hot_queries
+from .management.commands.check_query_budgets import budgeted_endpoints, seed_floor
+from .models import PrintSetting
+from .reference import ReferenceCache, ReferenceSnapshot, reference_data
+from .testing import assert_query_budget, make_order, reference_fixture
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        reference_data.invalidate()
+        seed_floor(3)
+
+    def setUp(self):
+        # As at server startup, so no endpoint is charged for loading it
+        reference_data.warm()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('budget-check', password=None))
+
+    def test_every_budgeted_endpoint_stays_within_budget(self):
+        endpoints = list(budgeted_endpoints())
+        self.assertTrue(endpoints)
+        for name, viewset, action in endpoints:
+            if action == 'retrieve':
+                path = reverse(name, kwargs={viewset.lookup_field: viewset.queryset.model.objects.first().pk})
+            else:
+                path = reverse(name)
+            with self.subTest(path=path):
+                response = assert_query_budget(self.client, 'get', path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_explicit_budget_overrides_the_declared_one(self):
+        with self.assertRaisesMessage(AssertionError, 'budget is 0'):
+            assert_query_budget(self.client, 'get', reverse('order-list'), budget=0)
+
+
+class ChangeBusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.web = ChangeBus(relay=False)
+        self.worker = ChangeBus(relay=False)
+
+    async def test_deltas_from_another_process_are_relayed(self):
+        subscription = self.web.subscribe(kinds={'print_job'})
+        self.worker.publish(delta('print_job', 1, {'status': 'QUEUED'}))
+        self.worker.publish(delta('printer', 'SN-1', {'status': 'IDLE'}))
+
+        self.assertEqual(self.web.relay_once(), 2)
+        events = await subscription.get(timeout=1)
+
+        self.assertEqual([(event['type'], event['changes']) for event in events], [('print_job', {'status': 'QUEUED'})])
+        subscription.close()
+
+    async def test_own_deltas_are_not_delivered_twice(self):
+        subscription = self.web.subscribe()
+        self.web.publish(delta('print_job', 1, {'status': 'QUEUED'}))
+        self.web.publish(delta('print_job', 2, {'status': 'QUEUED'}))
+
+        self.assertEqual(self.web.relay_once(), 0)
+        self.assertEqual(len(await subscription.get(timeout=1)), 2)
+        subscription.close()
+
+    async def test_only_deltas_after_subscribing_are_relayed(self):
+        self.worker.publish(delta('print_job', 1, {'status': 'QUEUED'}))
+        subscription = self.web.subscribe()
+
+        self.assertEqual(self.web.relay_once(), 0)
+        self.assertEqual(await subscription.get(timeout=0.01), [])
+        subscription.close()
+
+    async def test_missed_delta_turns_into_a_resync(self):
+        subscription = self.web.subscribe()
+        self.worker.publish(delta('print_job', 1, {'status': 'QUEUED'}))
+        self.worker.publish(delta('print_job', 2, {'status': 'QUEUED'}))
+        cache.delete(f'{EVENT_KEY_PREFIX}1')
+
+        self.web.relay_once()
+        events = await subscription.get(timeout=1)
+
+        self.assertEqual([event['type'] for event in events], ['resync', 'print_job'])
+        self.assertEqual(events[1]['id'], 2)
+        subscription.close()
+
+
+class EventStreamTests(TestCase):
+    async def test_anonymous_clients_are_refused(self):
+        response = await self.async_client.get('/api/core/events/')
+
+        self.assertIn(response.status_code, (401, 403))
+
+    async def test_authenticated_client_gets_the_stream(self):
+        user = await User.objects.acreate(username='dashboard')
+        await self.async_client.aforce_login(user)
+
+        response = await self.async_client.get('/api/core/events/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        await stream.aclose()
+
+
+class ReferenceETagTests(TestCase):
+    def setUp(self):
+        reference_fixture(materials=('FLGPGR05', 'FLGPCL05'))
+        reference_data.warm()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def etag_for(self, path):
+        return f'"{reference_data.etag("material")}-{hashlib.sha256(path.encode()).hexdigest()[:16]}"'
+
+    def test_unchanged_list_revalidates_without_queries(self):
+        first = self.client.get('/api/core/materials/')
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/core/materials/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_changed_data_gets_a_new_tag(self):
+        first = self.client.get('/api/core/materials/FLGPGR05/')
+        reference_fixture(materials=('FLTO2001',), machine_types=())
+        reference_data.warm()
+
+        again = self.client.get('/api/core/materials/FLGPGR05/', headers={'If-None-Match': first['ETag']})
+
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again['ETag'], first['ETag'])
+
+    def test_existing_row_revalidates_without_queries(self):
+        path = '/api/core/materials/FLGPGR05/'
+        with self.assertNumQueries(0):
+            response = self.client.get(path, headers={'If-None-Match': self.etag_for(path)})
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_row_is_404_whatever_the_tag(self):
+        path = '/api/core/materials/NOPE/'
+        response = self.client.get(path, headers={'If-None-Match': self.etag_for(path)})
+        self.assertEqual(response.status_code, 404)
+
+        path = '/api/core/print-settings/not-a-number/'
+        self.assertEqual(self.client.get(path).status_code, 404)
+
+
+class ReferenceLoadTests(TestCase):
+    def test_concurrent_readers_share_one_rebuild(self):
+        references = ReferenceCache()
+        builds = []
+
+        def build(version):
+            builds.append(version)
+            time.sleep(0.05)
+            return ReferenceSnapshot(version, {}, {}, {}, {'material': {}, 'machine_type': {}, 'print_setting': {}})
+
+        def set_snapshot(version):
+            snapshot = build(version)
+            with references._lock:
+                references._snapshot = snapshot
+            return snapshot
+
+        with mock.patch.object(references, '_build', side_effect=set_snapshot):
+            readers = [threading.Thread(target=references.snapshot) for _ in range(8)]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+
+        self.assertEqual(len(builds), 1)
+
+
+class CompatibilityTests(TestCase):
+    def setUp(self):
+        reference_fixture(materials=('FLGPGR05', 'FLTO2001'), machine_types=('FORM-4-0', 'FORM-3-0'), layers=('0.1',))
+        PrintSetting.objects.create(machine_type='FORM-4-0', material_id='FLGPGR05', layer_thickness_mm=Decimal('0.05'))
+        # Not a known machine type, so not part of the index
+        PrintSetting.objects.create(machine_type='FORM-9-0', material_id='FLTO2001', layer_thickness_mm=Decimal('0.05'))
+
+    def test_normalize_layer(self):
+        for value in ['0.1', ' 0.100 mm', '0.1MM', 0.1, Decimal('0.1000')]:
+            with self.subTest(value=value):
+                self.assertEqual(normalize_layer(value), Decimal('0.100'))
+        for value in ['', 'thin', '0', '-0.1', 'nan', None]:
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                normalize_layer(value)
+
+    def test_lookups(self):
+        index = reference_data.compatibility()
+
+        self.assertEqual(index.machine_types_for('FLGPGR05', '0.1'), ('FORM-3-0', 'FORM-4-0'))
+        self.assertEqual(index.machine_types_for('FLGPGR05', '0.050 mm'), ('FORM-4-0',))
+        self.assertEqual(index.machine_types_for('FLTO2001', '0.05'), ())
+        self.assertTrue(index.is_valid('FORM-3-0', 'FLTO2001', Decimal('0.1')))
+        self.assertIsNone(index.setting('FORM-9-0', 'FLTO2001', '0.05'))
+        self.assertEqual(index.materials_for_machine_type('FORM-3-0'), {'FLGPGR05', 'FLTO2001'})
+        self.assertEqual(index.machine_types_for_material('FLTO2001'), {'FORM-3-0', 'FORM-4-0'})
+
+    def test_index_follows_setting_changes(self):
+        self.assertTrue(reference_data.compatibility().is_valid('FORM-4-0', 'FLGPGR05', '0.05'))
+
+        PrintSetting.objects.get(machine_type='FORM-4-0', layer_thickness_mm=Decimal('0.05')).delete()
+
+        self.assertFalse(reference_data.compatibility().is_valid('FORM-4-0', 'FLGPGR05', '0.05'))
+        self.assertEqual(reference_data.compatibility().machine_types_for('FLGPGR05', '0.05'), ())
+
+
+class LayerMigrationTests(TransactionTestCase):
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_spellings_of_one_setting_are_merged(self):
+        leaves = MigrationExecutor(connection).loader.graph.leaf_nodes()
+        self.addCleanup(self.migrate, leaves)
+        old = self.migrate([('core', '0001_initial')])
+        Material = old.get_model('core', 'Material')
+        PrintSetting = old.get_model('core', 'PrintSetting')
+        material = Material.objects.create(code='FLGPGR05', label='Grey', material_type='SLA')
+        for machine_type, layer in [
+            ('FORM-4-0', '0.1'), ('FORM-4-0', '.1'), ('FORM-4-0', ' 0.100mm'),
+            ('FORM-4-0', '0.05'), ('FORM-3-0', '0.10'),
+        ]:
+            PrintSetting.objects.create(machine_type=machine_type, material=material, layer_thickness_mm=layer)
+
+        new = self.migrate(leaves)
+
+        self.assertEqual(
+            sorted(new.get_model('core', 'PrintSetting').objects.values_list('machine_type', 'layer_thickness_mm')),
+            [('FORM-3-0', Decimal('0.100')), ('FORM-4-0', Decimal('0.050')), ('FORM-4-0', Decimal('0.100'))],
+        )
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def database(self, **env):
+        """DATABASES['default'] from a fresh run of formnow/settings.py with only `env` set among DB_* and SQLITE_*"""
+        environ = {name: value for name, value in os.environ.items() if not name.startswith(('DB_', 'SQLITE_'))}
+        spec = importlib.util.spec_from_file_location('formnow_settings_under_test', project_settings.__file__)
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(os.environ, {**environ, **env}, clear=True):
+            spec.loader.exec_module(module)
+        return module.DATABASES['default']
+
+    def test_sqlite_is_untuned_by_default(self):
+        database = self.database()
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(database['OPTIONS'], {})
+        self.assertEqual(database.get('CONN_MAX_AGE', 0), 0)
+
+    def test_tuned_sqlite_uses_wal_and_immediate_transactions(self):
+        database = self.database(SQLITE_TUNED='1', SQLITE_BUSY_TIMEOUT_S='5', SQLITE_PATH='/tmp/formnow.sqlite3')
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(database['NAME'], '/tmp/formnow.sqlite3')
+        self.assertIn('PRAGMA journal_mode=WAL;', database['OPTIONS']['init_command'])
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(database['OPTIONS']['timeout'], 5.0)
+        self.assertNotIn('pool', database['OPTIONS'])
+
+    def test_postgresql_without_a_pool_keeps_connections(self):
+        database = self.database(DB_ENGINE='postgresql', DB_CONN_MAX_AGE='120')
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['OPTIONS'], {})
+        self.assertEqual(database['CONN_MAX_AGE'], 120)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+
+    def test_postgresql_pool_replaces_persistent_connections(self):
+        database = self.database(DB_ENGINE='postgresql', DB_POOL_MAX_SIZE='16', DB_CONN_MAX_AGE='120')
+
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['OPTIONS'], {'pool': {'min_size': 2, 'max_size': 16, 'timeout': 10.0}})
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertFalse(database['CONN_HEALTH_CHECKS'])
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.database(DB_ENGINE='mysql')
+
+
+class HotQueryIndexTests(TestCase):
+    # Queries whose plan SQLite settles without table statistics. "READY jobs"
+    # and "COLLECTING batches" only pick their partial indexes once ANALYZE
+    # has seen a realistic status mix, as in benchmark_indexes.
+    EXPECTED_PLANS = {
+        'open orders by urgency': 'order_queue_idx',
+        "one printer's queue": 'printjob_printer_status_idx',
+        'READY batches by deadline': 'batch_status_deadline_idx',
+        'available printers': 'printer_availability_idx',
+        'in-progress operations': 'asyncop_in_progress_idx',
+        'pending reprints': 'failedpart_pending_idx',
+        'QC queue': 'qcinspection_status_idx',
+        'packing shipments': 'shipment_status_idx',
+    }
+
+    def test_migrations_create_every_hot_query_index(self):
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index in model._meta.indexes:
+                    with self.subTest(index=index.name):
+                        self.assertIn(index.name, existing)
+                        self.assertTrue(existing[index.name]['index'])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "Plans on empty tables are planner specific")
+    def test_hot_queries_use_their_index(self):
+        plans = {label: queryset.explain() for label, queryset in hot_queries([Printer(pk='BENCH-0')])}
+        for label, index in self.EXPECTED_PLANS.items():
+            with self.subTest(query=label):
+                self.assertIn(f'USING INDEX {index}', plans[label])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def test_paging_across_equal_sort_keys(self):
+        from apps.orders.models import Order
+
+        orders = [make_order(f'order-{n}') for n in range(7)]
+        Order.objects.update(received_at=timezone.now())
+
+        seen = []
+        path = '/api/orders/order/?page_size=2'
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            path = response.data['next']
+
+        self.assertEqual(seen, sorted((str(order.pk) for order in orders), reverse=True))
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.order = make_order()
+        # As at server startup, so only the view's own queries are counted
+        reference_data.warm()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def select(self, path, queries):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), queries, [query['sql'] for query in captured])
+        return response, captured[0]['sql']
+
+    def test_fields_narrow_the_select_and_drop_prefetches(self):
+        response, sql = self.select(f'/api/orders/order/{self.order.pk}/', queries=2)
+        self.assertIn('customer_email', sql)
+
+        response, sql = self.select(f'/api/orders/order/{self.order.pk}/?fields=id,status', queries=1)
+
+        self.assertEqual(set(response.data), {'id', 'status'})
+        self.assertNotIn('customer_email', sql)
+        self.assertNotIn('shipping_address', sql)
+
+    def test_list_keeps_the_sort_key(self):
+        response, sql = self.select('/api/orders/order/?fields=external_id', queries=1)
+
+        self.assertEqual(response.data['results'], [{'external_id': 'order-1'}])
+        self.assertIn('received_at', sql)
+        self.assertNotIn('customer_name', sql)
+
+    def test_unknown_field_is_a_400(self):
+        response = self.client.get('/api/orders/order/?fields=id,nope')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', str(response.data['fields']))
+
+
+class ExportEncodingTests(TestCase):
+    def test_accept_encoding_qvalues(self):
+        for header, expected in [
+            ('gzip', True),
+            ('gzip, deflate, br', True),
+            ('GZIP;q=0.5', True),
+            ('*', True),
+            ('', False),
+            ('identity', False),
+            ('gzip;q=0', False),
+            ('gzip; q=0.000, deflate', False),
+            ('*;q=0', False),
+            ('gzip;q=0, *', False),
+            ('br, x-gzip', True),
+            ('notgzip', False),
+        ]:
+            with self.subTest(header=header):
+                self.assertIs(accepts_gzip(header), expected)
+
+    def test_export_is_gzipped_only_when_accepted(self):
+        reference_fixture()
+        make_order()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('exporter', password=None))
+        path = reverse('order-export')
+
+        refused = client.get(path, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', refused)
+        self.assertIn(b'order-1', b''.join(refused.streaming_content))
+
+        accepted = client.get(path, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(accepted['Content-Encoding'], 'gzip')
+        self.assertIn(b'order-1', gzip.decompress(b''.join(accepted.streaming_content)))
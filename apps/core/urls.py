@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MaterialViewSet, MachineTypeViewSet, PrintSettingViewSet
+from .views import MaterialViewSet, MachineTypeViewSet, PrintSettingViewSet, event_stream, request_metrics
 
 router = DefaultRouter()
 router.register(r'materials', MaterialViewSet)
@@ -8,5 +8,7 @@ router.register(r'machine-types', MachineTypeViewSet)
 router.register(r'print-settings', PrintSettingViewSet)
 
 urlpatterns = [
+    path('events/', event_stream, name='event-stream'),
+    path('metrics/', request_metrics, name='request-metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
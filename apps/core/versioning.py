@@ -0,0 +1,50 @@
+# core/versioning.py
+"""
+Cross-process invalidation for in-process caches.
+
+A SharedVersion is a counter in the shared cache backend. A process that
+changes the underlying data bumps it; every process compares it with the
+version its local cache was built from, reading the shared value at most
+once per `check_interval` so hot paths stay in memory.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+
+
+class SharedVersion:
+
+    def __init__(self, key, check_interval=1.0):
+        self.key = key
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked_at = 0.0
+
+    def get(self):
+        """Current version; may be up to check_interval behind other processes"""
+        now = time.monotonic()
+        if self._value is not None and now - self._checked_at < self.check_interval:
+            return self._value
+        cache.add(self.key, 0, timeout=None)
+        value = cache.get(self.key, 0)
+        with self._lock:
+            self._value = value
+            self._checked_at = now
+        return value
+
+    def bump(self):
+        """Advance the version for every process; returns the new value"""
+        cache.add(self.key, 0, timeout=None)
+        try:
+            value = cache.incr(self.key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(self.key, 1, timeout=None)
+            value = 1
+        with self._lock:
+            self._value = value
+            self._checked_at = time.monotonic()
+        return value
@@ -1,22 +1,92 @@
 # core/views.py
 
-from rest_framework import viewsets, serializers
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import parse_etags
+from rest_framework import permissions, viewsets, serializers
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .events import change_bus
+from .fieldsets import SparseFieldsetMixin
+from .instrumentation import InstrumentedViewMixin, endpoint_stats
 from .models import Material, PrintSetting, MachineType
+from .reference import reference_data
 from .serializers import MaterialSerializer, MachineTypeSerializer, PrintSettingSerializer
 
-class MaterialViewSet(viewsets.ModelViewSet):
+
+class ReferenceETagMixin:
+    """
+    ETag / If-None-Match on list and retrieve for reference data.
+
+    The tag is the reference cache's content digest for `reference_kind`
+    plus a hash of the full path (page, page size, ?fields=), so a client
+    revalidating an unchanged page gets a 304 without a database query.
+    A retrieve only answers 304 for a row that exists and passes the
+    object permissions; the row is looked up in the reference cache.
+    """
+    reference_kind = None
+
+    def _reference_etag(self, request):
+        path_hash = hashlib.sha256(request.get_full_path().encode()).hexdigest()[:16]
+        return f'"{reference_data.etag(self.reference_kind)}-{path_hash}"'
+
+    def _conditional(self, request, render, *args, **kwargs):
+        etag = self._reference_etag(request)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag in parse_etags(if_none_match):
+            return Response(status=304, headers={'ETag': etag})
+        response = render(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    def _check_cached_object(self):
+        """404 unless the row the URL names is in the reference cache; object permissions checked"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            key = self.queryset.model._meta.pk.to_python(self.kwargs[lookup_url_kwarg])
+        except DjangoValidationError:
+            raise Http404
+        row = reference_data.get(self.reference_kind, key)
+        if row is None:
+            raise Http404
+        self.check_object_permissions(self.request, row)
+
+    def retrieve(self, request, *args, **kwargs):
+        self._check_cached_object()
+        return self._conditional(request, super().retrieve, *args, **kwargs)
+
+
+class MaterialViewSet(ReferenceETagMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    reference_kind = 'material'
+    cursor_ordering = ('pk',)
+    query_budget = {'list': 1, 'retrieve': 1}
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
 
 
-class MachineTypeViewSet(viewsets.ModelViewSet):
+class MachineTypeViewSet(ReferenceETagMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    reference_kind = 'machine_type'
+    cursor_ordering = ('pk',)
+    query_budget = {'list': 1, 'retrieve': 1}
     queryset = MachineType.objects.all()
     serializer_class = MachineTypeSerializer
 
 
-class PrintSettingViewSet(viewsets.ModelViewSet):
-    # select_related prevents N+1 queries when fetching the nested material data
-    queryset = PrintSetting.objects.all().select_related('material', 'machine_type')
+class PrintSettingViewSet(ReferenceETagMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    reference_kind = 'print_setting'
+    query_budget = {'list': 1, 'retrieve': 1}
+    # The nested material comes from the reference cache, no join needed
+    queryset = PrintSetting.objects.all()
     
     def get_serializer_class(self):
         """
@@ -36,3 +106,69 @@ class PrintSettingWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = PrintSetting
         fields = ['id', 'machine_type', 'material', 'print_setting_name', 'layer_thickness_mm']
+
+
+# --- Live change stream ---
+
+EVENT_STREAM_HEARTBEAT_S = 15
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def event_stream_access(request):
+    """
+    DRF authentication and permission check for event_stream, which as an
+    async streaming view cannot be a DRF view itself
+    """
+    return Response(status=204)
+
+
+async def event_stream(request):
+    """
+    Server-sent events of printer, print job and async operation changes,
+    for authenticated users (see event_stream_access).
+
+    GET /api/core/events/?types=printer,print_job narrows the stream.
+    Each message is 'event: <type>' with the delta as JSON data. Must be
+    served over ASGI; a comment line is sent every 15s to keep proxies
+    from closing an idle stream.
+    """
+    access = await sync_to_async(event_stream_access)(request)
+    if access.status_code != 204:
+        return access
+
+    kinds = {kind for kind in request.GET.get('types', '').split(',') if kind} or None
+    subscription = change_bus.subscribe(kinds=kinds)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events = await subscription.get(timeout=EVENT_STREAM_HEARTBEAT_S)
+                if not events:
+                    yield ': keep-alive\n\n'
+                for event in events:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingHttpResponse(
+        stream(),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# --- Request metrics ---
+
+@api_view(['GET', 'DELETE'])
+def request_metrics(request):
+    """
+    Query counts and timings per endpoint, collected by
+    RequestMetricsMiddleware since this process started.
+    DELETE clears them.
+    """
+    if request.method == 'DELETE':
+        endpoint_stats.reset()
+        return Response(status=204)
+    return Response({'endpoints': endpoint_stats.snapshot()})
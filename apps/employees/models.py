@@ -32,7 +32,11 @@ class Employee(models.Model):
     is_active = models.BooleanField(default=True)
     hired_at = models.DateField(null=True)
     
+    @property
+    def effective_permissions(self):
+        """Frozenset of codenames from roles and extra permissions (cached)"""
+        from .permission_cache import permission_cache
+        return permission_cache.for_user(self.user_id)
+
     def has_perm(self, codename):
-        if self.extra_permissions.filter(codename=codename).exists():
-            return True
-        return self.roles.filter(permissions__codename=codename).exists()
+        return codename in self.effective_permissions
@@ -0,0 +1,103 @@
+# employees/permission_cache.py
+"""
+Effective-permission cache.
+
+A user's effective permissions (codenames from all their roles plus their
+extra permissions; none if their Employee is inactive or missing) are
+computed once and kept as a frozenset at two levels:
+
+- in this process, so repeated checks cost a dict lookup, and
+- in the shared cache backend (settings.CACHES), so other workers reuse
+  the result instead of recomputing it.
+
+Any change to roles, role permissions or extra permissions (see
+signals.py) bumps a SharedVersion. The shared keys include the version,
+so stale entries are never read again, and each process notices another
+process's change within GENERATION_CHECK_S.
+"""
+
+import threading
+
+from django.core.cache import cache
+
+from apps.core.versioning import SharedVersion
+from .models import Employee
+
+GENERATION_KEY = 'employees:permissions:generation'
+
+# Shared entries outlive any realistic gap between permission changes
+SHARED_TIMEOUT_S = 60 * 60
+
+# How stale another process's change may be before this one sees it
+GENERATION_CHECK_S = 1.0
+
+
+class PermissionCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}  # user_id -> frozenset of codenames
+        self._local_generation = None
+        self._generation = SharedVersion(GENERATION_KEY, GENERATION_CHECK_S)
+
+    def _current_generation(self):
+        generation = self._generation.get()
+        if generation != self._local_generation:
+            with self._lock:
+                self._local.clear()
+                self._local_generation = generation
+        return generation
+
+    @staticmethod
+    def _compute(user_ids):
+        """{user_id: frozenset} in two queries (role permissions, extra permissions)"""
+        codenames = {user_id: set() for user_id in user_ids}
+        employees = Employee.objects.filter(user_id__in=codenames.keys(), is_active=True)
+        for relation in ('roles__permissions__codename', 'extra_permissions__codename'):
+            for user_id, codename in employees.values_list('user_id', relation):
+                if codename is not None:
+                    codenames[user_id].add(codename)
+        return {user_id: frozenset(names) for user_id, names in codenames.items()}
+
+    def for_users(self, user_ids):
+        """{user_id: frozenset of effective codenames}; misses are computed together"""
+        generation = self._current_generation()
+        found = {}
+        missing = []
+        for user_id in set(user_ids):
+            codenames = self._local.get(user_id)
+            if codenames is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = codenames
+        if not missing:
+            return found
+
+        keys = {user_id: f'employees:permissions:{generation}:{user_id}' for user_id in missing}
+        shared = cache.get_many(keys.values())
+        loaded = {user_id: shared[key] for user_id, key in keys.items() if key in shared}
+        computed = self._compute([user_id for user_id in missing if user_id not in loaded])
+        if computed:
+            cache.set_many({keys[user_id]: codenames for user_id, codenames in computed.items()},
+                           timeout=SHARED_TIMEOUT_S)
+        loaded.update(computed)
+
+        with self._lock:
+            if self._local_generation == generation:
+                self._local.update(loaded)
+        found.update(loaded)
+        return found
+
+    def for_user(self, user_id):
+        """Frozenset of the user's effective permission codenames"""
+        return self.for_users([user_id])[user_id]
+
+    def invalidate(self):
+        """Drop every cached permission set, here and in other processes"""
+        generation = self._generation.bump()
+        with self._lock:
+            self._local.clear()
+            self._local_generation = generation
+
+
+permission_cache = PermissionCache()
@@ -0,0 +1,29 @@
+# employees/permissions.py
+
+from rest_framework import permissions
+
+from .permission_cache import permission_cache
+
+
+class HasFloorPermission(permissions.BasePermission):
+    """
+    Gates viewset actions on the employee's effective permissions.
+
+    The view maps actions to codenames:
+
+        required_permissions = {'claim': 'can_print'}
+
+    Actions not in the map are left to the other permission classes.
+    Superusers pass everything. Checks read the permission cache, so they
+    cost no queries once warm.
+    """
+    message = "Your employee role does not allow this action."
+
+    def has_permission(self, request, view):
+        codename = getattr(view, 'required_permissions', {}).get(getattr(view, 'action', None))
+        if codename is None:
+            return True
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        return user.is_superuser or codename in permission_cache.for_user(user.pk)
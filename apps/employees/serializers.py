@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Permission, Role, Employee
+from .permission_cache import permission_cache
 
 class PermissionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,6 +20,15 @@ class RoleSerializer(serializers.ModelSerializer):
         model = Role
         fields = ['id', 'name', 'permissions']
 
+class EmployeeListSerializer(serializers.ListSerializer):
+    """Loads the permission sets of a whole page at once"""
+
+    def to_representation(self, data):
+        employees = list(data.all() if hasattr(data, 'all') else data)
+        permission_cache.for_users(employee.user_id for employee in employees)
+        return super().to_representation(employees)
+
+
 class EmployeeSerializer(serializers.ModelSerializer):
     # Flatten fields from the linked User model
     username = serializers.CharField(source='user.username', read_only=True)
@@ -45,17 +55,14 @@ class EmployeeSerializer(serializers.ModelSerializer):
             'all_permissions',
             'hired_at'
         ]
+        list_serializer_class = EmployeeListSerializer
 
     def get_all_permissions(self, obj):
         """
         Aggregates permissions from both Roles and Extra Permissions.
         Useful for the frontend to decide which buttons to show/hide.
         """
-        # Get permissions from roles
-        role_perms = Permission.objects.filter(role__in=obj.roles.all())
-        # Combine with extra permissions
-        total_perms = (role_perms | obj.extra_permissions.all()).distinct()
-        return [p.codename for p in total_perms]
+        return sorted(obj.effective_permissions)
     
 class EmployeeCreateUpdateSerializer(serializers.ModelSerializer):
     # Fields required for the User account
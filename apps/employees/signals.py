@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Employee, Permission, Role
+from .permission_cache import permission_cache
+
+M2M_CHANGES = {'post_add', 'post_remove', 'post_clear'}
+
+
+def _invalidate():
+    # Now, for reads later in this transaction, and again once it commits so
+    # nobody caches what they read from before the commit
+    permission_cache.invalidate()
+    transaction.on_commit(permission_cache.invalidate)
+
+
+@receiver(m2m_changed, sender=Employee.roles.through)
+@receiver(m2m_changed, sender=Employee.extra_permissions.through)
+@receiver(m2m_changed, sender=Role.permissions.through)
+def permissions_changed(sender, action, **kwargs):
+    if action in M2M_CHANGES:
+        _invalidate()
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_delete, sender=Role)
+def permission_rows_changed(sender, **kwargs):
+    # is_active, renamed codenames and cascaded deletes all change what
+    # someone holds without an m2m_changed signal
+    _invalidate()
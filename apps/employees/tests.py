@@ -1,3 +1,128 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import Employee, Permission, Role
+from .permission_cache import PermissionCache, permission_cache
+
+
+def make_employee(username, *codenames, role=None):
+    """An Employee (with its User) holding `codenames` as extra permissions"""
+    user = User.objects.create_user(username)
+    employee = Employee.objects.create(user=user, employee_id=username, shift=Employee.Shifts.FIRST)
+    if role is not None:
+        employee.roles.add(role)
+    employee.extra_permissions.set(
+        Permission.objects.get_or_create(codename=codename, defaults={'description': codename})[0]
+        for codename in codenames
+    )
+    return employee
+
+
+class EmployeeAccessTests(TestCase):
+    def setUp(self):
+        self.permission = Permission.objects.create(codename='can_print', description='Print')
+
+    def payload(self, username='intruder'):
+        return {
+            'username': username, 'password': 'secret-pass', 'employee_id': username,
+            'shift': 1, 'roles': [], 'extra_permissions': [self.permission.pk],
+        }
+
+    def test_anonymous_clients_cannot_read_or_write(self):
+        client = APIClient()
+
+        self.assertEqual(client.get('/api/employees/employees/').status_code, 403)
+        self.assertEqual(client.post('/api/employees/employees/', self.payload(), format='json').status_code, 403)
+        self.assertFalse(User.objects.filter(username='intruder').exists())
+
+    def test_unprivileged_employee_can_read_but_not_write(self):
+        employee = make_employee('operator', 'can_print')
+        client = APIClient()
+        client.force_authenticate(employee.user)
+
+        self.assertEqual(client.get('/api/employees/employees/').status_code, 200)
+        self.assertEqual(client.post('/api/employees/employees/', self.payload(), format='json').status_code, 403)
+        response = client.patch(f'/api/employees/employees/{employee.pk}/', {'extra_permissions': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(client.delete(f'/api/employees/employees/{employee.pk}/').status_code, 403)
+        self.assertFalse(User.objects.filter(username='intruder').exists())
+
+    def test_manager_and_superuser_can_create(self):
+        manager = make_employee('manager', 'can_manage_employees')
+        client = APIClient()
+        client.force_authenticate(manager.user)
+        response = client.post('/api/employees/employees/', self.payload('new-hire'), format='json')
+        self.assertEqual(response.status_code, 201)
+
+        client.force_authenticate(User.objects.create_superuser('admin', password=None))
+        response = client.post('/api/employees/employees/', self.payload('second'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(Employee.objects.values_list('employee_id', flat=True)), {'manager', 'new-hire', 'second'})
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        self.manage = Permission.objects.create(codename='can_manage_employees', description='Manage')
+        self.role = Role.objects.create(name='Lead')
+        self.employee = make_employee('lead', 'can_print', role=self.role)
+
+    def test_role_grant_and_revoke_are_seen_at_once(self):
+        self.assertEqual(self.employee.effective_permissions, {'can_print'})
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.role.permissions.add(self.manage)
+        self.assertTrue(callbacks)
+        self.assertTrue(self.employee.has_perm('can_manage_employees'))
+
+        self.role.permissions.remove(self.manage)
+        self.assertFalse(self.employee.has_perm('can_manage_employees'))
+
+    def test_row_changes_invalidate(self):
+        self.employee.roles.add(Role.objects.create(name='Shipping'))
+        self.assertTrue(self.employee.has_perm('can_print'))
+
+        self.employee.is_active = False
+        self.employee.save()
+        self.assertEqual(self.employee.effective_permissions, frozenset())
+
+        self.employee.is_active = True
+        self.employee.save()
+        Permission.objects.filter(codename='can_print').delete()
+        self.assertEqual(self.employee.effective_permissions, frozenset())
+
+    def test_warm_checks_and_other_processes(self):
+        user_id = self.employee.user_id
+        permission_cache.for_user(user_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(permission_cache.for_user(user_id), {'can_print'})
+
+        # Another process reuses the shared entry instead of recomputing it
+        other = PermissionCache()
+        with self.assertNumQueries(0):
+            self.assertEqual(other.for_user(user_id), {'can_print'})
+
+        # ... and drops its copy once the generation moves on
+        generation = other._generation.get()
+        self.role.permissions.add(self.manage)
+        other._generation.check_interval = 0
+        self.assertGreater(other._generation.get(), generation)
+        self.assertEqual(other.for_user(user_id), {'can_print', 'can_manage_employees'})
+
+    def test_next_request_sees_the_change(self):
+        client = APIClient()
+        client.force_authenticate(self.employee.user)
+        path = f'/api/employees/employees/{self.employee.pk}/'
+
+        self.assertEqual(client.patch(path, {'shift': 2}, format='json').status_code, 403)
+        self.role.permissions.add(self.manage)
+        self.assertEqual(client.patch(path, {'shift': 2}, format='json').status_code, 200)
+        self.role.permissions.remove(self.manage)
+        self.assertEqual(client.patch(path, {'shift': 3}, format='json').status_code, 403)
+
+    def test_unmapped_actions_still_need_a_signed_in_user(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/orders/order/').status_code, 403)
+
+        client.force_authenticate(self.employee.user)
+        self.assertEqual(client.get('/api/orders/order/').status_code, 200)
@@ -1,11 +1,24 @@
 from django.shortcuts import render
-from rest_framework import viewsets
+from rest_framework import permissions, viewsets
 
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
 from .models import Employee
+from .permissions import HasFloorPermission
 from .serializers import EmployeeCreateUpdateSerializer, EmployeeSerializer
 
-class EmployeeViewSet(viewsets.ModelViewSet):
-    queryset = Employee.objects.all().select_related('user').prefetch_related('roles__permissions', 'extra_permissions')
+class EmployeeViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    """
+    Employees and their roles. Anyone signed in may read; creating,
+    changing or removing an employee takes can_manage_employees (or a
+    superuser), since those writes hand out floor permissions.
+    """
+    permission_classes = [permissions.IsAuthenticated, HasFloorPermission]
+    required_permissions = {
+        action: 'can_manage_employees' for action in ('create', 'update', 'partial_update', 'destroy')
+    }
+    query_budget = {'list': 5, 'retrieve': 5}
+    queryset = Employee.objects.all().select_related('user').prefetch_related('roles', 'extra_permissions')
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FleetConfig(AppConfig):
     name = 'apps.fleet'
+
+    def ready(self):
+        from . import signals  # noqa: F401
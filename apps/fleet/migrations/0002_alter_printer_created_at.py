@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='printer',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
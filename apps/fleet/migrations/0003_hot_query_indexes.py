@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fleet', '0002_alter_printer_created_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='printer',
+            index=models.Index(fields=['is_connected', 'status'], name='printer_availability_idx'),
+        ),
+    ]
@@ -35,7 +35,13 @@ class Printer(models.Model):
     )
     
     last_seen = models.DateTimeField(auto_now=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Connected printers by state (scheduler, floor dashboard)
+            models.Index(fields=['is_connected', 'status'], name='printer_availability_idx'),
+        ]
 
 
 class CartridgeData(models.Model):
@@ -2,11 +2,11 @@
 
 from rest_framework import serializers
 from .models import Printer, CartridgeData, PrinterMaintenanceLog
-from core.serializers import MachineTypeSerializer, MaterialSerializer
+from apps.core.serializers import ReferenceField
 
 
 class CartridgeDataSerializer(serializers.ModelSerializer):
-    material = MaterialSerializer(read_only=True)
+    material = ReferenceField('material', source='material_id')
     volume_remaining_ml = serializers.ReadOnlyField()
     
     class Meta:
@@ -23,8 +23,8 @@ class PrinterListSerializer(serializers.ModelSerializer):
 
 
 class PrinterDetailSerializer(serializers.ModelSerializer):
-    machine_type = MachineTypeSerializer(read_only=True)
-    tank_material = MaterialSerializer(read_only=True)
+    machine_type = ReferenceField('machine_type', source='machine_type_id')
+    tank_material = ReferenceField('material', source='tank_material_id')
     cartridges = CartridgeDataSerializer(many=True, read_only=True)
     
     # Current job info
@@ -46,4 +46,28 @@ class PrinterDetailSerializer(serializers.ModelSerializer):
                 'job_name': job.job_name,
                 'started_at': job.started_at
             }
-        return None
\ No newline at end of file
+        return None
+
+
+class CartridgeReadingSerializer(serializers.Serializer):
+    slot = serializers.CharField(max_length=10)
+    volume_dispensed_ml = serializers.FloatField(min_value=0)
+
+
+class TelemetryReadingSerializer(serializers.Serializer):
+    """
+    One heartbeat/status reading. Only 'printer' is required; a reading
+    with nothing else is a plain heartbeat.
+    """
+    printer = serializers.CharField(max_length=100)
+    timestamp = serializers.DateTimeField(required=False)
+    status = serializers.ChoiceField(choices=Printer.STATUS_CHOICES, required=False)
+    is_connected = serializers.BooleanField(required=False)
+    firmware_version = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    ip_address = serializers.IPAddressField(required=False, allow_null=True)
+    cartridges = CartridgeReadingSerializer(many=True, required=False)
+
+
+class TelemetryBatchSerializer(serializers.Serializer):
+    """Envelope for POST /printers/telemetry/"""
+    readings = TelemetryReadingSerializer(many=True, allow_empty=False)
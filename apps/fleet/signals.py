@@ -0,0 +1,5 @@
+from apps.core.events import track_changes
+
+from .models import Printer
+
+track_changes(Printer, 'printer', ['status', 'is_connected'])
@@ -0,0 +1,202 @@
+# fleet/telemetry.py
+"""
+Coalescing ingest for printer heartbeats, status and cartridge readings.
+
+Readings are buffered per printer with last-write-wins on each field
+(ordered by the reading's own timestamp, not arrival). When the coalescing
+window closes, the buffer is diffed against the current rows in one query
+and only changed columns are written, with one bulk_update per distinct
+set of changed fields. A heartbeat that changes nothing only refreshes
+last_seen once it is older than LAST_SEEN_RESOLUTION.
+
+Reading timestamps come from the printers' clocks and are capped at the
+server's now, so a clock running ahead cannot push last_seen into the
+future. Whatever is still buffered when the process exits is flushed.
+"""
+
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from apps.core.events import change_bus, delta
+from .models import CartridgeData, Printer
+
+logger = logging.getLogger(__name__)
+
+# Printer columns telemetry is allowed to set
+TELEMETRY_FIELDS = ['status', 'is_connected', 'firmware_version', 'ip_address']
+
+# last_seen is only rewritten for an otherwise unchanged printer when the
+# stored value is older than this
+LAST_SEEN_RESOLUTION = timedelta(seconds=30)
+
+DEFAULT_WINDOW_S = 2.0
+
+
+class TelemetryBuffer:
+    """
+    Per-process buffer of pending printer state.
+
+    add() merges readings and arms a timer that flushes after the
+    coalescing window (settings.TELEMETRY_COALESCE_WINDOW_S). With a
+    window of 0 every add() flushes immediately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+        self._reset()
+
+    def _reset(self):
+        self._printers = defaultdict(dict)  # printer_id -> {field: (timestamp, value)}
+        self._cartridges = {}  # (printer_id, slot) -> (timestamp, volume_dispensed_ml)
+        self._last_seen = {}  # printer_id -> newest reading timestamp
+        self._readings = 0
+
+    @property
+    def window_s(self):
+        return getattr(settings, 'TELEMETRY_COALESCE_WINDOW_S', DEFAULT_WINDOW_S)
+
+    def add(self, readings):
+        """
+        Buffer validated readings (dicts with 'printer', optional
+        'timestamp', any of TELEMETRY_FIELDS and 'cartridges').
+        Returns the flush stats when the buffer was flushed inline.
+        """
+        now = timezone.now()
+        with self._lock:
+            for reading in readings:
+                printer_id = reading['printer']
+                timestamp = min(reading.get('timestamp') or now, now)
+                self._readings += 1
+
+                if printer_id not in self._last_seen or timestamp > self._last_seen[printer_id]:
+                    self._last_seen[printer_id] = timestamp
+
+                fields = self._printers[printer_id]
+                for field in TELEMETRY_FIELDS:
+                    if field in reading and (field not in fields or timestamp >= fields[field][0]):
+                        fields[field] = (timestamp, reading[field])
+
+                for cartridge in reading.get('cartridges', []):
+                    key = (printer_id, cartridge['slot'])
+                    if key not in self._cartridges or timestamp >= self._cartridges[key][0]:
+                        self._cartridges[key] = (timestamp, cartridge['volume_dispensed_ml'])
+
+            if self.window_s > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window_s, self._flush_from_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return None
+
+        return self.flush()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            # Nobody else sees a timer thread's exceptions
+            logger.exception("Telemetry flush failed; the buffered readings are lost")
+        finally:
+            # The timer thread owns its own DB connection; don't leak it
+            connections.close_all()
+
+    def flush_at_exit(self):
+        """Write what is still buffered when the process stops (atexit)"""
+        try:
+            stats = self.flush()
+        except Exception:
+            logger.exception("Telemetry flush at exit failed; the buffered readings are lost")
+            return
+        if stats['readings']:
+            logger.info("Flushed %d buffered telemetry readings at exit", stats['readings'])
+
+    def flush(self):
+        """Write the buffered state; returns counts of what was (not) written"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending_printers = self._printers
+            pending_cartridges = self._cartridges
+            last_seen = self._last_seen
+            readings = self._readings
+            self._reset()
+
+        stats = {
+            'readings': readings,
+            'printers': len(last_seen),
+            'printers_updated': 0,
+            'printers_unchanged': 0,
+            'unknown_printers': 0,
+            'cartridges_updated': 0,
+        }
+        if not last_seen:
+            return stats
+
+        current = {
+            row[0]: row
+            for row in Printer.objects.filter(id__in=last_seen.keys()).values_list(
+                'id', *TELEMETRY_FIELDS, 'last_seen'
+            )
+        }
+
+        # Group printers by which columns actually changed
+        updates = defaultdict(list)
+        for printer_id, seen in last_seen.items():
+            row = current.get(printer_id)
+            if row is None:
+                stats['unknown_printers'] += 1
+                continue
+
+            stored = dict(zip(TELEMETRY_FIELDS, row[1:-1]))
+            changes = {
+                field: value
+                for field, (_, value) in pending_printers[printer_id].items()
+                if stored[field] != value
+            }
+            stored_last_seen = row[-1]
+            if changes or stored_last_seen is None or seen - stored_last_seen >= LAST_SEEN_RESOLUTION:
+                changes['last_seen'] = max(seen, stored_last_seen) if stored_last_seen else seen
+            if not changes:
+                stats['printers_unchanged'] += 1
+                continue
+
+            updates[tuple(sorted(changes))].append(Printer(id=printer_id, **changes))
+
+        cartridges = []
+        if pending_cartridges:
+            for cartridge_id, printer_id, slot, dispensed in CartridgeData.objects.filter(
+                printer_id__in={printer_id for printer_id, _ in pending_cartridges}
+            ).values_list('id', 'printer_id', 'slot', 'volume_dispensed_ml'):
+                reading = pending_cartridges.get((printer_id, slot))
+                if reading is not None and reading[1] != dispensed:
+                    cartridges.append(CartridgeData(id=cartridge_id, volume_dispensed_ml=reading[1]))
+
+        with transaction.atomic():
+            for fields, printers in updates.items():
+                Printer.objects.bulk_update(printers, fields)
+                stats['printers_updated'] += len(printers)
+            CartridgeData.objects.bulk_update(cartridges, ['volume_dispensed_ml'])
+            stats['cartridges_updated'] = len(cartridges)
+
+            # bulk_update sends no save signals, so announce changes here
+            for fields, printers in updates.items():
+                announced = [field for field in fields if field in ('status', 'is_connected')]
+                for printer in printers if announced else ():
+                    change_bus.publish_on_commit(delta(
+                        'printer', printer.id, {field: getattr(printer, field) for field in announced}
+                    ))
+
+        return stats
+
+
+telemetry_buffer = TelemetryBuffer()
+atexit.register(telemetry_buffer.flush_at_exit)
@@ -1,3 +1,103 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.core.testing import reference_fixture
+from .models import CartridgeData, Printer
+from .telemetry import TelemetryBuffer
+
+
+@override_settings(TELEMETRY_COALESCE_WINDOW_S=60)
+class TelemetryBufferTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.printer = Printer.objects.create(id='SN-1', name='one', machine_type_id='FORM-4-0', status='IDLE')
+        self.buffer = TelemetryBuffer()
+        self.addCleanup(self.buffer.flush)
+        self.now = timezone.now()
+
+    def test_latest_reading_wins_whatever_the_arrival_order(self):
+        self.buffer.add([
+            {'printer': 'SN-1', 'timestamp': self.now - timedelta(seconds=1), 'status': 'PRINTING'},
+            {'printer': 'SN-1', 'timestamp': self.now - timedelta(seconds=5), 'status': 'ERROR'},
+        ])
+
+        stats = self.buffer.flush()
+
+        self.assertEqual((stats['readings'], stats['printers_updated']), (2, 1))
+        self.assertEqual(Printer.objects.get().status, 'PRINTING')
+
+    def test_only_changed_cartridges_are_written(self):
+        CartridgeData.objects.create(printer=self.printer, slot='A', material_id='FLGPGR05',
+                                     volume_dispensed_ml=10, original_volume_ml=1000)
+        CartridgeData.objects.create(printer=self.printer, slot='B', material_id='FLGPGR05',
+                                     volume_dispensed_ml=20, original_volume_ml=1000)
+        self.buffer.add([{'printer': 'SN-1', 'cartridges': [
+            {'slot': 'A', 'volume_dispensed_ml': 15}, {'slot': 'B', 'volume_dispensed_ml': 20},
+        ]}])
+
+        self.assertEqual(self.buffer.flush()['cartridges_updated'], 1)
+        self.assertEqual(CartridgeData.objects.get(slot='A').volume_dispensed_ml, 15)
+
+    def test_repeated_heartbeat_writes_nothing(self):
+        self.buffer.add([{'printer': 'SN-1'}])
+        self.buffer.flush()
+
+        self.buffer.add([{'printer': 'SN-1'}])
+        stats = self.buffer.flush()
+
+        self.assertEqual((stats['printers_updated'], stats['printers_unchanged']), (0, 1))
+
+    def test_unknown_printer_is_counted(self):
+        self.buffer.add([{'printer': 'SN-404', 'status': 'IDLE'}])
+
+        self.assertEqual(self.buffer.flush()['unknown_printers'], 1)
+
+    def test_future_timestamp_is_capped_at_now(self):
+        self.buffer.add([{'printer': 'SN-1', 'timestamp': self.now + timedelta(days=365), 'status': 'PRINTING'}])
+        self.buffer.flush()
+
+        self.assertLessEqual(Printer.objects.get().last_seen, timezone.now())
+
+        # A later, honest reading still gets through
+        self.buffer.add([{'printer': 'SN-1', 'status': 'IDLE'}])
+        self.buffer.flush()
+        self.assertEqual(Printer.objects.get().status, 'IDLE')
+
+    def test_timer_flush_failure_is_logged(self):
+        with mock.patch.object(self.buffer, 'flush', side_effect=RuntimeError('database is gone')):
+            with self.assertLogs('apps.fleet.telemetry', 'ERROR') as logs:
+                self.buffer._flush_from_timer()
+
+        self.assertIn('database is gone', logs.output[0])
+
+    def test_buffered_readings_are_written_at_exit(self):
+        self.buffer.add([{'printer': 'SN-1', 'status': 'PRINTING'}])
+
+        with self.assertLogs('apps.fleet.telemetry', 'INFO'):
+            self.buffer.flush_at_exit()
+
+        self.assertEqual(Printer.objects.get().status, 'PRINTING')
+
+
+@override_settings(TELEMETRY_COALESCE_WINDOW_S=0)
+class TelemetryEndpointTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        Printer.objects.create(id='SN-1', name='one', machine_type_id='FORM-4-0')
+
+    def test_window_of_zero_writes_inline(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('telemetry'))
+        response = client.post('/api/fleet/printers/telemetry/', {
+            'readings': [{'printer': 'SN-1', 'status': 'IDLE', 'is_connected': True}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['printers_updated'], 1)
+        printer = Printer.objects.get()
+        self.assertEqual((printer.status, printer.is_connected), ('IDLE', True))
@@ -1,33 +1,50 @@
 from django.shortcuts import render
 
-from rest_framework import viewsets, serializers
+from rest_framework import viewsets, serializers, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
+from apps.production.models import Scene
+from apps.production.resin import can_run, printer_resin
 from .models import Printer, CartridgeData, PrinterMaintenanceLog
 from .serializers import (
     PrinterListSerializer, 
     PrinterDetailSerializer, 
-    CartridgeDataSerializer
+    CartridgeDataSerializer,
+    TelemetryBatchSerializer
 )
+from .telemetry import telemetry_buffer
 
-class PrinterViewSet(viewsets.ModelViewSet):
+class PrinterViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for viewing and editing Printers.
     """
-    # Optimized query to fetch foreign keys and reverse relationships in one go
+    cursor_ordering = ('-created_at', '-id')
+    query_budget = {'list': 1, 'retrieve': 3}
+    # The list shows machine_type.label; the detail view's machine type and
+    # materials come from the reference cache
     queryset = Printer.objects.all().select_related(
-        'machine_type', 
-        'tank_material'
+        'machine_type'
     ).prefetch_related(
-        'cartridges', 
-        'cartridges__material' # Nested prefetch for cartridge material
+        'cartridges'
     )
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # The list serializer shows no cartridges
+            return queryset.prefetch_related(None)
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'list':
             return PrinterListSerializer
         if self.action == 'retrieve':
             return PrinterDetailSerializer
+        if self.action == 'telemetry':
+            return TelemetryBatchSerializer
         # Use a flat serializer for creating/updating (allows setting IDs)
         return PrinterWriteSerializer
 
@@ -40,13 +57,45 @@ class PrinterViewSet(viewsets.ModelViewSet):
         # printer.check_connection() # Assuming you have a method like this on the model
         return Response({'status': 'ping sent', 'is_connected': printer.is_connected})
 
+    @action(detail=True, methods=['get'])
+    def resin(self, request, pk=None):
+        """
+        Resin left in the printer's cartridges per material, after its
+        queued and printing jobs. With ?scene=<id>, also whether it can
+        run that scene to the end.
+        """
+        printer = self.get_object()
+        data = {'printer': printer.id, 'cartridges': printer_resin(printer.id)}
+        if 'scene' in request.query_params:
+            scene = get_object_or_404(Scene, pk=request.query_params['scene'])
+            data['scene'] = scene.id
+            data['can_run'] = can_run(printer.id, scene)
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def telemetry(self, request):
+        """
+        Batched heartbeat/status/cartridge readings from many printers.
+        Readings are coalesced per printer and written after a short window,
+        touching only the columns that changed.
+        """
+        serializer = TelemetryBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        readings = serializer.validated_data['readings']
+        stats = telemetry_buffer.add(readings)
+        if stats is None:
+            return Response({'accepted': len(readings)}, status=status.HTTP_202_ACCEPTED)
+        return Response(stats)
+
 
-class CartridgeDataViewSet(viewsets.ModelViewSet):
+class CartridgeDataViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Cartridges. 
     Usually accessed via the Printer, but useful for independent inventory updates.
     """
-    queryset = CartridgeData.objects.all().select_related('material')
+    query_budget = {'list': 1, 'retrieve': 1}
+    queryset = CartridgeData.objects.all()
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
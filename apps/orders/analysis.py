@@ -0,0 +1,130 @@
+# orders/analysis.py
+"""
+Geometry analysis stage: fills in OrderItem.bounding_box_x/y/z and
+volume_ml from the model file at local_file_path.
+
+Items with no volume yet are pending if they have a local file or their
+content was analysed before (see below). They are taken
+ANALYSIS_BATCH_SIZE at a time in pk order; each distinct file of a round
+is measured once in a process pool (orders.geometry, which never touches
+the database), and the round's items are written back with one
+bulk_update. Parsing is CPU-bound NumPy work, so workers are processes
+started fresh ('spawn'), never forked from a process holding database
+connections.
+
+Results are also stored on the item's ModelFile (orders.filestore), so
+content that was measured once, for any item or URL, is copied from
+there and never analysed again, even after its file has been evicted.
+
+A file that cannot be read or parsed is logged and its items stay
+pending, so a file that arrives later is picked up by the next run.
+Batch layout needs the bounding boxes (production.layout), so this runs
+right after ingest: manage.py analyze_geometry.
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.db.models import Q
+
+from .geometry import analyze_or_error
+from .models import ModelFile, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Items loaded, analysed and written per round
+ANALYSIS_BATCH_SIZE = 500
+
+GEOMETRY_FIELDS = ['bounding_box_x', 'bounding_box_y', 'bounding_box_z', 'volume_ml']
+
+
+def pending_items():
+    return OrderItem.objects.filter(volume_ml__isnull=True).filter(
+        ~Q(local_file_path='') | Q(model_file__volume_ml__isnull=False)
+    )
+
+
+def _rounds(items):
+    """Lists of (id, local_file_path, model_file_id), ANALYSIS_BATCH_SIZE at a time in pk order"""
+    last_pk = None
+    while True:
+        page = items.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        rows = list(page.values_list('id', 'local_file_path', 'model_file_id')[:ANALYSIS_BATCH_SIZE])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def _cached(model_file_ids):
+    """{sha256: geometry} of the stored files that were analysed before"""
+    return {
+        row['sha256']: row
+        for row in ModelFile.objects.filter(sha256__in=model_file_ids, volume_ml__isnull=False).values(
+            'sha256', *GEOMETRY_FIELDS
+        )
+    }
+
+
+def analyze_items(items=None, workers=None):
+    """
+    Measure the model files of `items` (an OrderItem queryset; pending
+    items by default) in a pool of `workers` processes (one per CPU by
+    default) and store the geometry. Returns a summary.
+    """
+    items = pending_items() if items is None else items
+    summary = {
+        'items_analyzed': 0,
+        'items_from_cache': 0,
+        'items_failed': 0,
+        'files_analyzed': 0,
+        'files_failed': 0,
+        'triangles': 0,
+    }
+
+    pool = None
+    try:
+        for rows in _rounds(items):
+            cached = _cached({model_file_id for _, _, model_file_id in rows if model_file_id})
+            paths = list(dict.fromkeys(path for _, path, model_file_id in rows if model_file_id not in cached))
+            if pool is None and (workers or 0) != 1 and len(paths) > 1:
+                pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            results = dict(zip(paths, pool.map(analyze_or_error, paths) if pool else map(analyze_or_error, paths)))
+
+            updated = []
+            measured = {}  # sha256 -> ModelFile with the geometry just measured
+            for item_id, path, model_file_id in rows:
+                if model_file_id in cached:
+                    geometry = cached[model_file_id]
+                    summary['items_from_cache'] += 1
+                else:
+                    geometry, _ = results[path]
+                    if geometry is None:
+                        summary['items_failed'] += 1
+                        continue
+                    summary['items_analyzed'] += 1
+                    if model_file_id:
+                        measured[model_file_id] = ModelFile(
+                            sha256=model_file_id, **{field: geometry[field] for field in GEOMETRY_FIELDS}
+                        )
+                updated.append(OrderItem(id=item_id, **{field: geometry[field] for field in GEOMETRY_FIELDS}))
+            with transaction.atomic():
+                OrderItem.objects.bulk_update(updated, GEOMETRY_FIELDS)
+                ModelFile.objects.bulk_update(measured.values(), GEOMETRY_FIELDS)
+
+            for path, (geometry, error) in results.items():
+                if geometry is None:
+                    summary['files_failed'] += 1
+                    logger.warning("Cannot analyse %s: %s", path, error)
+                else:
+                    summary['files_analyzed'] += 1
+                    summary['triangles'] += geometry['triangles']
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return summary
@@ -0,0 +1,283 @@
+# orders/filestore.py
+"""
+Content-addressed store for customer model files.
+
+Each file is kept once under its SHA-256 in MODEL_FILE_STORE_DIR
+(ab/cd/abcd....stl) and has a ModelFile row. ModelFileSource maps every
+URL fetched to the hash it gave. Repeat customers reorder the same parts,
+so most items need no download at all:
+
+    1. items of open orders without a local file are pending
+    2. URLs already in the index whose file is still stored are assigned
+       straight away (one query), the file's LRU stamp is refreshed
+    3. every other distinct URL is streamed to a temporary file once,
+       hashed as it arrives, with at most `concurrency` downloads at a
+       time over a shared httpx connection pool
+    4. content already stored under another URL is dropped and the
+       existing file is used; new content is moved into place
+    5. ModelFile / ModelFileSource rows are upserted and the items'
+       local_file_path and model_file written with one bulk_update
+
+Geometry is cached on ModelFile (orders.analysis), so a model is
+analysed once however many items or URLs point at it.
+
+evict() keeps the store within MODEL_FILE_STORE_BUDGET_GB by deleting
+the least recently used files. Files of items of open orders, or still
+waiting for analysis, are kept: those items would only be fetched again.
+Items of evicted files lose their local_file_path. Rows stay, so the URL index and the geometry
+survive eviction. Run both with manage.py fetch_model_files.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .models import ModelFile, ModelFileSource, OrderItem
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_BYTES = 1 << 20
+DOWNLOAD_TIMEOUT_S = 60.0
+
+# Items of orders in these states are never fetched
+CLOSED_ORDER_STATUSES = ['SHIPPED', 'CANCELLED']
+
+MODEL_EXTENSIONS = ['.stl', '.obj']
+
+BULK_BATCH_SIZE = 1000
+
+
+class DownloadError(Exception):
+    """A model file URL could not be fetched"""
+
+
+class ModelFileStore:
+    """Files on disk, one per SHA-256; knows nothing about the database"""
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.MODEL_FILE_STORE_DIR)
+
+    def path(self, sha256, extension=''):
+        return self.root / sha256[:2] / sha256[2:4] / f'{sha256}{extension}'
+
+    def temporary(self):
+        """(file object, path) of a new temporary file on the store's filesystem"""
+        incoming = self.root / 'incoming'
+        incoming.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=incoming)
+        return os.fdopen(fd, 'wb'), Path(path)
+
+    def put(self, temporary, sha256, extension=''):
+        """Move a downloaded `temporary` file into place; dropped if the content is already stored"""
+        path = self.path(sha256, extension)
+        if path.exists():
+            temporary.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temporary, path)
+        return path
+
+    def remove(self, sha256, extension=''):
+        self.path(sha256, extension).unlink(missing_ok=True)
+
+
+def pending_downloads():
+    return OrderItem.objects.filter(local_file_path='').exclude(order__status__in=CLOSED_ORDER_STATUSES)
+
+
+def model_extension(file_name, url):
+    """'.stl' / '.obj' from the item's file name, else from the URL; '' if neither says"""
+    for name in (file_name, urlsplit(url).path):
+        suffix = PurePosixPath(name).suffix.lower()
+        if suffix in MODEL_EXTENSIONS:
+            return suffix
+    return ''
+
+
+async def _download(client, store, url):
+    """Stream `url` into the store's incoming directory; (sha256, size, temporary path)"""
+    digest = hashlib.sha256()
+    size = 0
+    file, temporary = store.temporary()
+    try:
+        with file:
+            async with client.stream('GET', url) as response:
+                if response.is_error:
+                    raise DownloadError(f"{url} returned {response.status_code}")
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                    digest.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    return digest.hexdigest(), size, temporary
+
+
+async def fetch_model_files(items=None, concurrency=None, store=None, transport=None):
+    """
+    Give every item of `items` (pending_downloads() by default) a local
+    copy of its model file. Returns a summary. `transport` lets tests
+    plug in an httpx.MockTransport.
+    """
+    items = pending_downloads() if items is None else items
+    store = store or ModelFileStore()
+    concurrency = concurrency or settings.MODEL_FILE_DOWNLOAD_CONCURRENCY
+    summary = {
+        'items_assigned': 0,
+        'urls_known': 0,
+        'urls_downloaded': 0,
+        'urls_failed': 0,
+        'files_stored': 0,
+        'bytes_downloaded': 0,
+    }
+
+    rows = [row async for row in items.values_list('id', 'model_file_url', 'model_file_name')]
+    if not rows:
+        return summary
+    extensions = {}
+    for _, url, file_name in rows:
+        extensions.setdefault(url, model_extension(file_name, url))
+
+    # URL index: files already stored need no download
+    known = {
+        url: (sha256, extension)
+        async for url, sha256, extension in ModelFileSource.objects.filter(
+            url__in=extensions.keys(), model_file__stored=True
+        ).values_list('url', 'model_file_id', 'model_file__extension')
+    }
+    summary['urls_known'] = len(known)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        limits=limits, timeout=DOWNLOAD_TIMEOUT_S, follow_redirects=True, transport=transport
+    ) as client:
+        async def fetch(url):
+            async with semaphore:
+                try:
+                    return url, await _download(client, store, url)
+                except (DownloadError, httpx.HTTPError, OSError) as exc:
+                    logger.warning("Downloading %s failed: %s", url, exc)
+                    return url, None
+
+        downloads = await asyncio.gather(*(fetch(url) for url in extensions if url not in known))
+
+    # Content already stored under another URL keeps its file and extension
+    existing = {
+        sha256: extension
+        async for sha256, extension in ModelFile.objects.filter(
+            sha256__in={result[0] for _, result in downloads if result is not None}
+        ).values_list('sha256', 'extension')
+    }
+
+    now = timezone.now()
+    files = {}  # sha256 -> ModelFile
+    fetched = {}  # url -> (sha256, extension)
+    for url, result in downloads:
+        if result is None:
+            summary['urls_failed'] += 1
+            continue
+        sha256, size, temporary = result
+        extension = existing.get(sha256, extensions[url])
+        if not store.path(sha256, extension).exists():
+            summary['files_stored'] += 1
+        await sync_to_async(store.put, thread_sensitive=False)(temporary, sha256, extension)
+        summary['urls_downloaded'] += 1
+        summary['bytes_downloaded'] += size
+        files.setdefault(sha256, ModelFile(sha256=sha256, extension=extension, size_bytes=size, last_used_at=now))
+        fetched[url] = (sha256, extension)
+
+    def save():
+        with transaction.atomic():
+            ModelFile.objects.bulk_create(
+                files.values(),
+                update_conflicts=True,
+                unique_fields=['sha256'],
+                update_fields=['stored', 'last_used_at'],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            ModelFileSource.objects.bulk_create(
+                [ModelFileSource(url=url, model_file_id=sha256) for url, (sha256, _) in fetched.items()],
+                update_conflicts=True,
+                unique_fields=['url'],
+                update_fields=['model_file', 'fetched_at'],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            ModelFile.objects.filter(sha256__in={sha256 for sha256, _ in known.values()}).update(last_used_at=now)
+
+            located = {**known, **fetched}
+            assigned = [
+                OrderItem(
+                    id=item_id,
+                    model_file_id=located[url][0],
+                    local_file_path=str(store.path(*located[url])),
+                )
+                for item_id, url, _ in rows
+                if url in located
+            ]
+            OrderItem.objects.bulk_update(assigned, ['model_file', 'local_file_path'], batch_size=BULK_BATCH_SIZE)
+            return len(assigned)
+
+    summary['items_assigned'] = await sync_to_async(save)()
+    return summary
+
+
+def evict(budget_bytes=None, store=None, dry_run=False):
+    """
+    Delete least recently used files until the store fits `budget_bytes`
+    (MODEL_FILE_STORE_BUDGET_GB by default). Returns a summary.
+    """
+    if budget_bytes is None:
+        budget_bytes = int(settings.MODEL_FILE_STORE_BUDGET_GB * 1e9)
+    store = store or ModelFileStore()
+    stored = ModelFile.objects.filter(stored=True)
+    total = stored.aggregate(total=Sum('size_bytes'))['total'] or 0
+    summary = {'files_evicted': 0, 'bytes_evicted': 0, 'bytes_stored': total}
+    if total <= budget_bytes:
+        return summary
+
+    # pending_downloads() would fetch these straight back
+    in_use = OrderItem.objects.filter(model_file=OuterRef('pk')).filter(
+        ~Q(order__status__in=CLOSED_ORDER_STATUSES) | Q(volume_ml__isnull=True)
+    )
+    candidates = (
+        stored.exclude(Exists(in_use))
+        .order_by('last_used_at')
+        .values_list('sha256', 'extension', 'size_bytes')
+    )
+    evicted = []
+    for sha256, extension, size in candidates.iterator():
+        if total <= budget_bytes:
+            break
+        evicted.append((sha256, extension))
+        total -= size
+        summary['files_evicted'] += 1
+        summary['bytes_evicted'] += size
+    summary['bytes_stored'] = total
+
+    if dry_run or not evicted:
+        return summary
+
+    # Rows first: a failed unlink leaves an orphan file, never a dangling path
+    hashes = [sha256 for sha256, _ in evicted]
+    with transaction.atomic():
+        for start in range(0, len(hashes), BULK_BATCH_SIZE):
+            chunk = hashes[start:start + BULK_BATCH_SIZE]
+            ModelFile.objects.filter(sha256__in=chunk).update(stored=False)
+            OrderItem.objects.filter(model_file_id__in=chunk).update(local_file_path='')
+    for sha256, extension in evicted:
+        store.remove(sha256, extension)
+    return summary
@@ -0,0 +1,177 @@
+# orders/geometry.py
+"""
+STL / OBJ geometry: axis-aligned bounding box and enclosed volume.
+
+Meshes are read into an (n, 3, 3) array of triangles without a Python
+loop per triangle:
+
+    binary STL   memory-mapped as a structured array (50 bytes a facet),
+                 so the file is paged in as the triangles are measured
+    ASCII STL    vertex lines pulled out of the mapped file with one
+                 regex pass, their numbers parsed by NumPy's C reader
+    OBJ          v / f lines the same way; polygons are fanned into
+                 triangles, negative (relative) indices are resolved
+
+Volume is the sum of the signed tetrahedra each triangle spans with the
+origin, which is exact for a closed mesh whatever its position; its sign
+depends on winding, so the magnitude is reported. Units are taken to be
+millimetres, so volume_ml = mm^3 / 1000.
+
+Nothing here touches the database: analyze_file() runs in pool workers
+(see orders.analysis).
+"""
+
+import io
+import mmap
+import os
+import re
+
+import numpy as np
+
+# Triangles measured at a time; bounds the float64 working set
+MEASURE_CHUNK = 1 << 18
+
+STL_HEADER_BYTES = 84
+
+STL_FACET = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attribute', '<u2'),
+])
+
+_STL_VERTEX = re.compile(rb'vertex[ \t]+(\S+[ \t]+\S+[ \t]+\S+)')
+_OBJ_VERTEX = re.compile(rb'^v[ \t]+(\S+[ \t]+\S+[ \t]+\S+)', re.MULTILINE)
+_OBJ_FACE = re.compile(rb'^f[ \t]+([^\r\n#]*)', re.MULTILINE)
+_OBJ_KIND = re.compile(rb'^([vf])[ \t]', re.MULTILINE)
+
+
+class MeshError(ValueError):
+    """The file is not a mesh this module can read"""
+
+
+def _binary_stl_count(size, header):
+    """Facet count if a file of `size` bytes starting with `header` is binary STL, else None"""
+    if size < STL_HEADER_BYTES:
+        return None
+    count = int.from_bytes(header[80:84], 'little')
+    return count if size == STL_HEADER_BYTES + count * STL_FACET.itemsize else None
+
+
+def _parse(lines, dtype):
+    """Rows of numbers from `lines` (bytes, the same count on each), parsed in C"""
+    try:
+        return np.loadtxt(io.BytesIO(b'\n'.join(lines)), dtype=dtype, ndmin=2)
+    except ValueError as exc:
+        raise MeshError(f"Malformed number: {exc}") from None
+
+
+def _ascii_stl(data):
+    lines = _STL_VERTEX.findall(data)
+    if not lines or len(lines) % 3:
+        raise MeshError("No complete facets in ASCII STL")
+    return _parse(lines, np.float64).reshape(-1, 3, 3)
+
+
+def _tokens(lines):
+    """The whitespace-separated tokens of `lines` (bytes, one line each) and how many each line has"""
+    text = b'\n'.join(lines) + b'\n'
+    tokens = np.array(text.split(), dtype=np.bytes_)
+    chars = np.frombuffer(text, dtype=np.uint8)
+    blank = chars <= ord(' ')
+    starts = np.flatnonzero(~blank & np.concatenate(([True], blank[:-1])))
+    line = np.cumsum(chars == ord('\n'))[starts]
+    return tokens, np.bincount(line, minlength=len(lines))
+
+
+def _obj(data):
+    vertex_lines = _OBJ_VERTEX.findall(data)
+    face_lines = _OBJ_FACE.findall(data)
+    if not vertex_lines or not face_lines:
+        raise MeshError("No vertices or faces in OBJ")
+    vertices = _parse(vertex_lines, np.float64)
+
+    # 'v', 'v/vt', 'v//vn' and 'v/vt/vn' corners all start with the vertex index
+    corners, sides = _tokens(face_lines)
+    if sides.min() < 3:
+        raise MeshError("OBJ face with fewer than three corners")
+    try:
+        index = np.strings.partition(corners, b'/')[0].astype(np.int64)
+    except ValueError:
+        raise MeshError("Malformed OBJ face") from None
+    if index.min() < 0:
+        # Relative indices count back from the vertices defined so far
+        kinds = np.array(_OBJ_KIND.findall(data), dtype=np.bytes_)
+        seen_before = np.cumsum(kinds == b'v')[kinds == b'f']
+        index = np.where(index < 0, index + np.repeat(seen_before, sides) + 1, index)
+    index -= 1
+    if index.min() < 0 or index.max() >= len(vertices):
+        raise MeshError("OBJ face refers to a missing vertex")
+
+    # Fan each polygon: (first, j, j + 1) for j = 1 .. sides - 2
+    first = np.cumsum(sides) - sides
+    fans = sides - 2
+    start = np.repeat(first, fans)
+    step = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    corner_ids = np.stack([start, start + step, start + step + 1], axis=1)
+    return vertices[index[corner_ids]]
+
+
+def _measure(triangles):
+    """(bounding box (x, y, z) in mm, volume in mm^3) of an (n, 3, 3) array"""
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    volume = 0.0
+    for start in range(0, len(triangles), MEASURE_CHUNK):
+        chunk = np.asarray(triangles[start:start + MEASURE_CHUNK], dtype=np.float64)
+        points = chunk.reshape(-1, 3)
+        low = np.minimum(low, points.min(axis=0))
+        high = np.maximum(high, points.max(axis=0))
+        volume += np.einsum('ij,ij->', chunk[:, 0], np.cross(chunk[:, 1], chunk[:, 2]))
+    if not np.isfinite(low).all() or not np.isfinite(volume):
+        raise MeshError("Mesh has no finite vertices")
+    return high - low, abs(volume) / 6
+
+
+def read_triangles(path, data):
+    """(n, 3, 3) triangles of the mapped file `data` at `path`"""
+    if path.lower().endswith('.obj'):
+        return _obj(data)
+    count = _binary_stl_count(len(data), data[:STL_HEADER_BYTES])
+    if count is not None:
+        return np.frombuffer(data, dtype=STL_FACET, count=count, offset=STL_HEADER_BYTES)['vertices']
+    return _ascii_stl(data)
+
+
+def analyze_file(path):
+    """
+    {'bounding_box_x', 'bounding_box_y', 'bounding_box_z', 'volume_ml',
+    'triangles'} of the STL or OBJ file at `path`. Raises MeshError for a
+    file that is not a mesh and OSError for one that cannot be read.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise MeshError("Empty file")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            triangles = read_triangles(path, data)
+            if len(triangles) == 0:
+                raise MeshError("Mesh has no triangles")
+            size, volume = _measure(triangles)
+            count = len(triangles)
+            # The array may view the mapping, which must not outlive it
+            del triangles
+
+    return {
+        'bounding_box_x': float(size[0]),
+        'bounding_box_y': float(size[1]),
+        'bounding_box_z': float(size[2]),
+        'volume_ml': float(volume) / 1000,
+        'triangles': count,
+    }
+
+
+def analyze_or_error(path):
+    """(analyze_file(path), None), or (None, reason) if it cannot be analysed; for pool workers"""
+    try:
+        return analyze_file(path), None
+    except (MeshError, OSError) as exc:
+        return None, str(exc)
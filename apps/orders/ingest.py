@@ -0,0 +1,245 @@
+# orders/ingest.py
+
+import threading
+from collections import OrderedDict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from .models import Order, OrderItem
+from .serializers import OrderBulkCreateSerializer
+
+# Rows per INSERT statement. Django lowers this further on backends
+# with a smaller bind-parameter limit (e.g. SQLite).
+BULK_BATCH_SIZE = 1000
+
+# Writes tried before orders still colliding with concurrent inserts are failed
+WRITE_ATTEMPTS = 3
+
+
+class RecentExternalIds:
+    """
+    Thread-safe LRU of external_id -> Order.id for recently seen orders.
+
+    Storefront retries arrive within seconds of the original request, so a
+    per-process cache turns most existence checks into primary key lookups.
+    Neither answer is trusted on its own: a miss falls back to the DB by
+    external_id, and a hit is confirmed by primary key, since the order may
+    have been deleted (or its transaction rolled back) since it was cached.
+    """
+
+    def __init__(self, maxsize=50_000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, external_ids):
+        found = {}
+        with self._lock:
+            for external_id in external_ids:
+                order_id = self._entries.get(external_id)
+                if order_id is not None:
+                    self._entries.move_to_end(external_id)
+                    found[external_id] = order_id
+        return found
+
+    def put_many(self, mapping):
+        with self._lock:
+            for external_id, order_id in mapping.items():
+                self._entries[external_id] = order_id
+                self._entries.move_to_end(external_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, external_id):
+        with self._lock:
+            self._entries.pop(external_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+recent_external_ids = RecentExternalIds()
+
+
+def find_existing_orders(external_ids):
+    """
+    Map each already-stored external_id to its Order.id, with one query:
+    cached ids are confirmed by primary key, the rest looked up by
+    external_id. Cached ids that no longer match are dropped.
+    """
+    external_ids = set(external_ids)
+    if not external_ids:
+        return {}
+    cached = recent_external_ids.get_many(external_ids)
+    missing = external_ids - cached.keys()
+
+    found = {
+        external_id: order_id
+        for external_id, order_id in Order.objects.filter(
+            Q(pk__in=cached.values()) | Q(external_id__in=missing)
+        ).values_list('external_id', 'id')
+        if external_id in external_ids
+    }
+    for external_id, order_id in cached.items():
+        if found.get(external_id) != order_id:
+            recent_external_ids.discard(external_id)
+    recent_external_ids.put_many(found)
+    return found
+
+
+def _result(index, external_id, status, order_id=None, errors=None):
+    return {
+        'index': index,
+        'external_id': external_id,
+        'status': status,
+        'order_id': order_id,
+        'errors': errors or {},
+    }
+
+
+def _existing_result(index, external_id, order_id, idempotent):
+    if idempotent:
+        return _result(index, external_id, 'EXISTING', order_id=order_id)
+    return _result(
+        index, external_id, 'FAILED',
+        errors={'external_id': ['Order with this external_id already exists.']}
+    )
+
+
+def _payload_external_id(payload):
+    external_id = payload.get('external_id')
+    return None if external_id is None else str(external_id)
+
+
+def ingest_orders(payloads, idempotent=False):
+    """
+    Validate and insert many incoming orders at once.
+
+    Every payload is validated in memory, material codes are checked against
+    the reference cache (no queries) and the surviving orders and their items are written
+    with bulk_create inside one transaction. A bad order never blocks the
+    rest of the request.
+
+    Orders whose external_id is already stored are answered before any
+    validation. With idempotent=True they are reported as 'EXISTING' with
+    the stored order id (a retried request is a no-op); otherwise they fail.
+
+    Returns one result per payload, in input order, with status
+    'CREATED', 'EXISTING' or 'FAILED'.
+    """
+    results = [None] * len(payloads)
+    pending = {}  # index -> validated_data
+    duplicates = {}  # index -> index of the first order with the same external_id
+
+    existing = find_existing_orders(
+        external_id for external_id in map(_payload_external_id, payloads) if external_id
+    )
+
+    # One serializer instance validates every payload, so the (nested)
+    # field set is built once per request instead of once per order.
+    serializer = OrderBulkCreateSerializer()
+    first_index = {}
+    for index, payload in enumerate(payloads):
+        external_id = _payload_external_id(payload)
+        if external_id in existing:
+            results[index] = _existing_result(index, external_id, existing[external_id], idempotent)
+            continue
+
+        if external_id in first_index:
+            if idempotent:
+                duplicates[index] = first_index[external_id]
+            else:
+                results[index] = _result(
+                    index, external_id, 'FAILED',
+                    errors={'external_id': ['Duplicate external_id within this request.']}
+                )
+            continue
+
+        try:
+            validated_data = serializer.run_validation(payload)
+        except ValidationError as exc:
+            results[index] = _result(index, external_id, 'FAILED', errors=as_serializer_error(exc))
+            continue
+
+        first_index[external_id] = index
+        pending[index] = validated_data
+
+    created = _write_with_retries(pending, results, idempotent)
+
+    recent_external_ids.put_many({order.external_id: order.id for order in created.values()})
+    for index, order in created.items():
+        results[index] = _result(index, order.external_id, 'CREATED', order_id=order.id)
+
+    for index, original in duplicates.items():
+        first = results[original]
+        if first['status'] == 'FAILED':
+            results[index] = dict(first, index=index)
+        else:
+            results[index] = _result(index, first['external_id'], 'EXISTING', order_id=first['order_id'])
+
+    return results
+
+
+def _write_with_retries(pending, results, idempotent):
+    """
+    _write_orders(pending), retried while concurrent requests insert some
+    of the same external_ids after the existence check. Each time the
+    transaction rolls back; the orders that lost the race get their
+    result and the rest are tried again, up to WRITE_ATTEMPTS writes.
+    Orders still conflicting after that, or conflicting with no order
+    that can be found, are reported as FAILED.
+    """
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        try:
+            return _write_orders(pending)
+        except IntegrityError:
+            raced = find_existing_orders(data['external_id'] for data in pending.values())
+            for index, data in list(pending.items()):
+                if data['external_id'] in raced:
+                    results[index] = _existing_result(
+                        index, data['external_id'], raced[data['external_id']], idempotent
+                    )
+                    del pending[index]
+            if not raced or attempt == WRITE_ATTEMPTS:
+                break
+
+    for index, data in pending.items():
+        results[index] = _result(
+            index, data['external_id'], 'FAILED',
+            errors={'external_id': ['Conflicted with a concurrent write; retry this order.']}
+        )
+    return {}
+
+
+@transaction.atomic
+def _write_orders(pending):
+    """
+    Insert the validated orders and their items in bulk.
+    Returns {index: Order} for the orders that were written.
+    """
+    if not pending:
+        return {}
+
+    orders = {}
+    items = []
+    for index, data in pending.items():
+        data = dict(data)
+        items_data = data.pop('items')
+        # UUID primary keys are assigned in Python, so items can point
+        # at their order before anything is inserted.
+        order = Order(quantity=sum(item_data['quantity'] for item_data in items_data), **data)
+        orders[index] = order
+
+        for item_data in items_data:
+            item_data = dict(item_data)
+            material_code = item_data.pop('material_code')
+            items.append(OrderItem(order=order, material_id=material_code, **item_data))
+
+    Order.objects.bulk_create(orders.values(), batch_size=BULK_BATCH_SIZE)
+    OrderItem.objects.bulk_create(items, batch_size=BULK_BATCH_SIZE)
+
+    return orders
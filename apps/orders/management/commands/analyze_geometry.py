@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.orders.analysis import analyze_items, pending_items
+from apps.orders.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = "Measure bounding box and volume of order items whose model file has not been analysed yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--all', action='store_true', help='Redo every item with a local file')
+
+    def handle(self, *args, **options):
+        items = OrderItem.objects.exclude(local_file_path='') if options['all'] else pending_items()
+        summary = analyze_items(items, workers=options['workers'])
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,99 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.batching.management.commands.benchmark_batch_formation import seed
+from apps.core.benchmarking import Stopwatch, rate, scratch_database
+from apps.orders.analysis import analyze_items
+from apps.orders.geometry import STL_FACET, analyze_file
+from apps.orders.models import OrderItem
+
+RADIUS_MM = 20.0
+
+
+def sphere(triangles):
+    """(n, 3, 3) closed UV sphere of RADIUS_MM with about `triangles` triangles"""
+    rings = max(2, int(math.sqrt(triangles / 4)))
+    segments = max(3, triangles // (2 * rings))
+    theta = np.linspace(0, np.pi, rings + 1)
+    phi = np.linspace(0, 2 * np.pi, segments + 1)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    grid = RADIUS_MM * np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], axis=-1)
+    a, b, c, d = grid[:-1, :-1], grid[1:, :-1], grid[1:, 1:], grid[:-1, 1:]
+    return np.concatenate([np.stack([a, b, c], axis=2), np.stack([a, c, d], axis=2)]).reshape(-1, 3, 3)
+
+
+def write_binary_stl(path, triangles):
+    facets = np.zeros(len(triangles), dtype=STL_FACET)
+    facets['vertices'] = triangles
+    with open(path, 'wb') as file:
+        file.write(b'benchmark'.ljust(80, b' '))
+        file.write(len(triangles).to_bytes(4, 'little'))
+        facets.tofile(file)
+
+
+def write_ascii_stl(path, triangles):
+    facet = 'facet normal 0 0 0\nouter loop\n' + 'vertex %.6f %.6f %.6f\n' * 3 + 'endloop\nendfacet'
+    with open(path, 'w') as file:
+        file.write('solid benchmark\n')
+        np.savetxt(file, triangles.reshape(-1, 9), fmt=facet)
+        file.write('endsolid benchmark\n')
+
+
+def write_obj(path, triangles):
+    with open(path, 'w') as file:
+        np.savetxt(file, triangles.reshape(-1, 3), fmt='v %.6f %.6f %.6f')
+        np.savetxt(file, np.arange(1, len(triangles) * 3 + 1).reshape(-1, 3), fmt='f %d %d %d')
+
+
+class Command(BaseCommand):
+    help = "Time STL / OBJ geometry analysis on large meshes, alone and through the process pool (uses a scratch DB)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--triangles', type=int, default=1_000_000, help="Triangles per mesh")
+        parser.add_argument('--files', type=int, default=8, help="Distinct binary STL files for the pool run")
+        parser.add_argument('--items', type=int, default=200, help="Order items sharing those files")
+        parser.add_argument('--workers', type=int, default=None, help="Pool processes (default: one per CPU)")
+
+    def handle(self, *args, **options):
+        triangles = sphere(options['triangles'])
+        count = len(triangles)
+        exact = 4 / 3 * math.pi * RADIUS_MM ** 3 / 1000
+
+        with tempfile.TemporaryDirectory() as directory:
+            writers = {'stl-binary': write_binary_stl, 'stl-ascii': write_ascii_stl, 'obj': write_obj}
+            for name, write in writers.items():
+                path = os.path.join(directory, f'{name}.obj' if name == 'obj' else f'{name}.stl')
+                write(path, triangles)
+                with Stopwatch() as run:
+                    result = analyze_file(path)
+                self.stdout.write(
+                    f"{name:<11} {count} triangles {os.path.getsize(path) / 1e6:7.1f} MB  {run.elapsed * 1000:8.1f}ms  "
+                    f"{rate(count, run.elapsed) / 1e6:6.1f}M triangles/s  volume {result['volume_ml']:.3f} ml "
+                    f"(sphere {exact:.3f})"
+                )
+
+            paths = []
+            for n in range(options['files']):
+                path = os.path.join(directory, f'part-{n}.stl')
+                write_binary_stl(path, triangles * (1 + n / 10))
+                paths.append(path)
+
+            with scratch_database():
+                seed(options['items'])
+                items = list(OrderItem.objects.order_by('pk'))
+                for n, item in enumerate(items):
+                    item.local_file_path = paths[n % len(paths)]
+                OrderItem.objects.bulk_update(items, ['local_file_path'])
+
+                with Stopwatch() as run:
+                    summary = analyze_items(workers=options['workers'])
+
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
+        self.stdout.write(
+            f"pool: {run.elapsed:.2f}s, {rate(summary['triangles'], run.elapsed) / 1e6:.1f}M triangles/s"
+        )
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.benchmarking import Stopwatch, rate, scratch_database
+from apps.core.models import Material
+from apps.orders.ingest import ingest_orders
+from apps.orders.serializers import OrderCreateSerializer
+
+MATERIAL_CODES = ['FLGPGR05', 'FLGPCL05', 'FLTO2001', 'FLDUCL02']
+
+
+def make_payloads(prefix, order_count, items_per_order):
+    return [
+        {
+            'external_id': f'{prefix}-{n}',
+            'customer_email': f'customer{n}@example.com',
+            'customer_name': f'Customer {n}',
+            'shipping_address': '1 Main St',
+            'priority': 'STANDARD',
+            'items': [
+                {
+                    'model_file_url': f'https://files.example.com/{n}/{i}.stl',
+                    'model_file_name': f'part-{i}.stl',
+                    'quantity': 1 + i % 3,
+                    'material_code': MATERIAL_CODES[i % len(MATERIAL_CODES)],
+                    'layer_thickness_mm': '0.1',
+                }
+                for i in range(items_per_order)
+            ],
+        }
+        for n in range(order_count)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Compare rows/s of per-order OrderCreateSerializer saves against bulk ingest (uses a scratch DB)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=20, help='Items per order')
+
+    def handle(self, *args, **options):
+        order_count = options['orders']
+        items_per_order = options['items']
+        rows = order_count * (1 + items_per_order)
+
+        with scratch_database():
+            Material.objects.bulk_create([
+                Material(code=code, label=code, material_type='SLA') for code in MATERIAL_CODES
+            ])
+
+            payloads = make_payloads('single', order_count, items_per_order)
+            with Stopwatch() as single:
+                for payload in payloads:
+                    serializer = OrderCreateSerializer(data=payload)
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+
+            payloads = make_payloads('bulk', order_count, items_per_order)
+            with Stopwatch() as bulk:
+                results = ingest_orders(payloads)
+
+            failed = [result for result in results if result['status'] != 'CREATED']
+            if failed:
+                self.stderr.write(f"{len(failed)} orders failed bulk ingest: {failed[0]['errors']}")
+
+        self.stdout.write(f"{order_count} orders x {items_per_order} items ({rows} rows)")
+        self.stdout.write(f"  per-order create: {single.elapsed:8.2f}s  {rate(rows, single.elapsed):10.0f} rows/s")
+        self.stdout.write(f"  bulk ingest:      {bulk.elapsed:8.2f}s  {rate(rows, bulk.elapsed):10.0f} rows/s")
+        self.stdout.write(f"  speedup:          {single.elapsed / bulk.elapsed:8.1f}x")
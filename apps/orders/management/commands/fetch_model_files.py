@@ -0,0 +1,20 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.filestore import evict, fetch_model_files
+
+
+class Command(BaseCommand):
+    help = "Download the model files of open order items into the local file store, then evict to the disk budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None, help='Parallel downloads')
+        parser.add_argument('--budget-gb', type=float, default=None, help='Disk budget (default: MODEL_FILE_STORE_BUDGET_GB)')
+
+    def handle(self, *args, **options):
+        summary = asyncio.run(fetch_model_files(concurrency=options['concurrency']))
+        budget = options['budget_gb']
+        summary.update(evict(budget_bytes=None if budget is None else int(budget * 1e9)))
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.orders.progress import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every order's progress counters and derived status from batches, "
+        "print jobs, QC results, failures and shipments"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what is out of date, change nothing')
+
+    def handle(self, *args, **options):
+        summary = rebuild(dry_run=options['dry_run'])
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
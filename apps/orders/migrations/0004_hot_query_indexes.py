@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_alter_orderitem_layer_thickness_mm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'priority', 'due_date'], name='order_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.1.2 on 2026-10-17 09:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelFile',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('extension', models.CharField(blank=True, max_length=10)),
+                ('size_bytes', models.BigIntegerField()),
+                ('stored', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bounding_box_x', models.FloatField(null=True)),
+                ('bounding_box_y', models.FloatField(null=True)),
+                ('bounding_box_z', models.FloatField(null=True)),
+                ('volume_ml', models.FloatField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('stored', True)), fields=['last_used_at'], name='modelfile_lru_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='model_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='orders.modelfile'),
+        ),
+        migrations.CreateModel(
+            name='ModelFileSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=2000, unique=True)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+                ('model_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sources', to='orders.modelfile')),
+            ],
+        ),
+    ]
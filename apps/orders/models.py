@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 
 class Order(models.Model):
     """Order received from now.formlabs.com"""
@@ -20,6 +21,9 @@ class Order(models.Model):
         ('RUSH', 'Rush'),
         ('EXPEDITED', 'Expedited'),
     ]
+
+    # Higher is more urgent; shared by batching and scheduling
+    PRIORITY_RANK = {'STANDARD': 0, 'RUSH': 1, 'EXPEDITED': 2}
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     external_id = models.CharField(max_length=100, unique=True)  # From web app
@@ -33,11 +37,27 @@ class Order(models.Model):
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='STANDARD')
     due_date = models.DateTimeField(null=True)
     
-    received_at = models.DateTimeField(auto_now_add=True)
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
     shipped_at = models.DateTimeField(null=True)
     
     raw_payload = models.JSONField(null=True)  # Original request from web app
 
+    # Progress rollup: sums of the item counters below, maintained by
+    # orders.progress, which also derives status from them
+    quantity = models.PositiveIntegerField(default=0)
+    quantity_batched = models.PositiveIntegerField(default=0)
+    quantity_printing = models.PositiveIntegerField(default=0)
+    quantity_printed = models.PositiveIntegerField(default=0)
+    quantity_completed = models.PositiveIntegerField(default=0)
+    quantity_failed = models.PositiveIntegerField(default=0)
+    quantity_shipped = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Open orders by urgency: batch formation, dashboards
+            models.Index(fields=['status', 'priority', 'due_date'], name='order_queue_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     """Line item in an order"""
@@ -47,11 +67,14 @@ class OrderItem(models.Model):
     model_file_url = models.URLField()
     model_file_name = models.CharField(max_length=255)
     local_file_path = models.CharField(max_length=500, blank=True)
+    model_file = models.ForeignKey(
+        'ModelFile', on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items'
+    )
     
     # What they want
     quantity = models.PositiveIntegerField()
     material = models.ForeignKey('core.Material', on_delete=models.PROTECT)
-    layer_thickness_mm = models.CharField(max_length=20)
+    layer_thickness_mm = models.DecimalField(max_digits=5, decimal_places=3)
     
     # Geometry (populated after file analysis)
     bounding_box_x = models.FloatField(null=True)
@@ -59,9 +82,45 @@ class OrderItem(models.Model):
     bounding_box_z = models.FloatField(null=True)
     volume_ml = models.FloatField(null=True)
     
-    # Progress tracking
-    quantity_completed = models.PositiveIntegerField(default=0)
+    # Progress tracking, maintained by orders.progress (see there for sources)
+    quantity_batched = models.PositiveIntegerField(default=0)
+    quantity_printing = models.PositiveIntegerField(default=0)
+    quantity_printed = models.PositiveIntegerField(default=0)
+    quantity_completed = models.PositiveIntegerField(default=0)  # passed QC
+    quantity_failed = models.PositiveIntegerField(default=0)
+    quantity_shipped = models.PositiveIntegerField(default=0)
     
     @property
     def quantity_remaining(self):
-        return self.quantity - self.quantity_completed
\ No newline at end of file
+        return self.quantity - self.quantity_completed
+
+
+class ModelFile(models.Model):
+    """A downloaded model file in the content-addressed store (orders.filestore)"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    extension = models.CharField(max_length=10, blank=True)  # '.stl', '.obj'
+    size_bytes = models.BigIntegerField()
+
+    # False once evicted; the row and its geometry are kept
+    stored = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    # Geometry, analysed once per content (orders.analysis)
+    bounding_box_x = models.FloatField(null=True)
+    bounding_box_y = models.FloatField(null=True)
+    bounding_box_z = models.FloatField(null=True)
+    volume_ml = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            # Eviction, least recently used first
+            models.Index(fields=['last_used_at'], condition=models.Q(stored=True), name='modelfile_lru_idx'),
+        ]
+
+
+class ModelFileSource(models.Model):
+    """URL -> content index: a URL seen before is never downloaded again"""
+    url = models.URLField(max_length=2000, unique=True)
+    model_file = models.ForeignKey(ModelFile, on_delete=models.CASCADE, related_name='sources')
+    fetched_at = models.DateTimeField(auto_now=True)
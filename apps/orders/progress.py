@@ -0,0 +1,255 @@
+# orders/progress.py
+"""
+Order progress rollup.
+
+Every OrderItem carries counters for how much of it has reached each
+stage; every Order carries the same counters summed over its items, the
+total quantity ordered and a status derived from them. Reading how far
+along an order is costs one row instead of a walk through BatchItem ->
+PrintJobItem -> QCItemResult -> ShipmentItem.
+
+    quantity_batched    BatchItem.quantity, reprints excluded
+    quantity_printing   PrintJobItem.quantity on PRINTING jobs
+    quantity_printed    PrintJobItem.quantity on COMPLETED jobs
+    quantity_completed  QCItemResult.quantity_passed
+    quantity_failed     FailedPartRecord.quantity
+    quantity_shipped    ShipmentItem.quantity on SHIPPED / DELIVERED shipments
+
+Writers report changes with record(), which applies them to the items
+and refreshes their orders in one transaction; a few parts cost five
+queries. Single saves and deletes (the QC results endpoint included) are
+picked up by receivers (orders.signals) and run in the saving
+transaction; bulk writes bypass signals, so batching.engine and
+qc.results call record() themselves.
+
+recount() recomputes given items from the tables above with aggregate
+queries, for deletes that cascade too far to follow change by change;
+rebuild() does it for everything (manage.py rebuild_order_progress) and
+repairs any drift.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from apps.batching.models import BatchItem
+from apps.production.models import FailedPartRecord, PrintJobItem
+from apps.qc.models import QCItemResult
+from apps.shipping.models import ShipmentItem
+from .models import Order, OrderItem
+
+COUNTERS = [
+    'quantity_batched',
+    'quantity_printing',
+    'quantity_printed',
+    'quantity_completed',
+    'quantity_failed',
+    'quantity_shipped',
+]
+
+# The counter a print job's parts count towards, by job status
+JOB_COUNTERS = {'PRINTING': 'quantity_printing', 'COMPLETED': 'quantity_printed'}
+
+# Order also stores the quantity ordered, summed like the counters
+ORDER_COUNTERS = ['quantity', *COUNTERS]
+
+SHIPPED_STATUSES = ['SHIPPED', 'DELIVERED']
+
+# Orders whose status is never derived
+MANUAL_ORDER_STATUSES = ['CANCELLED']
+
+# Items per UPDATE in record()
+RECORD_BATCH_SIZE = 1000
+
+
+def changes():
+    """An empty {order_item_id: Counter({counter: change})} for record()"""
+    return defaultdict(Counter)
+
+
+def derived_status():
+    """
+    Order.status as a CASE over the order's own counters. An order with
+    quantity left to batch stays RECEIVED / PROCESSING / IN_PRODUCTION,
+    the states batch formation picks items from.
+    """
+    return Case(
+        When(quantity__gt=0, quantity_shipped__gte=F('quantity'), then=Value('SHIPPED')),
+        When(quantity__gt=0, quantity_completed__gte=F('quantity'), then=Value('PACKING')),
+        When(
+            quantity_batched__gte=F('quantity'),
+            quantity_printing=0,
+            quantity_printed__gt=F('quantity_completed') + F('quantity_failed'),
+            then=Value('QC')
+        ),
+        When(Q(quantity_printing__gt=0) | Q(quantity_printed__gt=0), then=Value('IN_PRODUCTION')),
+        When(quantity_batched__gt=0, then=Value('PROCESSING')),
+        default=Value('RECEIVED'),
+    )
+
+
+def _item_total(field):
+    return Coalesce(
+        Subquery(
+            OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+            .values('order').annotate(total=Sum(field)).values('total')
+        ),
+        0
+    )
+
+
+def _sum_items(orders):
+    orders.update(**{counter: _item_total(counter) for counter in ORDER_COUNTERS})
+
+
+def _derive_status(orders):
+    orders.exclude(status__in=MANUAL_ORDER_STATUSES).update(status=derived_status())
+    orders.filter(status='SHIPPED', shipped_at__isnull=True).update(shipped_at=timezone.now())
+
+
+def refresh_orders(orders):
+    """Re-sum the counters of the `orders` queryset from their items and derive their status"""
+    _sum_items(orders)
+    _derive_status(orders)
+
+
+def _shift(counter, deltas):
+    """counter + change per id, one WHEN per distinct change (there are few), never below zero"""
+    ids_by_change = defaultdict(list)
+    for item_id, change in deltas.items():
+        ids_by_change[change].append(item_id)
+    return Greatest(
+        F(counter) + Case(
+            *(When(id__in=ids, then=Value(change)) for change, ids in ids_by_change.items()),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        0
+    )
+
+
+def record(item_changes):
+    """
+    Apply {order_item_id: {counter: change}} to the items and refresh
+    their orders. Counters are clamped at zero; rebuild() corrects drift.
+    """
+    item_changes = {
+        item_id: {counter: change for counter, change in counts.items() if change}
+        for item_id, counts in item_changes.items()
+    }
+    item_changes = [(item_id, counts) for item_id, counts in item_changes.items() if counts]
+    if not item_changes:
+        return
+
+    with transaction.atomic():
+        order_ids = set()
+        for start in range(0, len(item_changes), RECORD_BATCH_SIZE):
+            chunk = dict(item_changes[start:start + RECORD_BATCH_SIZE])
+            updates = {}
+            for counter in COUNTERS:
+                deltas = {item_id: counts[counter] for item_id, counts in chunk.items() if counter in counts}
+                if deltas:
+                    updates[counter] = _shift(counter, deltas)
+            items = OrderItem.objects.filter(id__in=chunk.keys())
+            items.update(**updates)
+            order_ids.update(items.values_list('order_id', flat=True))
+        refresh_orders(Order.objects.filter(id__in=order_ids))
+
+
+def job_changes(job_id, before, after):
+    """Changes for print job `job_id` moving from status `before` to `after`"""
+    item_changes = changes()
+    lost, gained = JOB_COUNTERS.get(before), JOB_COUNTERS.get(after)
+    if lost == gained:
+        return item_changes
+    parts = PrintJobItem.objects.filter(job_id=job_id).values_list('batch_item__order_item_id', 'quantity')
+    for order_item_id, quantity in parts:
+        if lost:
+            item_changes[order_item_id][lost] -= quantity
+        if gained:
+            item_changes[order_item_id][gained] += quantity
+    return item_changes
+
+
+def shipment_changes(shipment_id, before, after):
+    """Changes for shipment `shipment_id` moving from status `before` to `after`"""
+    item_changes = changes()
+    sign = (after in SHIPPED_STATUSES) - (before in SHIPPED_STATUSES)
+    if sign:
+        for order_item_id, quantity in ShipmentItem.objects.filter(shipment_id=shipment_id).values_list(
+            'order_item_id', 'quantity'
+        ):
+            item_changes[order_item_id]['quantity_shipped'] += sign * quantity
+    return item_changes
+
+
+# counter -> (rows it sums, path from the row to its OrderItem, summed field)
+SOURCES = {
+    'quantity_batched': (BatchItem.objects.filter(is_reprint=False), 'order_item', 'quantity'),
+    'quantity_printing': (
+        PrintJobItem.objects.filter(job__status='PRINTING'), 'batch_item__order_item', 'quantity'
+    ),
+    'quantity_printed': (
+        PrintJobItem.objects.filter(job__status='COMPLETED'), 'batch_item__order_item', 'quantity'
+    ),
+    'quantity_completed': (QCItemResult.objects.all(), 'print_job_item__batch_item__order_item', 'quantity_passed'),
+    'quantity_failed': (FailedPartRecord.objects.all(), 'order_item', 'quantity'),
+    'quantity_shipped': (
+        ShipmentItem.objects.filter(shipment__status__in=SHIPPED_STATUSES), 'order_item', 'quantity'
+    ),
+}
+
+
+def _source_total(counter):
+    rows, path, field = SOURCES[counter]
+    return Coalesce(
+        Subquery(
+            rows.filter(**{path: OuterRef('pk')}).order_by()
+            .values(path).annotate(total=Sum(field)).values('total')
+        ),
+        0
+    )
+
+
+def recount(items):
+    """Recompute the counters of the `items` queryset from the source tables and refresh their orders"""
+    with transaction.atomic():
+        items.update(**{counter: _source_total(counter) for counter in COUNTERS})
+        refresh_orders(Order.objects.filter(id__in=items.values('order_id')))
+
+
+def rebuild(dry_run=False):
+    """
+    Recompute every counter and derived status from the source tables.
+    Returns how many items and orders were out of date.
+
+    With dry_run=True the counts are reported and nothing is changed.
+    """
+    with transaction.atomic():
+        totals = {counter: _source_total(counter) for counter in COUNTERS}
+        items_stale = OrderItem.objects.alias(
+            **{f'actual_{counter}': total for counter, total in totals.items()}
+        ).exclude(**{counter: F(f'actual_{counter}') for counter in COUNTERS}).count()
+        OrderItem.objects.update(**totals)
+
+        orders = Order.objects.all()
+        orders_stale = orders.alias(
+            **{f'actual_{counter}': _item_total(counter) for counter in ORDER_COUNTERS}
+        ).exclude(**{counter: F(f'actual_{counter}') for counter in ORDER_COUNTERS}).count()
+        _sum_items(orders)
+        statuses_changed = (
+            orders.exclude(status__in=MANUAL_ORDER_STATUSES).exclude(status=derived_status()).count()
+        )
+        _derive_status(orders)
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return {
+        'order_items_corrected': items_stale,
+        'orders_corrected': orders_stale,
+        'statuses_changed': statuses_changed,
+    }
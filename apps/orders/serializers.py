@@ -2,11 +2,12 @@
 
 from rest_framework import serializers
 from .models import Order, OrderItem
-from core.serializers import MaterialSerializer
+from apps.core.reference import reference_data
+from apps.core.serializers import ReferenceField
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    material = MaterialSerializer(read_only=True)
+    material = ReferenceField('material', source='material_id')
     material_code = serializers.CharField(write_only=True)
     quantity_remaining = serializers.ReadOnlyField()
     
@@ -15,13 +16,39 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'model_file_url', 'model_file_name', 'quantity',
             'material', 'material_code', 'layer_thickness_mm',
-            'quantity_completed', 'quantity_remaining'
+            'quantity_batched', 'quantity_printing', 'quantity_printed',
+            'quantity_completed', 'quantity_failed', 'quantity_shipped',
+            'quantity_remaining'
         ]
+        # Maintained by orders.progress
+        read_only_fields = [
+            'quantity_batched', 'quantity_printing', 'quantity_printed',
+            'quantity_completed', 'quantity_failed', 'quantity_shipped'
+        ]
+
+    def validate_material_code(self, value):
+        # Checked against the reference cache, so bulk ingest costs no queries here
+        if reference_data.get('material', value) is None:
+            raise serializers.ValidationError(f"Unknown material_code: {value}")
+        return value
+
+    def validate(self, data):
+        """Some machine type must be able to print the material at this layer thickness"""
+        material_code = data.get('material_code')
+        layer = data.get('layer_thickness_mm')
+        if material_code is not None and layer is not None and not (
+            reference_data.compatibility().machine_types_for(material_code, layer)
+        ):
+            raise serializers.ValidationError({
+                'layer_thickness_mm': [f"No print setting for {material_code} at {layer} mm."]
+            })
+        return data
 
 
 class OrderListSerializer(serializers.ModelSerializer):
     """Lightweight serializer for list views"""
-    item_count = serializers.IntegerField(source='items.count', read_only=True)
+    # Annotated by OrderViewSet.get_queryset
+    item_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Order
@@ -40,7 +67,10 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'external_id', 'customer_email', 'customer_name',
             'shipping_address', 'status', 'priority', 'due_date',
-            'received_at', 'shipped_at', 'items'
+            'received_at', 'shipped_at',
+            'quantity', 'quantity_batched', 'quantity_printing', 'quantity_printed',
+            'quantity_completed', 'quantity_failed', 'quantity_shipped',
+            'items'
         ]
 
 
@@ -57,14 +87,46 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
+        # The rollup total is known up front, so the items go in with one
+        # bulk insert instead of refreshing the order once per item
+        order = Order.objects.create(
+            quantity=sum(item_data['quantity'] for item_data in items_data),
+            **validated_data
+        )
         
-        for item_data in items_data:
-            material_code = item_data.pop('material_code')
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                material_id=material_code,
+                material_id=item_data.pop('material_code'),
                 **item_data
             )
+            for item_data in items_data
+        ])
         
-        return order
\ No newline at end of file
+        return order
+
+
+class OrderBulkCreateSerializer(OrderCreateSerializer):
+    """
+    Per-order validation for bulk ingest.
+    external_id uniqueness is checked for the whole request at once by
+    orders.ingest, so the per-row DB validator is dropped. Material codes
+    are checked per item against the reference cache.
+    """
+
+    class Meta(OrderCreateSerializer.Meta):
+        extra_kwargs = {'external_id': {'validators': []}}
+
+
+class OrderBulkIngestSerializer(serializers.Serializer):
+    """Envelope for POST /order/bulk/"""
+    orders = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=5000
+    )
+
+
+class ForecastSerializer(serializers.Serializer):
+    """Options for GET /order/forecast/"""
+    include_on_track = serializers.BooleanField(default=False)
@@ -0,0 +1,188 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.batching.models import BatchItem
+from apps.production.models import FailedPartRecord, PrintJob, PrintJobItem
+from apps.qc.models import QCItemResult
+from apps.shipping.models import Shipment, ShipmentItem
+from . import progress
+from .ingest import recent_external_ids
+from .models import Order, OrderItem
+
+
+@receiver(post_delete, sender=Order)
+def forget_deleted_order(sender, instance, **kwargs):
+    # Keep the idempotency cache from pointing retries at a deleted order
+    recent_external_ids.discard(instance.external_id)
+
+
+# Progress rollup for single saves; bulk writers call progress.record()
+# themselves. Rows remember the values they were loaded with, so a save
+# applies only what changed. Deferred fields are never fetched.
+
+ROLLUP_FIELDS = {
+    BatchItem: ['order_item_id', 'quantity', 'is_reprint'],
+    FailedPartRecord: ['order_item_id', 'quantity'],
+    PrintJob: ['status'],
+    QCItemResult: ['print_job_item_id', 'quantity_passed'],
+    Shipment: ['status'],
+    ShipmentItem: ['order_item_id', 'quantity'],
+}
+
+
+def _snapshot(instance):
+    return {field: instance.__dict__.get(field) for field in ROLLUP_FIELDS[type(instance)]}
+
+
+def _loaded(instance, created=False):
+    """The values `instance` had in the database before this save; None for a new row"""
+    return None if created else getattr(instance, '_progress_loaded', None)
+
+
+def _order_deleted(origin):
+    # The counters go with the order or item, so there is nothing to roll up
+    return isinstance(origin, (Order, OrderItem))
+
+
+def _record_quantities(before, after, counter, counts=lambda values: True):
+    """Move `counter` by the quantity of the `after` row minus that of the `before` row"""
+    item_changes = progress.changes()
+    for values, sign in ((before, -1), (after, 1)):
+        if values is not None and values['order_item_id'] is not None and counts(values):
+            item_changes[values['order_item_id']][counter] += sign * (values['quantity'] or 0)
+    progress.record(item_changes)
+
+
+@receiver(post_init, sender=BatchItem)
+@receiver(post_init, sender=FailedPartRecord)
+@receiver(post_init, sender=PrintJob)
+@receiver(post_init, sender=QCItemResult)
+@receiver(post_init, sender=Shipment)
+@receiver(post_init, sender=ShipmentItem)
+def remember_rollup_fields(sender, instance, **kwargs):
+    instance._progress_loaded = _snapshot(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, origin=None, **kwargs):
+    # Quantity ordered, or an item's counters leaving with it
+    if not isinstance(origin, Order):
+        progress.refresh_orders(Order.objects.filter(pk=instance.order_id))
+
+
+def _ordinary(values):
+    return not values['is_reprint']
+
+
+@receiver(post_save, sender=BatchItem)
+def batch_item_saved(sender, instance, created, **kwargs):
+    after = _snapshot(instance)
+    _record_quantities(_loaded(instance, created), after, 'quantity_batched', _ordinary)
+    instance._progress_loaded = after
+
+
+@receiver(post_delete, sender=BatchItem)
+def batch_item_deleted(sender, instance, origin=None, **kwargs):
+    if not _order_deleted(origin):
+        _record_quantities(_loaded(instance), None, 'quantity_batched', _ordinary)
+
+
+@receiver(post_save, sender=PrintJob)
+def print_job_saved(sender, instance, created, **kwargs):
+    before = _loaded(instance, created)
+    progress.record(progress.job_changes(instance.pk, before and before['status'], instance.status))
+    instance._progress_loaded = _snapshot(instance)
+
+
+@receiver(pre_delete, sender=PrintJob)
+def print_job_deleting(sender, instance, origin=None, **kwargs):
+    # The cascade takes the parts and their QC results with it;
+    # note whose counters to recount before they are gone
+    if not _order_deleted(origin):
+        instance._progress_items = list(
+            PrintJobItem.objects.filter(job=instance).values_list('batch_item__order_item_id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=PrintJob)
+def print_job_deleted(sender, instance, **kwargs):
+    item_ids = getattr(instance, '_progress_items', None)
+    if item_ids:
+        progress.recount(OrderItem.objects.filter(id__in=item_ids))
+
+
+def _passed_quantities(values, order_item_ids):
+    """A QCItemResult snapshot as the order item and quantity it counts towards"""
+    if values is None or values['print_job_item_id'] is None:
+        return None
+    part = values['print_job_item_id']
+    if part not in order_item_ids:
+        order_item_ids[part] = PrintJobItem.objects.filter(pk=part).values_list(
+            'batch_item__order_item_id', flat=True
+        ).first()
+    return {'order_item_id': order_item_ids[part], 'quantity': values['quantity_passed']}
+
+
+def _record_passed(before, after):
+    order_item_ids = {}  # PrintJobItem id -> order_item_id
+    _record_quantities(
+        _passed_quantities(before, order_item_ids), _passed_quantities(after, order_item_ids),
+        'quantity_completed'
+    )
+
+
+@receiver(post_save, sender=QCItemResult)
+def qc_item_result_saved(sender, instance, created, **kwargs):
+    # Single edits (QC results endpoint); qc.results records submissions itself
+    after = _snapshot(instance)
+    _record_passed(_loaded(instance, created), after)
+    instance._progress_loaded = after
+
+
+@receiver(post_delete, sender=QCItemResult)
+def qc_item_result_deleted(sender, instance, origin=None, **kwargs):
+    # A deleted print job is recounted as a whole (print_job_deleted)
+    if not _order_deleted(origin) and not isinstance(origin, PrintJob):
+        _record_passed(_loaded(instance), None)
+
+
+@receiver(post_save, sender=FailedPartRecord)
+def failed_part_saved(sender, instance, created, **kwargs):
+    after = _snapshot(instance)
+    _record_quantities(_loaded(instance, created), after, 'quantity_failed')
+    instance._progress_loaded = after
+
+
+@receiver(post_delete, sender=FailedPartRecord)
+def failed_part_deleted(sender, instance, origin=None, **kwargs):
+    if not _order_deleted(origin):
+        _record_quantities(_loaded(instance), None, 'quantity_failed')
+
+
+@receiver(post_save, sender=Shipment)
+def shipment_saved(sender, instance, created, **kwargs):
+    before = _loaded(instance, created)
+    progress.record(progress.shipment_changes(instance.pk, before and before['status'], instance.status))
+    instance._progress_loaded = _snapshot(instance)
+
+
+def _shipped(instance):
+    return Shipment.objects.filter(
+        pk=instance.shipment_id, status__in=progress.SHIPPED_STATUSES
+    ).exists()
+
+
+@receiver(post_save, sender=ShipmentItem)
+def shipment_item_saved(sender, instance, created, **kwargs):
+    after = _snapshot(instance)
+    if _shipped(instance):
+        _record_quantities(_loaded(instance, created), after, 'quantity_shipped')
+    instance._progress_loaded = after
+
+
+@receiver(post_delete, sender=ShipmentItem)
+def shipment_item_deleted(sender, instance, origin=None, **kwargs):
+    # A deleted shipment takes its items with it, and they are handled here
+    if not _order_deleted(origin) and _shipped(instance):
+        _record_quantities(_loaded(instance), None, 'quantity_shipped')
@@ -1,3 +1,453 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from apps.batching.engine import form_batches
+from apps.batching.models import BatchItem
+from apps.core.testing import make_order, reference_fixture
+from apps.production.models import FailedPartRecord, PrintJob, PrintJobItem
+from apps.qc.models import QCInspection, QCItemResult
+from apps.shipping.models import Shipment, ShipmentItem
+from . import ingest, progress
+from .filestore import ModelFileStore, evict, fetch_model_files, pending_downloads
+from .geometry import STL_FACET, MeshError, analyze_file, analyze_or_error
+from .ingest import RecentExternalIds, find_existing_orders, ingest_orders, recent_external_ids
+from .models import ModelFile, Order, OrderItem
+
+
+class FileStoreTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ModelFileStore(directory.name)
+        self.requests = []
+        self.transport = httpx.MockTransport(self.serve)
+
+    def serve(self, request):
+        self.requests.append(str(request.url))
+        return httpx.Response(200, content=f'solid {request.url.path}'.encode())
+
+    def fetch(self):
+        return async_to_sync(fetch_model_files)(store=self.store, transport=self.transport)
+
+    def analyse(self):
+        # As orders.analysis does once the geometry is known
+        OrderItem.objects.update(volume_ml=1.0)
+
+    def test_known_content_is_not_downloaded_again(self):
+        make_order('a', items=[(1, 'FLGPGR05', '0.1'), (2, 'FLGPGR05', '0.1')])
+        self.assertEqual(self.fetch()['urls_downloaded'], 2)
+
+        make_order('b', items=[(1, 'FLGPGR05', '0.1')])
+        OrderItem.objects.filter(order__external_id='b').update(
+            model_file_url=OrderItem.objects.filter(order__external_id='a').first().model_file_url
+        )
+        summary = self.fetch()
+
+        self.assertEqual(summary['urls_known'], 1)
+        self.assertEqual(summary['urls_downloaded'], 0)
+        self.assertEqual(len(self.requests), 2)
+        self.assertFalse(pending_downloads().exists())
+
+    def test_files_of_open_orders_are_not_evicted_and_fetched_again(self):
+        make_order('a', items=[(1, 'FLGPGR05', '0.1'), (1, 'FLGPGR05', '0.1')])
+        self.fetch()
+        self.analyse()
+
+        for _ in range(3):
+            self.assertEqual(evict(budget_bytes=0, store=self.store)['files_evicted'], 0)
+            self.fetch()
+
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(ModelFile.objects.filter(stored=True).count(), 2)
+
+    def test_files_of_shipped_orders_are_evicted(self):
+        order = make_order('a', items=[(1, 'FLGPGR05', '0.1')])
+        self.fetch()
+        self.analyse()
+        Order.objects.filter(pk=order.pk).update(status='SHIPPED')
+        model_file = ModelFile.objects.get()
+        path = self.store.path(model_file.sha256, model_file.extension)
+        self.assertTrue(path.exists())
+
+        summary = evict(budget_bytes=0, store=self.store)
+
+        self.assertEqual(summary['files_evicted'], 1)
+        self.assertFalse(path.exists())
+        self.assertEqual(OrderItem.objects.get().local_file_path, '')
+        self.assertFalse(ModelFile.objects.get().stored)
+        self.fetch()
+        self.assertEqual(len(self.requests), 1)
+
+
+def order_payload(external_id, quantity=2, material_code='FLGPGR05', layer_thickness_mm='0.100'):
+    return {
+        'external_id': external_id,
+        'customer_email': 'customer@example.com',
+        'customer_name': 'Customer',
+        'shipping_address': '1 Main St',
+        'items': [{
+            'model_file_url': f'https://files.example.com/{external_id}.stl',
+            'model_file_name': 'part.stl',
+            'quantity': quantity,
+            'material_code': material_code,
+            'layer_thickness_mm': layer_thickness_mm,
+        }],
+    }
+
+
+def missing_once(find):
+    """`find` seeing nothing the first time, as if it ran before a racing insert"""
+    calls = []
+
+    def side_effect(external_ids):
+        calls.append(external_ids)
+        return {} if len(calls) == 1 else find(external_ids)
+    return side_effect
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        recent_external_ids.clear()
+        self.addCleanup(recent_external_ids.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('ingest', password=None))
+
+    def test_bulk_ingest_reports_each_order(self):
+        results = ingest_orders([
+            order_payload('a'),
+            order_payload('b', material_code='NOPE'),
+            order_payload('a'),
+        ])
+
+        self.assertEqual([result['status'] for result in results], ['CREATED', 'FAILED', 'FAILED'])
+        self.assertIn('items', results[1]['errors'])
+        order = Order.objects.get()
+        self.assertEqual((order.external_id, order.quantity), ('a', 2))
+        self.assertEqual(order.items.get().material_id, 'FLGPGR05')
+
+    def test_item_no_machine_type_can_print_is_rejected(self):
+        [result] = ingest_orders([order_payload('a', layer_thickness_mm='0.025')])
+
+        self.assertEqual(result['status'], 'FAILED')
+        self.assertIn('No print setting', str(result['errors']['items'][0]['layer_thickness_mm']))
+        self.assertFalse(Order.objects.exists())
+
+    def test_idempotent_retry_is_a_no_op(self):
+        [first] = ingest_orders([order_payload('a')], idempotent=True)
+        [retry, duplicate] = ingest_orders([order_payload('a'), order_payload('a')], idempotent=True)
+
+        self.assertEqual(first['status'], 'CREATED')
+        self.assertEqual((retry['status'], retry['order_id']), ('EXISTING', first['order_id']))
+        self.assertEqual((duplicate['status'], duplicate['order_id']), ('EXISTING', first['order_id']))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_without_idempotency_fails(self):
+        ingest_orders([order_payload('a')])
+        [result] = ingest_orders([order_payload('a')])
+
+        self.assertEqual(result['status'], 'FAILED')
+        self.assertIn('external_id', result['errors'])
+
+    def test_cached_id_of_a_deleted_order_is_not_trusted(self):
+        ingest_orders([order_payload('a')], idempotent=True)
+        Order.objects.all().delete()
+
+        [result] = ingest_orders([order_payload('a')], idempotent=True)
+
+        self.assertEqual(result['status'], 'CREATED')
+        self.assertEqual(Order.objects.get().pk, result['order_id'])
+
+    def test_idempotent_post_answers_201_then_200(self):
+        path = '/api/orders/order/?idempotent=true'
+        created = self.client.post(path, order_payload('a'), format='json')
+        retried = self.client.post(path, order_payload('a'), format='json')
+
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(retried.status_code, 200)
+        self.assertEqual(retried.data['id'], created.data['id'])
+
+    def test_idempotent_post_of_a_deleted_order_creates_it_again(self):
+        path = '/api/orders/order/?idempotent=true'
+        self.client.post(path, order_payload('a'), format='json')
+        Order.objects.all().delete()
+
+        response = self.client.post(path, order_payload('a'), format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_idempotent_post_of_a_list_is_rejected(self):
+        response = self.client.post('/api/orders/order/?idempotent=true', [order_payload('a')], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+        self.assertFalse(Order.objects.exists())
+
+    def test_bulk_endpoint(self):
+        ingest_orders([order_payload('a')])
+
+        response = self.client.post(
+            '/api/orders/order/bulk/?idempotent=true',
+            {'orders': [order_payload('a'), order_payload('b')]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['existing']), (1, 1))
+
+    def bulk(self, payloads, idempotent=True):
+        path = '/api/orders/order/bulk/' + ('?idempotent=true' if idempotent else '')
+        return self.client.post(path, {'orders': payloads}, format='json')
+
+    def test_bulk_endpoint_reports_mixed_payloads(self):
+        stored = make_order('stored')
+        payloads = [
+            order_payload('new'), order_payload('stored'), order_payload('new'),
+            order_payload('bad', material_code='NOPE'),
+        ]
+
+        response = self.bulk(payloads)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [(row['external_id'], row['status']) for row in response.data['results']],
+            [('new', 'CREATED'), ('stored', 'EXISTING'), ('new', 'EXISTING'), ('bad', 'FAILED')],
+        )
+        self.assertEqual(response.data['results'][1]['order_id'], stored.pk)
+        self.assertEqual(response.data['results'][2]['order_id'], response.data['results'][0]['order_id'])
+        counts = (response.data['created'], response.data['existing'], response.data['failed'])
+        self.assertEqual(counts, (1, 2, 1))
+
+        again = self.bulk(payloads, idempotent=False)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual([row['status'] for row in again.data['results']], ['FAILED'] * 4)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_order_inserted_after_the_check_is_retried(self):
+        # Another request stores 'raced' between the existence check and the write
+        raced = make_order('raced')
+        with mock.patch.object(ingest, 'find_existing_orders', side_effect=missing_once(find_existing_orders)):
+            response = self.bulk([order_payload('raced'), order_payload('fresh')])
+
+        self.assertEqual(response.status_code, 201)
+        first, second = response.data['results']
+        self.assertEqual((first['status'], first['order_id']), ('EXISTING', raced.pk))
+        self.assertEqual(second['status'], 'CREATED')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_repeated_conflicts_are_reported_not_raised(self):
+        make_order('raced')
+        conflict = IntegrityError('UNIQUE constraint failed: orders_order.external_id')
+        with mock.patch.object(ingest, 'find_existing_orders', side_effect=missing_once(find_existing_orders)), \
+                mock.patch.object(ingest, '_write_orders', side_effect=conflict):
+            response = self.bulk([order_payload('raced'), order_payload('fresh')])
+
+        self.assertEqual(response.status_code, 200)
+        raced, fresh = response.data['results']
+        self.assertEqual(raced['status'], 'EXISTING')
+        self.assertEqual(fresh['status'], 'FAILED')
+        self.assertIn('concurrent write', fresh['errors']['external_id'][0])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_find_existing_orders_is_one_query(self):
+        first, second = make_order('a'), make_order('b')
+        recent_external_ids.put_many({'a': first.pk})
+
+        with self.assertNumQueries(1):
+            found = find_existing_orders(['a', 'b', 'c'])
+
+        self.assertEqual(found, {'a': first.pk, 'b': second.pk})
+        self.assertEqual(recent_external_ids.get_many(['b']), {'b': second.pk})
+
+    def test_recent_external_ids_drops_the_least_recently_used(self):
+        recent = RecentExternalIds(maxsize=2)
+        recent.put_many({'a': 1, 'b': 2})
+        recent.get_many(['a'])
+        recent.put_many({'c': 3})
+
+        self.assertEqual(recent.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+        recent.discard('a')
+        self.assertEqual(recent.get_many(['a']), {})
+
+
+class ProgressTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.order = make_order(items=[(4, 'FLGPGR05', '0.1')])
+        self.item = self.order.items.get()
+        form_batches()
+        self.batch_item = BatchItem.objects.get()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('progress', password=None))
+
+    def counters(self):
+        self.item.refresh_from_db()
+        self.order.refresh_from_db()
+        counts = {counter: getattr(self.item, counter) for counter in progress.COUNTERS}
+        self.assertEqual(counts, {counter: getattr(self.order, counter) for counter in progress.COUNTERS})
+        return {counter: count for counter, count in counts.items() if count}
+
+    def inspected_job(self):
+        job = PrintJob.objects.create(batch=self.batch_item.batch, job_name='job')
+        part = PrintJobItem.objects.create(job=job, batch_item=self.batch_item, quantity=4)
+        job.status = 'COMPLETED'
+        job.save()
+        return part, QCInspection.objects.create(print_job=job)
+
+    def test_counters_follow_the_item_through_production(self):
+        self.assertEqual(self.counters(), {'quantity_batched': 4})
+        self.assertEqual(self.order.quantity, 4)
+
+        job = PrintJob.objects.create(batch=self.batch_item.batch, job_name='job')
+        PrintJobItem.objects.create(job=job, batch_item=self.batch_item, quantity=4)
+        job.status = 'PRINTING'
+        job.save()
+        self.assertEqual(self.counters(), {'quantity_batched': 4, 'quantity_printing': 4})
+        self.assertEqual(self.order.status, 'IN_PRODUCTION')
+
+        job.status = 'COMPLETED'
+        job.save()
+        self.assertEqual(self.counters(), {'quantity_batched': 4, 'quantity_printed': 4})
+
+        shipment = Shipment.objects.create(order=self.order)
+        ShipmentItem.objects.create(shipment=shipment, order_item=self.item, quantity=4)
+        self.assertNotIn('quantity_shipped', self.counters())
+        shipment.status = 'SHIPPED'
+        shipment.save()
+        self.assertEqual(self.counters()['quantity_shipped'], 4)
+
+        self.assertEqual(progress.rebuild()['order_items_corrected'], 0)
+
+    def test_single_qc_result_writes_update_completed(self):
+        part, inspection = self.inspected_job()
+
+        result = QCItemResult.objects.create(inspection=inspection, print_job_item=part, quantity_passed=3)
+        self.assertEqual(self.counters()['quantity_completed'], 3)
+
+        response = self.client.patch(f'/api/qc/results/{result.pk}/', {'quantity_passed': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters()['quantity_completed'], 1)
+
+        self.client.delete(f'/api/qc/results/{result.pk}/')
+        self.assertNotIn('quantity_completed', self.counters())
+        self.assertEqual(progress.rebuild()['order_items_corrected'], 0)
+
+    def test_deleting_the_job_recounts_its_qc_results(self):
+        part, inspection = self.inspected_job()
+        QCItemResult.objects.create(inspection=inspection, print_job_item=part, quantity_passed=4)
+        self.assertEqual(self.counters()['quantity_completed'], 4)
+
+        part.job.delete()
+
+        self.assertEqual(self.counters(), {'quantity_batched': 4})
+
+    def test_single_failed_part_saves_update_failed(self):
+        failure = FailedPartRecord.objects.create(order_item=self.item, quantity=2, failure_type='PRINT_FAILED')
+        self.assertEqual(self.counters()['quantity_failed'], 2)
+
+        failure.quantity = 3
+        failure.save()
+        self.assertEqual(self.counters()['quantity_failed'], 3)
+
+        failure.delete()
+        self.assertNotIn('quantity_failed', self.counters())
+
+    def test_rebuild_repairs_drift(self):
+        OrderItem.objects.update(quantity_batched=0)
+
+        self.assertEqual(progress.rebuild()['order_items_corrected'], 1)
+        self.assertEqual(self.counters(), {'quantity_batched': 4})
+
+
+# A 10 mm cube from (5, 5, 5) as outward-wound quads
+CUBE_VERTICES = [
+    (5, 5, 5), (15, 5, 5), (15, 15, 5), (5, 15, 5),
+    (5, 5, 15), (15, 5, 15), (15, 15, 15), (5, 15, 15),
+]
+CUBE_QUADS = [(0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7)]
+CUBE_TRIANGLES = [
+    [CUBE_VERTICES[quad[0]], CUBE_VERTICES[quad[j]], CUBE_VERTICES[quad[j + 1]]]
+    for quad in CUBE_QUADS for j in (1, 2)
+]
+
+
+class GeometryTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def assertCube(self, result):
+        self.assertEqual(
+            [result['bounding_box_x'], result['bounding_box_y'], result['bounding_box_z']], [10.0, 10.0, 10.0]
+        )
+        self.assertAlmostEqual(result['volume_ml'], 1.0)
+
+    def test_binary_stl(self):
+        facets = np.zeros(len(CUBE_TRIANGLES), dtype=STL_FACET)
+        facets['vertices'] = CUBE_TRIANGLES
+        header = b'solid cube'.ljust(80) + len(facets).to_bytes(4, 'little')
+
+        result = analyze_file(self.write('cube.stl', header + facets.tobytes()))
+
+        self.assertCube(result)
+        self.assertEqual(result['triangles'], 12)
+
+    def test_ascii_stl(self):
+        lines = [b'solid cube']
+        for triangle in CUBE_TRIANGLES:
+            lines += [b'  facet normal 0 0 0', b'    outer loop']
+            lines += [b'      vertex %g %g %g' % vertex for vertex in triangle]
+            lines += [b'    endloop', b'  endfacet']
+        lines.append(b'endsolid cube')
+
+        self.assertCube(analyze_file(self.write('cube.stl', b'\n'.join(lines))))
+
+    def test_obj_polygons_and_relative_indices(self):
+        lines = [b'# cube', b'o cube']
+        lines += [b'v %g %g %g' % vertex for vertex in CUBE_VERTICES]
+        lines.append(b'vn 0 0 1')
+        # Half the faces by absolute index with texture/normal refs, half relative
+        for quad in CUBE_QUADS[:3]:
+            lines.append(b'f ' + b' '.join(b'%d/1/1' % (index + 1) for index in quad))
+        for quad in CUBE_QUADS[3:]:
+            lines.append(b'f ' + b' '.join(b'%d//1' % (index - 8) for index in quad))
+
+        result = analyze_file(self.write('cube.OBJ', b'\r\n'.join(lines)))
+
+        self.assertCube(result)
+        self.assertEqual(result['triangles'], 12)
+
+    def test_unreadable_files(self):
+        for name, content in [
+            ('empty.stl', b''),
+            ('text.stl', b'not a mesh'),
+            ('bad.stl', b'solid x\nvertex 1 2 nope\nvertex 1 2 3\nvertex 1 2 3\nendsolid'),
+            ('no-faces.obj', b'v 0 0 0\nv 1 0 0\nv 0 1 0\n'),
+            ('missing.obj', b'v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 4\n'),
+            ('edge.obj', b'v 0 0 0\nv 1 0 0\nf 1 2\n'),
+        ]:
+            with self.subTest(name=name), self.assertRaises(MeshError):
+                analyze_file(self.write(name, content))
+
+    def test_analyze_or_error_reports_the_reason(self):
+        self.assertEqual(analyze_or_error(self.write('empty.stl', b'')), (None, 'Empty file'))
+        result, error = analyze_or_error(os.path.join(self.directory, 'gone.stl'))
+        self.assertIsNone(result)
+        self.assertIn('gone.stl', error)
@@ -1,30 +1,74 @@
+from collections.abc import Mapping
+
 from django.shortcuts import render
 
-from rest_framework import viewsets
+from rest_framework import serializers, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.db.models import Count
+from apps.core.exports import ExportMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
+from apps.production.forecast import forecast_orders
+from .ingest import ingest_orders
 from .models import Order, OrderItem
 from .serializers import (
     OrderListSerializer,
     OrderDetailSerializer,
     OrderCreateSerializer,
-    OrderItemSerializer
+    OrderBulkIngestSerializer,
+    OrderItemSerializer,
+    ForecastSerializer
 )
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ExportMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Manages Orders.
     
     Queryset Optimization:
-    - prefetch_related('items__material'): Loads items and their specific material 
-      in one go to prevent N+1 queries when viewing details.
+    - prefetch_related('items'): Loads items in one go to prevent N+1 queries
+      when viewing details; their materials come from the reference cache.
+
+    GET /export/ streams one row per item (see core.exports).
     """
-    queryset = Order.objects.all().prefetch_related('items__material')
+    cursor_ordering = ('-received_at', '-id')
+    query_budget = {'list': 1, 'retrieve': 2}
+    queryset = Order.objects.all().prefetch_related('items')
+    export_date_field = 'received_at'
+    export_ordering = ('items__id',)
+    export_fields = {
+        'order_id': 'id',
+        'external_id': 'external_id',
+        'customer_email': 'customer_email',
+        'customer_name': 'customer_name',
+        'status': 'status',
+        'priority': 'priority',
+        'due_date': 'due_date',
+        'received_at': 'received_at',
+        'shipped_at': 'shipped_at',
+        'order_quantity': 'quantity',
+        'item_id': 'items__id',
+        'model_file_name': 'items__model_file_name',
+        'material': 'items__material_id',
+        'layer_thickness_mm': 'items__layer_thickness_mm',
+        'volume_ml': 'items__volume_ml',
+        'quantity': 'items__quantity',
+        'quantity_batched': 'items__quantity_batched',
+        'quantity_printed': 'items__quantity_printed',
+        'quantity_completed': 'items__quantity_completed',
+        'quantity_failed': 'items__quantity_failed',
+        'quantity_shipped': 'items__quantity_shipped',
+    }
 
     def get_serializer_class(self):
         if self.action == 'create':
             # Uses the heavy write-logic serializer (nested creation)
             return OrderCreateSerializer
+        if self.action == 'bulk':
+            return OrderBulkIngestSerializer
+        if self.action == 'forecast':
+            return ForecastSerializer
         if self.action == 'list':
             # Uses the lightweight serializer (no nested items)
             return OrderListSerializer
@@ -33,23 +77,87 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """
-        Optional: Optimize the 'item_count' for the list view.
+        The list view counts items in SQL instead of loading them.
         """
         queryset = super().get_queryset()
         if self.action == 'list':
             # This allows filtering/sorting by item count if needed in the future
-            return queryset.annotate(item_count_annotated=Count('items'))
+            return queryset.prefetch_related(None).annotate(item_count=Count('items'))
         return queryset
 
+    def _is_idempotent(self):
+        return self.request.query_params.get('idempotent', '').lower() in ('1', 'true', 'yes')
+
+    def create(self, request, *args, **kwargs):
+        """
+        With ?idempotent=true a retried POST (same external_id) returns the
+        stored order with 200 instead of failing, and nothing is re-validated
+        or re-written.
+        """
+        if not self._is_idempotent():
+            return super().create(request, *args, **kwargs)
+        if not isinstance(request.data, Mapping):
+            # Same answer as the non-idempotent create gives a JSON list
+            message = serializers.Serializer.default_error_messages['invalid'].format(
+                datatype=type(request.data).__name__
+            )
+            return Response({api_settings.NON_FIELD_ERRORS_KEY: [message]}, status=status.HTTP_400_BAD_REQUEST)
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+        [result] = ingest_orders([request.data], idempotent=True)
+        if result['status'] == 'FAILED':
+            return Response(result['errors'], status=status.HTTP_400_BAD_REQUEST)
+
+        order = self.get_queryset().get(pk=result['order_id'])
+        return Response(
+            OrderDetailSerializer(order).data,
+            status=status.HTTP_201_CREATED if result['status'] == 'CREATED' else status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Ingest many orders in one request (e.g. a storefront backlog flush).
+        Expects {"orders": [...]} where each entry has the same shape as a
+        single create. Responds with a per-order CREATED/FAILED report;
+        with ?idempotent=true already stored orders are reported as EXISTING.
+        """
+        serializer = OrderBulkIngestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = ingest_orders(serializer.validated_data['orders'], idempotent=self._is_idempotent())
+        counts = {'CREATED': 0, 'EXISTING': 0, 'FAILED': 0}
+        for result in results:
+            counts[result['status']] += 1
+
+        return Response(
+            {
+                'created': counts['CREATED'],
+                'existing': counts['EXISTING'],
+                'failed': counts['FAILED'],
+                'results': results,
+            },
+            status=status.HTTP_201_CREATED if counts['CREATED'] else status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """
+        Projected ready-to-ship time and due-date risk of open orders,
+        from a simulation of the current queue against the fleet. Lists
+        LATE, AT_RISK and NO_CAPACITY orders, least slack first; with
+        ?include_on_track=true every open order.
+        """
+        serializer = ForecastSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(forecast_orders(**serializer.validated_data))
+
+
+class OrderItemViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Direct access to Order Items.
-    Useful for updating specific item status (e.g. quantity_completed)
-    without re-saving the entire Order.
+    Progress counters are read-only here; they follow the batches, print
+    jobs, QC results and shipments (see orders.progress).
     """
-    queryset = OrderItem.objects.all().select_related('order', 'material')
+    query_budget = {'list': 1, 'retrieve': 1}
+    queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
-
-    # If you need to restrict what can be updated on an item level
-    # (e.g., only allow patching quantity_completed), you can override update/partial_update
@@ -0,0 +1,422 @@
+# production/analytics.py
+"""
+Fleet utilization and throughput analytics.
+
+Dashboards ask for a year of history at a time, so print activity is
+kept pre-aggregated in PrinterDayStats: one row per printer and day,
+rolled up from PrintJob and FailedPartRecord by rollup() (manage.py
+rollup_print_stats, from cron after midnight). Counts and sums per
+printer and local day are GROUP BY queries; the rest comes from two
+column extracts (values_list, no model instances) and NumPy:
+
+    started         jobs by the day they started                (database)
+    finished        COMPLETED / FAILED jobs by the day they ended, with
+                    the estimate against the actual print time  (database)
+    failed parts    FailedPartRecord quantity per failure_type, on the
+                    printer of the original job                 (database)
+    busy time       started_at -> completed_at of every started job (until
+                    now while PRINTING, at most MAX_PRINT_DAYS), split at
+                    midnight so a print spanning two days counts on both
+    samples         queued_at -> started_at of started jobs, print times
+                    of COMPLETED jobs, and failure_reason of FAILED ones
+
+Print times and queue waits are kept as raw samples, so percentiles over
+any range are exact.
+
+fleet_analytics() reads the stored rows of a range with one values_list()
+and computes today, which is never stored, live. Rows are reduced per
+group (printer or machine type) and per period (day, week or month) with
+np.add.at over integer codes, and percentiles for every group come from
+one sort. Utilization is busy time over the elapsed part of the range
+times the printers of the group.
+"""
+
+import json
+from collections import Counter
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, DurationField, F, Q, Sum, TextField
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from apps.fleet.models import Printer
+from .models import FailedPartRecord, PrintJob, PrinterDayStats
+
+# Jobs that started longer than this before a day are taken to have ended before it
+MAX_PRINT_DAYS = 7
+
+FINISHED_JOB_STATUSES = ['COMPLETED', 'FAILED']
+
+# failure_reason is free text; its first line, cut to this length, is the key
+FAILURE_REASON_CHARS = 100
+
+BUCKETS = ['day', 'week', 'month']
+GROUPS = ['printer', 'machine_type']
+PERCENTILES = [50, 90, 99]
+
+DEFAULT_RANGE_DAYS = 30
+
+ROLLUP_BATCH_SIZE = 1000
+
+# PrinterDayStats columns summed across rows, in this order
+SUM_FIELDS = [
+    'busy_s', 'jobs_started', 'jobs_completed', 'jobs_failed',
+    'estimated_jobs', 'estimate_s', 'estimate_error_s',
+]
+SAMPLE_FIELDS = ['print_times_s', 'queue_waits_s']
+COUNTER_FIELDS = ['failure_reasons', 'failed_parts']
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _epoch(values):
+    """Seconds since the epoch of datetimes, NaN for None"""
+    return np.array([np.nan if value is None else value.timestamp() for value in values], dtype=float)
+
+
+def _failure_key(reason):
+    lines = (reason or '').strip().splitlines()
+    return lines[0][:FAILURE_REASON_CHARS] if lines else 'unspecified'
+
+
+def _daily_totals(queryset, day_field, printer_field, *keys, **aggregates):
+    """`aggregates` of `queryset` per local day of `day_field`, printer and `keys`, as dicts"""
+    return (
+        queryset.annotate(cell_day=TruncDate(day_field), cell_printer=F(printer_field))
+        .values('cell_day', 'cell_printer', *keys)
+        .annotate(**aggregates)
+        .order_by()
+    )
+
+
+def daily_stats(first, last, now=None):
+    """Unsaved PrinterDayStats for the days `first` .. `last` (dates, inclusive)"""
+    now = now or timezone.now()
+    days = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+    edges = np.array([_midnight(day).timestamp() for day in [*days, last + timedelta(days=1)]])
+    start, end = _midnight(first), _midnight(last + timedelta(days=1))
+
+    started = list(PrintJob.objects.filter(
+        started_at__gte=start - timedelta(days=MAX_PRINT_DAYS), started_at__lt=end
+    ).values_list('printer_id', 'status', 'queued_at', 'started_at', 'completed_at'))
+    finished = list(PrintJob.objects.filter(
+        completed_at__gte=start, completed_at__lt=end, status__in=FINISHED_JOB_STATUSES
+    ).values_list('printer_id', 'status', 'started_at', 'completed_at', 'failure_reason'))
+
+    # Completed jobs with a print time and an estimate
+    estimated = Q(status='COMPLETED', started_at__lte=F('completed_at'), estimated_print_time_s__gt=0)
+    totals = [
+        *_daily_totals(
+            PrintJob.objects.filter(started_at__gte=start, started_at__lt=end), 'started_at', 'printer_id',
+            jobs_started=Count('id'),
+        ),
+        *_daily_totals(
+            PrintJob.objects.filter(completed_at__gte=start, completed_at__lt=end, status__in=FINISHED_JOB_STATUSES),
+            'completed_at', 'printer_id',
+            jobs_completed=Count('id', filter=Q(status='COMPLETED')),
+            jobs_failed=Count('id', filter=Q(status='FAILED')),
+            estimated_jobs=Count('id', filter=estimated),
+            estimate_s=Sum('estimated_print_time_s', filter=estimated),
+            actual=Sum(F('completed_at') - F('started_at'), filter=estimated, output_field=DurationField()),
+        ),
+    ]
+    parts = list(_daily_totals(
+        FailedPartRecord.objects.filter(created_at__gte=start, created_at__lt=end), 'created_at',
+        'original_job__printer_id', 'failure_type', quantity=Sum('quantity'),
+    ))
+
+    printers = sorted(
+        {row[0] for rows in (started, finished) for row in rows} | {row['cell_printer'] for row in parts}, key=str
+    )
+    code = {printer_id: n for n, printer_id in enumerate(printers)}
+    shape = (len(days), len(printers))
+    sums = {field: np.zeros(shape) for field in SUM_FIELDS}
+    samples = {field: {} for field in SAMPLE_FIELDS}  # (day, printer) -> [seconds]
+    counters = {field: {} for field in COUNTER_FIELDS}  # (day, printer) -> Counter
+
+    def day_of(seconds):
+        return np.searchsorted(edges, seconds, side='right') - 1
+
+    def within(seconds):
+        return (seconds >= edges[0]) & (seconds < edges[-1])
+
+    def collect(target, day, printer, values):
+        for cell in zip(day.tolist(), printer.tolist(), values, strict=True):
+            target.setdefault(cell[:2], []).append(cell[2])
+
+    for row in totals:
+        cell = ((row['cell_day'] - first).days, code[row['cell_printer']])
+        for field in SUM_FIELDS:
+            if row.get(field):
+                sums[field][cell] += row[field]
+        if row.get('actual'):
+            sums['estimate_error_s'][cell] += row['actual'].total_seconds() - row['estimate_s']
+    for row in parts:
+        cell = ((row['cell_day'] - first).days, code[row['cell_printer']])
+        counters['failed_parts'].setdefault(cell, Counter())[row['failure_type']] += row['quantity']
+
+    if started:
+        printer_ids, statuses, queued, began, completed = zip(*started, strict=True)
+        printer = np.array([code[printer_id] for printer_id in printer_ids])
+        queued, began, completed = _epoch(queued), _epoch(began), _epoch(completed)
+        printing = np.array(statuses) == 'PRINTING'
+        still_printing = np.minimum(now.timestamp(), began + MAX_PRINT_DAYS * 86400)
+        ended = np.where(np.isnan(completed), np.where(printing, still_printing, began), completed)
+
+        # Busy time, each print cut into one piece per day it touches
+        low, high = np.clip(began, edges[0], edges[-1]), np.clip(ended, edges[0], edges[-1])
+        busy = high > low
+        low, high, busy_printer = low[busy], high[busy], printer[busy]
+        first_day = day_of(low)
+        spans = np.searchsorted(edges, high, side='left') - first_day
+        piece_day = np.repeat(first_day, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        overlap = (
+            np.minimum(np.repeat(high, spans), edges[piece_day + 1])
+            - np.maximum(np.repeat(low, spans), edges[piece_day])
+        )
+        np.add.at(sums['busy_s'], (piece_day, np.repeat(busy_printer, spans)), overlap)
+
+        day = day_of(began)
+        wait = began - queued
+        waited = within(began) & (wait >= 0)
+        collect(samples['queue_waits_s'], day[waited], printer[waited], np.rint(wait[waited]).astype(int).tolist())
+
+    if finished:
+        printer_ids, statuses, began, completed, reasons = zip(*finished, strict=True)
+        printer = np.array([code[printer_id] for printer_id in printer_ids])
+        day = day_of(_epoch(completed))
+        failed = np.array(statuses) == 'FAILED'
+
+        duration = _epoch(completed) - _epoch(began)
+        timed = ~failed & (duration >= 0)
+        collect(samples['print_times_s'], day[timed], printer[timed], np.rint(duration[timed]).astype(int).tolist())
+
+        for index in np.flatnonzero(failed).tolist():
+            cell = (int(day[index]), int(printer[index]))
+            counters['failure_reasons'].setdefault(cell, Counter())[_failure_key(reasons[index])] += 1
+
+    active = np.zeros(shape, dtype=bool)
+    for values in sums.values():
+        active |= values != 0
+    for cells in [*samples.values(), *counters.values()]:
+        for cell in cells:
+            active[cell] = True
+
+    machine_types = dict(Printer.objects.filter(id__in=[p for p in printers if p is not None]).values_list(
+        'id', 'machine_type_id'
+    ))
+    rows = []
+    for cell in zip(*np.nonzero(active), strict=True):
+        cell = (int(cell[0]), int(cell[1]))
+        printer_id = printers[cell[1]]
+        rows.append(PrinterDayStats(
+            day=days[cell[0]],
+            printer_id=printer_id,
+            machine_type_id=machine_types.get(printer_id),
+            **{field: float(values[cell]) for field, values in sums.items() if field.endswith('_s')},
+            **{field: int(values[cell]) for field, values in sums.items() if not field.endswith('_s')},
+            **{field: cells.get(cell, []) for field, cells in samples.items()},
+            **{field: dict(cells.get(cell, {})) for field, cells in counters.items()},
+        ))
+    return rows
+
+
+def rollup(first, last=None, now=None):
+    """
+    Replace the stored PrinterDayStats of `first` .. `last` (yesterday by
+    default). Today is never stored: it is not over yet.
+    """
+    now = now or timezone.now()
+    yesterday = timezone.localdate(now) - timedelta(days=1)
+    last = min(last or yesterday, yesterday)
+    if last < first:
+        return {'days': 0, 'rows': 0}
+
+    rows = daily_stats(first, last, now)
+    with transaction.atomic():
+        PrinterDayStats.objects.filter(day__gte=first, day__lte=last).delete()
+        PrinterDayStats.objects.bulk_create(rows, batch_size=ROLLUP_BATCH_SIZE)
+    return {'days': (last - first).days + 1, 'rows': len(rows)}
+
+
+def _period(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _period_end(period, bucket):
+    if bucket == 'week':
+        return period + timedelta(days=7)
+    if bucket == 'month':
+        return (period + timedelta(days=31)).replace(day=1)
+    return period + timedelta(days=1)
+
+
+def _column_json(texts):
+    """The stored JSON values of a column, decoded with one parse instead of one per row"""
+    return json.loads(f"[{','.join(texts)}]")
+
+
+class _Samples:
+    """A sample field of every row, flattened: the values and the row each came from"""
+
+    def __init__(self, lists):
+        lengths = np.fromiter(map(len, lists), dtype=int, count=len(lists))
+        self.values = np.fromiter(chain.from_iterable(lists), dtype=float, count=int(lengths.sum()))
+        self.rows = np.repeat(np.arange(len(lists)), lengths)
+
+
+def _grouped_percentiles(codes, size, values):
+    """
+    [{mean, p50, ...}] for each code 0 .. size - 1 of the `values`
+    labelled with `codes`: one sort for every group, then NumPy's
+    linear interpolation between the two nearest ranks
+    """
+    empty = {'mean': None, **{f'p{q}': None for q in PERCENTILES}}
+    if not len(values):
+        return [empty] * size
+    counts = np.bincount(codes, minlength=size)
+    ordered = values[np.lexsort((values, codes))]
+    starts = np.cumsum(counts) - counts
+    stats = {'mean': np.bincount(codes, weights=values, minlength=size) / np.maximum(counts, 1)}
+    for q in PERCENTILES:
+        position = starts + (counts - 1) * q / 100
+        low = np.clip(np.floor(position).astype(int), 0, len(ordered) - 1)
+        high = np.clip(np.ceil(position).astype(int), 0, len(ordered) - 1)
+        stats[f'p{q}'] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    return [
+        {name: round(float(column[index]), 1) for name, column in stats.items()} if counts[index] else empty
+        for index in range(size)
+    ]
+
+
+class _Reduction:
+    """Sums, sample percentiles and (optionally) counters of the rows sharing each code"""
+
+    def __init__(self, codes, size, numbers, samples, counters=None):
+        self.sums = np.zeros((size, numbers.shape[1]))
+        np.add.at(self.sums, codes, numbers)
+        self.percentiles = {
+            field: _grouped_percentiles(codes[sample.rows], size, sample.values)
+            for field, sample in samples.items()
+        }
+        self.counters = None
+        if counters is not None:
+            self.counters = {field: [Counter() for _ in range(size)] for field in COUNTER_FIELDS}
+            for field in COUNTER_FIELDS:
+                target = self.counters[field]
+                for row_code, counts in zip(codes.tolist(), counters[field], strict=True):
+                    if counts:
+                        target[row_code].update(counts)
+
+    def metrics(self, index, capacity_s):
+        busy, started, completed, failed, estimated, estimate, error = self.sums[index].tolist()
+        finished = completed + failed
+        metrics = {
+            'busy_hours': round(busy / 3600, 1),
+            'utilization': round(busy / capacity_s, 3) if capacity_s else None,
+            'jobs_started': int(started),
+            'jobs_completed': int(completed),
+            'jobs_failed': int(failed),
+            'failure_rate': round(failed / finished, 4) if finished else None,
+            'print_time_s': self.percentiles['print_times_s'][index],
+            'mean_estimated_print_time_s': round(estimate / estimated, 1) if estimated else None,
+            # Actual over estimated print time, jobs with an estimate only
+            'estimate_ratio': round((estimate + error) / estimate, 3) if estimate else None,
+            'queue_wait_s': self.percentiles['queue_waits_s'][index],
+        }
+        if self.counters is not None:
+            for field in COUNTER_FIELDS:
+                metrics[field] = dict(self.counters[field][index].most_common())
+        return metrics
+
+
+def fleet_analytics(since=None, until=None, bucket='day', group_by='printer', now=None):
+    """
+    Utilization, throughput, print time against estimate, failures and
+    queue waits for the days [since, until): fleet totals, one entry per
+    printer or machine type (`group_by`) and a series per `bucket`.
+    The last DEFAULT_RANGE_DAYS days by default.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    until = until or today + timedelta(days=1)
+    since = since or until - timedelta(days=DEFAULT_RANGE_DAYS)
+
+    # JSON columns come back as text and are decoded a column at a time
+    plain = ['day', 'printer_id', 'machine_type_id', *SUM_FIELDS]
+    encoded = [*SAMPLE_FIELDS, *COUNTER_FIELDS]
+    rows = list(
+        PrinterDayStats.objects.filter(day__gte=since, day__lt=min(until, today)).values_list(
+            *plain, *(Cast(field, TextField()) for field in encoded)
+        )
+    )
+    if since <= today < until:
+        rows += [
+            (*(getattr(row, field) for field in plain), *(json.dumps(getattr(row, field)) for field in encoded))
+            for row in daily_stats(today, today, now)
+        ]
+
+    fields = [*plain, *encoded]
+    columns = dict(zip(fields, zip(*rows, strict=True), strict=True)) if rows else {field: () for field in fields}
+    numbers = np.array([columns[field] for field in SUM_FIELDS], dtype=float).T.reshape(len(rows), len(SUM_FIELDS))
+    samples = {field: _Samples(_column_json(columns[field])) for field in SAMPLE_FIELDS}
+    counters = {field: _column_json(columns[field]) for field in COUNTER_FIELDS}
+
+    group_keys = {}
+    group_codes = np.array([
+        group_keys.setdefault(key, len(group_keys)) for key in columns[f'{group_by}_id']
+    ], dtype=int)
+    periods = {}
+    period_codes = np.array([
+        periods.setdefault(_period(day, bucket), len(periods)) for day in columns['day']
+    ], dtype=int)
+    everything = np.zeros(len(rows), dtype=int)
+
+    # Utilization: busy time over the elapsed part of the range, on every printer of the group
+    window_end = min(_midnight(until), now).timestamp()
+    printers = list(Printer.objects.values_list('id', 'machine_type_id'))
+
+    def elapsed(first_day, end_day):
+        return max(0.0, min(_midnight(end_day).timestamp(), window_end) - _midnight(first_day).timestamp())
+
+    fleet_capacity = len(printers) * elapsed(since, until)
+    group_capacity = np.zeros(len(group_keys))
+    for printer_id, machine_type_id in printers:
+        key = printer_id if group_by == 'printer' else machine_type_id
+        if key in group_keys:
+            group_capacity[group_keys[key]] += elapsed(since, until)
+
+    totals = _Reduction(everything, 1, numbers, samples, counters)
+    groups = _Reduction(group_codes, len(group_keys), numbers, samples, counters)
+    series = _Reduction(period_codes, len(periods), numbers, samples)
+
+    return {
+        'since': since,
+        'until': until,
+        'bucket': bucket,
+        'group_by': group_by,
+        'totals': totals.metrics(0, fleet_capacity),
+        'groups': [
+            {group_by: key, **groups.metrics(index, float(group_capacity[index]))}
+            for key, index in sorted(group_keys.items(), key=lambda item: str(item[0]))
+        ],
+        'series': [
+            {
+                'period': period,
+                **series.metrics(
+                    periods[period],
+                    len(printers) * elapsed(max(period, since), min(_period_end(period, bucket), until)),
+                ),
+            }
+            for period in sorted(periods)
+        ],
+    }
@@ -0,0 +1,322 @@
+# production/forecast.py
+"""
+Due-date risk forecast: when will each open order be ready to ship, and
+which ones will miss their due date?
+
+The remaining print work of the whole plant is gathered into units, each
+with a printer group (machine type, tank material, as the scheduler
+matches them), an urgency and a duration:
+
+    QUEUED / PRINTING jobs   already on a printer; they decide when it is free
+    PENDING / READY jobs     estimated_print_time_s
+    batches without jobs     one plate of DEFAULT_PRINT_TIME_S
+    unbatched quantity       its share of a full batch's plate (open items,
+                             and unrequeued failures as reprints)
+
+Units run in dispatch order within their group: priority, then
+deadline, longest first. A group of k printers is treated as one server
+k times as fast (a fluid approximation of the scheduler's list
+scheduling): a unit starts when the work ahead of it, plus what the
+printers still have to finish, is done. With the units sorted by group
+that is one segmented cumulative sum, so the whole plant is recomputed
+with a few NumPy passes and cheaply enough to run on every request.
+
+An order is ready FINISHING_TIME_S after its last unit ends.
+"""
+
+import math
+from collections import defaultdict
+from datetime import UTC, datetime
+
+import numpy as np
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from apps.batching.engine import DEFAULT_BATCH_CAPACITY, schedule_deadline
+from apps.batching.models import PrintBatch
+from apps.batching.reprints import CLOSED_ORDER_STATUSES, elevated_priority
+from apps.core.reference import reference_data
+from apps.fleet.models import Printer
+from apps.orders.models import Order, OrderItem
+from .models import FailedPartRecord, PrintJob, PrintJobItem
+from .scheduler import DEFAULT_PRINT_TIME_S, UNAVAILABLE_PRINTER_STATUSES
+
+# Post-processing, QC and packing after an order's last print ends
+FINISHING_TIME_S = 6 * 60 * 60
+
+# Orders projected to be ready less than this before their due date are at risk
+RISK_MARGIN_S = 12 * 60 * 60
+
+RISK_LEVELS = ['LATE', 'AT_RISK', 'ON_TRACK', 'NO_CAPACITY']
+
+# Waiting for a printer, in dispatch order
+WAITING_JOB_STATUSES = ['PENDING', 'READY']
+ASSIGNED_JOB_STATUSES = ['QUEUED', 'PRINTING']
+
+# Batches whose work is not yet a print job
+UNJOBBED_BATCH_STATUSES = ['COLLECTING', 'READY', 'SCHEDULED']
+
+
+class _Units:
+    """Columns of the work units, plus which orders each unit serves"""
+
+    def __init__(self):
+        self.group = []
+        self.rank = []
+        self.deadline = []
+        self.duration = []
+        self.end = []  # known end (assigned jobs), else nan
+        self.unit_of = []  # with order_of: one (unit, order) pair per order served
+        self.order_of = []
+
+    def add(self, group, rank, deadline, duration, orders, end=math.nan):
+        unit = len(self.group)
+        self.group.append(group)
+        self.rank.append(rank)
+        self.deadline.append(deadline.timestamp() if deadline else math.inf)
+        self.duration.append(duration)
+        self.end.append(end)
+        for order in orders:
+            self.unit_of.append(unit)
+            self.order_of.append(order)
+
+
+def _fleet(now):
+    """
+    (group index by (machine_type, material), printers per group,
+    seconds of committed work per group, end time per assigned job id)
+    """
+    printers = list(
+        Printer.objects.filter(is_connected=True, tank_material__isnull=False)
+        .exclude(status__in=UNAVAILABLE_PRINTER_STATUSES)
+        .values_list('id', 'machine_type_id', 'tank_material_id')
+    )
+    groups = {}
+    printer_group = {}
+    for printer_id, machine_type_id, material_id in printers:
+        printer_group[printer_id] = groups.setdefault((machine_type_id, material_id), len(groups))
+    printer_count = np.bincount(list(printer_group.values()), minlength=len(groups)).astype(np.float64)
+
+    # Per printer the running job first (PRINTING sorts before QUEUED),
+    # then the queue in the order it was dispatched
+    free_at = {}
+    job_end = {}
+    for job_id, printer_id, status, started_at, estimate in PrintJob.objects.filter(
+        status__in=ASSIGNED_JOB_STATUSES, printer__isnull=False
+    ).order_by('printer_id', 'status', 'queued_at').values_list(
+        'id', 'printer_id', 'status', 'started_at', 'estimated_print_time_s'
+    ):
+        duration = estimate or DEFAULT_PRINT_TIME_S
+        if status == 'PRINTING' and started_at is not None:
+            end = max(started_at.timestamp() + duration, free_at.get(printer_id, now))
+        else:
+            end = free_at.get(printer_id, now) + duration
+        free_at[printer_id] = job_end[job_id] = end
+
+    backlog = np.zeros(len(groups))
+    for printer_id, end in free_at.items():
+        if printer_id in printer_group:
+            backlog[printer_group[printer_id]] += max(end - now, 0)
+    return groups, printer_count, backlog, job_end
+
+
+def _orders_by(rows):
+    """{key: [order ids]} from (key, order id) rows"""
+    orders = defaultdict(list)
+    for key, order_id in rows:
+        orders[key].append(order_id)
+    return orders
+
+
+def _collect(orders, groups, printer_count, job_end):
+    """The plant's remaining print work as _Units; `orders` are the open order rows"""
+    rank = Order.PRIORITY_RANK
+    units = _Units()
+    open_orders = Order.objects.exclude(status__in=CLOSED_ORDER_STATUSES)
+    order_index = {order[0]: index for index, order in enumerate(orders)}
+
+    def group_of(machine_type_id, material_id):
+        return groups.get((machine_type_id, material_id), -1)
+
+    def indexes(order_ids):
+        return {order_index[order_id] for order_id in order_ids if order_id in order_index}
+
+    # Print jobs, on a printer or waiting for one
+    job_orders = _orders_by(
+        PrintJobItem.objects.filter(job__status__in=WAITING_JOB_STATUSES + ASSIGNED_JOB_STATUSES)
+        .values_list('job_id', 'batch_item__order_item__order_id').distinct()
+    )
+    for job_id, estimate, priority, deadline, machine_type_id, material_id in PrintJob.objects.filter(
+        status__in=WAITING_JOB_STATUSES + ASSIGNED_JOB_STATUSES
+    ).values_list(
+        'id', 'estimated_print_time_s',
+        'batch__priority', 'batch__must_schedule_by', 'batch__machine_type_id', 'batch__material_id'
+    ):
+        units.add(
+            group_of(machine_type_id, material_id), rank.get(priority, 0), deadline,
+            estimate or DEFAULT_PRINT_TIME_S, indexes(job_orders[job_id]), end=job_end.get(job_id, math.nan)
+        )
+
+    # Batches that are not print jobs yet
+    batches = PrintBatch.objects.filter(status__in=UNJOBBED_BATCH_STATUSES, jobs__isnull=True)
+    batch_orders = _orders_by(
+        PrintBatch.objects.filter(id__in=batches.values('id'))
+        .values_list('id', 'items__order_item__order_id').distinct()
+    )
+    for batch_id, priority, deadline, machine_type_id, material_id in batches.values_list(
+        'id', 'priority', 'must_schedule_by', 'machine_type_id', 'material_id'
+    ):
+        units.add(
+            group_of(machine_type_id, material_id), rank.get(priority, 0), deadline,
+            DEFAULT_PRINT_TIME_S, indexes(batch_orders[batch_id])
+        )
+
+    # Quantity no batch holds yet: it goes to the compatible group with
+    # the most printers, as batch formation prefers the biggest fleet
+    compatibility = reference_data.compatibility()
+    chosen = {}
+
+    def best_group(material_id, layer):
+        key = (material_id, layer)
+        if key not in chosen:
+            candidates = [group_of(code, material_id) for code in compatibility.machine_types_for(material_id, layer)]
+            candidates = [group for group in candidates if group >= 0]
+            chosen[key] = max(candidates, key=lambda group: printer_count[group], default=-1)
+        return chosen[key]
+
+    # Urgency comes from the order rows already loaded, so the item rows
+    # below carry no dates to convert
+    def add_parts(rows, reprint):
+        for order_id, material_id, layer, quantity in rows:
+            index = order_index.get(order_id)
+            if index is None:
+                continue
+            _, _, _, priority, due_date, received_at = orders[index]
+            if reprint:
+                priority = elevated_priority(priority)
+            units.add(
+                best_group(material_id, layer), rank.get(priority, 0),
+                schedule_deadline(priority, due_date, received_at),
+                quantity * DEFAULT_PRINT_TIME_S / DEFAULT_BATCH_CAPACITY, [index]
+            )
+
+    add_parts(
+        OrderItem.objects.filter(order__in=open_orders, quantity__gt=F('quantity_batched'))
+        .values('order_id', 'material_id', 'layer_thickness_mm')
+        .annotate(remaining=Sum(F('quantity') - F('quantity_batched')))
+        .values_list('order_id', 'material_id', 'layer_thickness_mm', 'remaining'),
+        reprint=False
+    )
+    add_parts(
+        FailedPartRecord.objects.filter(requeued=False, order_item__order__in=open_orders)
+        .values('order_item__order_id', 'order_item__material_id', 'order_item__layer_thickness_mm')
+        .annotate(quantity=Sum('quantity'))
+        .values_list(
+            'order_item__order_id', 'order_item__material_id', 'order_item__layer_thickness_mm', 'quantity'
+        ),
+        reprint=True
+    )
+    return units
+
+
+def _simulate(units, printer_count, backlog, now):
+    """End time (epoch seconds) of every unit; inf when no printer can run it"""
+    group = np.asarray(units.group, dtype=np.int64)
+    duration = np.asarray(units.duration, dtype=np.float64)
+    end = np.asarray(units.end, dtype=np.float64)
+
+    # Dispatch order within each group; assigned jobs keep their known end
+    waiting = np.flatnonzero(np.isnan(end) & (group >= 0))
+    if not len(waiting):
+        end[np.isnan(end)] = np.inf
+        return end
+    order = waiting[np.lexsort((
+        -duration[waiting],
+        np.asarray(units.deadline)[waiting],
+        -np.asarray(units.rank)[waiting],
+        group[waiting],
+    ))]
+    sorted_group = group[order]
+    sorted_duration = duration[order]
+
+    # Work ahead of each unit in its own group: a cumulative sum that
+    # restarts at every group boundary
+    ahead = np.cumsum(sorted_duration) - sorted_duration
+    boundaries = np.flatnonzero(np.diff(sorted_group)) + 1
+    segment_starts = np.concatenate(([0], boundaries))
+    segment_lengths = np.diff(np.concatenate((segment_starts, [len(order)])))
+    ahead -= np.repeat(ahead[segment_starts], segment_lengths)
+
+    start = now + (backlog[sorted_group] + ahead) / printer_count[sorted_group]
+    end[order] = start + sorted_duration
+    end[np.isnan(end)] = np.inf  # no printer group can run it
+    return end
+
+
+def forecast_orders(include_on_track=False):
+    """
+    Project when every open order will be ready to ship and rate its
+    due-date risk: LATE (projected after the due date), AT_RISK (within
+    RISK_MARGIN_S of it) or ON_TRACK. Orders no connected printer can
+    finish are reported as NO_CAPACITY, orders without a due date with
+    risk None.
+
+    Returns a summary and the orders, least slack first; ON_TRACK and
+    undated orders only with include_on_track=True.
+    """
+    generated_at = timezone.now()
+    now = generated_at.timestamp()
+
+    orders = list(
+        Order.objects.exclude(status__in=CLOSED_ORDER_STATUSES).values_list(
+            'id', 'external_id', 'status', 'priority', 'due_date', 'received_at'
+        )
+    )
+
+    groups, printer_count, backlog, job_end = _fleet(now)
+    units = _collect(orders, groups, printer_count, job_end)
+    unit_end = _simulate(units, printer_count, backlog, now)
+
+    # Each order is done when its last unit is
+    last_print = np.full(len(orders), now)
+    if units.unit_of:
+        np.maximum.at(last_print, np.asarray(units.order_of), unit_end[np.asarray(units.unit_of)])
+    ready_at = last_print + FINISHING_TIME_S
+    due = np.array([due_date.timestamp() if due_date else np.nan for _, _, _, _, due_date, _ in orders])
+    slack = due - ready_at
+
+    risk = np.full(len(orders), None, dtype=object)
+    dated = ~np.isnan(due)
+    risk[dated] = 'ON_TRACK'
+    risk[dated & (slack < RISK_MARGIN_S)] = 'AT_RISK'
+    risk[dated & (slack < 0)] = 'LATE'
+    risk[np.isinf(ready_at)] = 'NO_CAPACITY'
+
+    summary = {level: int(np.count_nonzero(risk == level)) for level in RISK_LEVELS}
+    flagged = np.isin(risk, ['LATE', 'AT_RISK', 'NO_CAPACITY'])
+    shown = np.arange(len(orders)) if include_on_track else np.flatnonzero(flagged)
+    # Least slack first; no capacity first of all, undated last
+    shown = shown[np.lexsort((np.nan_to_num(slack[shown], nan=np.inf, neginf=-np.inf), ~np.isinf(ready_at[shown])))]
+
+    def when(seconds):
+        return datetime.fromtimestamp(seconds, tz=UTC) if np.isfinite(seconds) else None
+
+    return {
+        'generated_at': generated_at,
+        'open_orders': len(orders),
+        'work_units': len(units.group),
+        **{level.lower(): count for level, count in summary.items()},
+        'orders': [
+            {
+                'order_id': orders[index][0],
+                'external_id': orders[index][1],
+                'status': orders[index][2],
+                'priority': orders[index][3],
+                'due_date': orders[index][4],
+                'projected_ready_at': when(ready_at[index]),
+                'slack_s': None if not np.isfinite(slack[index]) else float(slack[index]),
+                'risk': risk[index],
+            }
+            for index in shown
+        ],
+    }
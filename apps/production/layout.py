@@ -0,0 +1,220 @@
+# production/layout.py
+"""
+Local build-plate layout for print batches.
+
+Parts are packed by their axis-aligned bounding boxes with a skyline
+heuristic: each plate keeps a 1 mm resolution height map of how far back
+(+Y) the plate is filled at every X column. A part of width w can sit at
+column x on top of max(skyline[x:x+w]); every candidate x for a plate is
+evaluated at once with a NumPy sliding-window max, and the lowest
+(bottom-left) position wins. Parts may be rotated 90 degrees about Z.
+
+Only the resulting layout needs to go to PreFormServer; AUTO_LAYOUT is
+no longer required per batch.
+"""
+
+import math
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from django.db import transaction
+
+from .models import Scene, SceneModel
+
+DEFAULT_SPACING_MM = 2.0  # clearance kept between neighbouring parts
+
+BULK_BATCH_SIZE = 1000
+
+
+class _Plate:
+    """Skyline of one build plate"""
+
+    def __init__(self, width_mm, depth_mm):
+        self.depth = depth_mm
+        self.skyline = np.zeros(math.floor(width_mm), dtype=np.float64)
+
+    def lowest_fit(self, width_cells, depth):
+        """(x, y) of the lowest position that fits a width x depth footprint, or None"""
+        if width_cells > len(self.skyline) or self.skyline.min() + depth > self.depth:
+            return None
+        tops = sliding_window_view(self.skyline, width_cells).max(axis=1)
+        tops = np.where(tops + depth <= self.depth, tops, np.inf)
+        x = int(np.argmin(tops))  # ties resolve to the leftmost column
+        if tops[x] == np.inf:
+            return None
+        return x, float(tops[x])
+
+    def place(self, x, width_cells, top):
+        self.skyline[x:x + width_cells] = top
+
+
+def _lowest_option(index, plate, options):
+    """Best (plate, width_cells, depth, top, x, rotated) over the part's orientations"""
+    best = None
+    for width_cells, depth, rotated in options:
+        fit = plate.lowest_fit(width_cells, depth)
+        if fit and (best is None or fit[1] + depth < best[3]):
+            best = (index, width_cells, depth, fit[1] + depth, fit[0], rotated)
+    return best
+
+
+def pack_parts(sizes, plate_x, plate_y, plate_z, spacing_mm=DEFAULT_SPACING_MM):
+    """
+    Pack parts onto as few plates as possible.
+
+    sizes: array-like of shape (n, 3) with each part's bounding box (x, y, z) in mm.
+
+    Returns a dict of per-part arrays, in input order:
+        plate     plate index
+        x, y      centre of the part's footprint, origin at the centre of
+                  the build platform (the PreForm convention)
+        rotated   True when the part was turned 90 degrees about Z
+        in_bounds False for parts too large for the build volume; these are
+                  left on plate 0 at the origin for an operator to resolve
+    plus 'plate_count'.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 3)
+    count = len(sizes)
+    plate_index = np.zeros(count, dtype=np.int64)
+    centre_x = np.zeros(count)
+    centre_y = np.zeros(count)
+    rotated = np.zeros(count, dtype=bool)
+
+    # Footprints include the clearance gap; the packing grid is 1 mm
+    padded = sizes[:, :2] + spacing_mm
+    columns = math.floor(plate_x)
+    fits_plain = (np.ceil(padded[:, 0]) <= columns) & (padded[:, 1] <= plate_y)
+    fits_rotated = (np.ceil(padded[:, 1]) <= columns) & (padded[:, 0] <= plate_y)
+    in_bounds = (sizes[:, 2] <= plate_z) & (fits_plain | fits_rotated)
+
+    # Largest footprints first, then longest side
+    order = np.lexsort((-padded.max(axis=1), -padded.prod(axis=1)))
+    plates = []
+
+    for part in order:
+        if not in_bounds[part]:
+            continue
+        width, depth = padded[part]
+        options = []
+        if fits_plain[part]:
+            options.append((math.ceil(width), depth, False))
+        if fits_rotated[part] and width != depth:
+            options.append((math.ceil(depth), width, True))
+
+        best = None
+        for index, plate in enumerate(plates):
+            best = _lowest_option(index, plate, options)
+            if best is not None:
+                break  # first plate with room wins
+
+        if best is None:
+            plates.append(_Plate(plate_x, plate_y))
+            best = _lowest_option(len(plates) - 1, plates[-1], options)
+
+        index, width_cells, option_depth, top, x, turn = best
+        plates[index].place(x, width_cells, top)
+
+        footprint_x, footprint_y = (sizes[part, 1], sizes[part, 0]) if turn else (sizes[part, 0], sizes[part, 1])
+        plate_index[part] = index
+        rotated[part] = turn
+        centre_x[part] = x + spacing_mm / 2 + footprint_x / 2 - plate_x / 2
+        centre_y[part] = top - option_depth + spacing_mm / 2 + footprint_y / 2 - plate_y / 2
+
+    return {
+        'plate': plate_index,
+        'x': centre_x,
+        'y': centre_y,
+        'rotated': rotated,
+        'in_bounds': in_bounds,
+        'plate_count': max(len(plates), 1 if count else 0),
+    }
+
+
+def layout_batch(batch, spacing_mm=DEFAULT_SPACING_MM):
+    """
+    Lay out every part of a PrintBatch on plates of its machine type and
+    store one Scene per plate with a SceneModel per part.
+
+    A re-run replaces the batch's earlier layout: its scenes are deleted
+    (with their models) in the same transaction, except those a PrintJob
+    already prints from. Batch items without geometry (bounding box not
+    analysed yet) are skipped and counted. Returns the created scene ids
+    together with packing density and packing time.
+    """
+    machine_type = batch.machine_type
+    rows = list(
+        batch.items.values_list(
+            'id', 'quantity',
+            'order_item__bounding_box_x', 'order_item__bounding_box_y', 'order_item__bounding_box_z'
+        )
+    )
+
+    batch_item_ids = []
+    sizes = []
+    missing_geometry = 0
+    for batch_item_id, quantity, box_x, box_y, box_z in rows:
+        if None in (box_x, box_y, box_z):
+            missing_geometry += quantity
+            continue
+        batch_item_ids.extend([batch_item_id] * quantity)
+        sizes.extend([(box_x, box_y, box_z)] * quantity)
+
+    started = time.perf_counter()
+    packed = pack_parts(
+        sizes,
+        machine_type.build_volume_x,
+        machine_type.build_volume_y,
+        machine_type.build_volume_z,
+        spacing_mm=spacing_mm
+    )
+    packing_time_s = time.perf_counter() - started
+
+    scenes = [
+        Scene(
+            machine_type=machine_type,
+            material_id=batch.material_id,
+            layer_thickness_mm=batch.layer_thickness_mm,
+        )
+        for _ in range(packed['plate_count'])
+    ]
+    scene_models = [
+        SceneModel(
+            scene=scenes[packed['plate'][part]],
+            batch_item_id=batch_item_id,
+            position_x=float(packed['x'][part]),
+            position_y=float(packed['y'][part]),
+            orientation_z=90.0 if packed['rotated'][part] else 0.0,
+            in_bounds=bool(packed['in_bounds'][part]),
+        )
+        for part, batch_item_id in enumerate(batch_item_ids)
+    ]
+
+    with transaction.atomic():
+        # Lock the batch so concurrent re-runs replace rather than interleave
+        type(batch).objects.select_for_update().only('pk').get(pk=batch.pk)
+        _, deleted = Scene.objects.filter(
+            pk__in=SceneModel.objects.filter(batch_item__batch=batch).values('scene_id'),
+            printjob__isnull=True,
+        ).delete()
+        Scene.objects.bulk_create(scenes, batch_size=BULK_BATCH_SIZE)
+        SceneModel.objects.bulk_create(scene_models, batch_size=BULK_BATCH_SIZE)
+
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 3)
+    placed = sizes[packed['in_bounds']]
+    plate_area = machine_type.build_volume_x * machine_type.build_volume_y
+    plate_volume = plate_area * machine_type.build_volume_z
+    plate_count = packed['plate_count']
+
+    return {
+        'scene_ids': [scene.id for scene in scenes],
+        'scenes_replaced': deleted.get(Scene._meta.label, 0),
+        'plates': plate_count,
+        'parts_placed': len(placed),
+        'parts_out_of_bounds': int((~packed['in_bounds']).sum()),
+        'parts_missing_geometry': missing_geometry,
+        # Share of the plates' area / build volume covered by part bounding boxes
+        'footprint_density': float((placed[:, 0] * placed[:, 1]).sum() / (plate_area * plate_count)) if plate_count else 0.0,
+        'volume_density': float(placed.prod(axis=1).sum() / (plate_volume * plate_count)) if plate_count else 0.0,
+        'packing_time_s': packing_time_s,
+    }
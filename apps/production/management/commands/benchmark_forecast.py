@@ -0,0 +1,31 @@
+import statistics
+
+from django.core.management.base import BaseCommand
+
+from apps.core.benchmarking import Stopwatch, scratch_database
+from apps.core.management.commands.benchmark_indexes import seed_history
+from apps.production.forecast import forecast_orders
+
+
+class Command(BaseCommand):
+    help = "Seed a long-running floor and time the due-date risk forecast (uses a scratch DB)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=50_000, help="Print jobs to seed; other tables scale with it")
+        parser.add_argument('--repeat', type=int, default=10, help="Forecast runs; the median is reported")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            with Stopwatch() as seeding:
+                seed_history(options['jobs'])
+            self.stdout.write(f"seeded {options['jobs']} jobs and history in {seeding.elapsed:.1f}s")
+
+            timings = []
+            for _ in range(options['repeat']):
+                with Stopwatch() as run:
+                    result = forecast_orders()
+                timings.append(run.elapsed)
+
+        for key in ('open_orders', 'work_units', 'late', 'at_risk', 'on_track', 'no_capacity'):
+            self.stdout.write(f"{key}: {result[key]}")
+        self.stdout.write(f"forecast: {statistics.median(timings) * 1000:.1f}ms median of {options['repeat']}")
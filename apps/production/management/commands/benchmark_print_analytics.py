@@ -0,0 +1,87 @@
+import statistics
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.core.benchmarking import Stopwatch, scratch_database
+from apps.core.management.commands.benchmark_indexes import seed_history
+from apps.production.analytics import fleet_analytics, rollup
+from apps.production.models import FailedPartRecord, PrintJob
+
+FAILURE_REASONS = ['Resin tank empty', 'Adhesion failure', 'Support failure', '']
+
+
+def spread_over(days):
+    """Give the seeded jobs and failures queue, start and end times over the last `days` days"""
+    rng = np.random.default_rng(0)
+    now = timezone.now()
+    jobs = list(PrintJob.objects.only('id', 'status'))
+    started = rng.uniform(0, days * 86400, len(jobs))
+    waits = rng.exponential(2 * 3600, len(jobs))
+    estimates = rng.uniform(1, 10, len(jobs)) * 3600
+    actual = estimates * rng.normal(1.05, 0.1, len(jobs))
+    for job, start, wait, estimate, duration in zip(jobs, started, waits, estimates, actual):
+        if job.status in ('PENDING', 'READY'):
+            continue
+        if job.status in ('QUEUED', 'PRINTING'):
+            # Still on a printer: it went out within the last estimate
+            start = start % estimate
+        job.started_at = now - timedelta(seconds=float(start))
+        job.queued_at = job.started_at - timedelta(seconds=float(wait))
+        job.estimated_print_time_s = int(estimate)
+        if job.status == 'QUEUED':
+            job.started_at = None
+        if job.status in ('COMPLETED', 'FAILED'):
+            job.completed_at = min(job.started_at + timedelta(seconds=float(duration)), now)
+        if job.status == 'FAILED':
+            job.failure_reason = FAILURE_REASONS[int(rng.integers(len(FAILURE_REASONS)))]
+    PrintJob.objects.bulk_update(
+        jobs, ['started_at', 'queued_at', 'estimated_print_time_s', 'completed_at', 'failure_reason'], batch_size=1000
+    )
+    for start in range(0, FailedPartRecord.objects.count(), 1000):
+        pks = FailedPartRecord.objects.order_by('pk').values_list('pk', flat=True)[start:start + 1000]
+        FailedPartRecord.objects.filter(pk__in=list(pks)).update(
+            created_at=now - timedelta(seconds=float(rng.uniform(0, days * 86400)))
+        )
+
+
+class Command(BaseCommand):
+    help = "Seed a year of print history, roll it up and time the analytics endpoint's query (uses a scratch DB)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=50_000, help="Print jobs to seed; other tables scale with it")
+        parser.add_argument('--days', type=int, default=365, help="History the jobs are spread over")
+        parser.add_argument('--repeat', type=int, default=10, help="Analytics runs; the median is reported")
+
+    def handle(self, *args, **options):
+        days = options['days']
+        with scratch_database():
+            with Stopwatch() as seeding:
+                seed_history(options['jobs'])
+                spread_over(days)
+            self.stdout.write(f"seeded {options['jobs']} jobs over {days} days in {seeding.elapsed:.1f}s")
+
+            since = timezone.localdate() - timedelta(days=days)
+            with Stopwatch() as rolling:
+                summary = rollup(since)
+            self.stdout.write(
+                f"rollup: {summary['rows']} rows for {summary['days']} days in {rolling.elapsed:.1f}s"
+            )
+
+            for bucket, group_by in (('day', 'printer'), ('week', 'machine_type'), ('month', 'printer')):
+                timings = []
+                for _ in range(options['repeat']):
+                    with Stopwatch() as run:
+                        result = fleet_analytics(since=since, bucket=bucket, group_by=group_by)
+                    timings.append(run.elapsed)
+                self.stdout.write(
+                    f"analytics ({bucket}, {group_by}): {statistics.median(timings) * 1000:.1f}ms "
+                    f"median of {options['repeat']}"
+                )
+
+        totals = result['totals']
+        for key in ('utilization', 'jobs_completed', 'jobs_failed', 'failure_rate', 'estimate_ratio'):
+            self.stdout.write(f"{key}: {totals[key]}")
+        self.stdout.write(f"queue wait p50/p90: {totals['queue_wait_s']['p50']}s / {totals['queue_wait_s']['p90']}s")
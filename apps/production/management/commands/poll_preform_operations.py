@@ -0,0 +1,38 @@
+import asyncio
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.production.preform import DEFAULT_MAX_OPERATION_AGE, OperationPoller, PreFormClient
+
+
+class Command(BaseCommand):
+    help = "Keep IN_PROGRESS AsyncOperations in sync with PreFormServer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Poll a single time and exit')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--min-interval', type=float, default=1.0)
+        parser.add_argument('--max-interval', type=float, default=30.0)
+        parser.add_argument(
+            '--max-age-minutes', type=float, default=DEFAULT_MAX_OPERATION_AGE.total_seconds() / 60,
+            help='Fail operations that have not finished after this long'
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.poll(options))
+
+    async def poll(self, options):
+        async with PreFormClient() as client:
+            poller = OperationPoller(
+                client,
+                concurrency=options['concurrency'],
+                min_interval=options['min_interval'],
+                max_interval=options['max_interval'],
+                max_age=timedelta(minutes=options['max_age_minutes']),
+            )
+            if options['once']:
+                changed, failed = await poller.tick()
+                self.stdout.write(f"updated: {changed}  failed: {failed}")
+            else:
+                await poller.run()
@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.production.analytics import rollup
+
+
+class Command(BaseCommand):
+    help = "Roll print jobs and failed parts up into the daily per-printer summary behind the analytics endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=2, help='Recompute the last N complete days (jobs finished late are caught up)'
+        )
+        parser.add_argument('--since', type=date.fromisoformat, default=None, help='Recompute from this date (backfill)')
+
+    def handle(self, *args, **options):
+        first = options['since'] or timezone.localdate() - timedelta(days=options['days'])
+        summary = rollup(first)
+        for key, value in summary.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,28 @@
+import asyncio
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.production.scene_cache import cache_stats, evict
+
+
+class Command(BaseCommand):
+    help = "Hit rates of the PreFormServer scene result cache per operation type"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None, help='Only count operations from the last N days')
+        parser.add_argument('--max-entries', type=int, default=None, help='Evict down to this many entries first')
+
+    def handle(self, *args, **options):
+        if options['max_entries'] is not None:
+            evicted = asyncio.run(evict(options['max_entries']))
+            self.stdout.write(f"evicted: {evicted}")
+
+        since = None if options['days'] is None else timezone.now() - timedelta(days=options['days'])
+        for operation_type, stats in cache_stats(since=since).items():
+            hit_rate = '-' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+            self.stdout.write(
+                f"{operation_type:<13} lookups: {stats['lookups']}  hits: {stats['hits']}  "
+                f"hit rate: {hit_rate}  entries: {stats['entries']}"
+            )
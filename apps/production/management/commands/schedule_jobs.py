@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.production.scheduler import schedule_jobs
+
+
+class Command(BaseCommand):
+    help = "Assign READY print jobs to idle, compatible printers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Print the plan without dispatching')
+
+    def handle(self, *args, **options):
+        result = schedule_jobs(dry_run=options['dry_run'])
+
+        for entry in result['plan']:
+            self.stdout.write(
+                f"{entry['printer_id']:<20} {entry['start']:%Y-%m-%d %H:%M} -> {entry['end']:%H:%M}  "
+                f"{entry['job_name']}{'  LATE' if entry['late'] else ''}"
+            )
+        self.stdout.write(
+            f"dispatched: {result['dispatched']}  planned: {result['planned']}  "
+            f"makespan: {result['makespan_s'] / 3600:.1f}h  unschedulable: {len(result['unschedulable'])}  "
+            f"short of resin: {len(result['short_of_resin'])}"
+        )
@@ -0,0 +1,29 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0003_alter_scene_layer_thickness_mm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asyncoperation',
+            index=models.Index(condition=models.Q(('status', 'IN_PROGRESS')), fields=['created_at'], name='asyncop_in_progress_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='failedpartrecord',
+            index=models.Index(condition=models.Q(('requeued', False)), fields=['created_at'], name='failedpart_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printjob',
+            index=models.Index(condition=models.Q(('status__in', ['PENDING', 'READY', 'QUEUED', 'PRINTING'])), fields=['status', 'created_at'], name='printjob_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printjob',
+            index=models.Index(fields=['printer', 'status'], name='printjob_printer_status_idx'),
+        ),
+    ]
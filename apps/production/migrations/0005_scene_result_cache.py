@@ -0,0 +1,47 @@
+# Generated by Django 6.1.2 on 2026-10-17 09:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_printsetting_layer_thickness_mm'),
+        ('production', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asyncoperation',
+            name='cache_hit',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='asyncoperation',
+            name='cache_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='SceneResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parts_key', models.CharField(max_length=64)),
+                ('layer_thickness_mm', models.DecimalField(decimal_places=3, max_digits=5)),
+                ('operation_type', models.CharField(choices=[('AUTO_ORIENT', 'Auto Orient'), ('AUTO_SUPPORT', 'Auto Support'), ('AUTO_LAYOUT', 'Auto Layout'), ('IMPORT_MODEL', 'Import Model'), ('PRINT', 'Print'), ('SAVE_FORM', 'Save Form File')], max_length=30)),
+                ('result', models.JSONField(null=True)),
+                ('layer_count', models.IntegerField(null=True)),
+                ('volume_ml', models.FloatField(null=True)),
+                ('form_file_path', models.CharField(blank=True, max_length=500)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+                ('machine_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.machinetype')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.material')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='sceneresult_lru_idx')],
+                'constraints': [models.UniqueConstraint(fields=('parts_key', 'material', 'layer_thickness_mm', 'machine_type', 'operation_type'), name='sceneresult_unique_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.1.2 on 2026-10-17 09:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batching', '0005_hot_query_indexes'),
+        ('core', '0002_alter_printsetting_layer_thickness_mm'),
+        ('employees', '0001_initial'),
+        ('fleet', '0003_hot_query_indexes'),
+        ('production', '0005_scene_result_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrinterDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('busy_s', models.FloatField(default=0)),
+                ('jobs_started', models.PositiveIntegerField(default=0)),
+                ('jobs_completed', models.PositiveIntegerField(default=0)),
+                ('jobs_failed', models.PositiveIntegerField(default=0)),
+                ('print_times_s', models.JSONField(default=list)),
+                ('queue_waits_s', models.JSONField(default=list)),
+                ('estimated_jobs', models.PositiveIntegerField(default=0)),
+                ('estimate_s', models.FloatField(default=0)),
+                ('estimate_error_s', models.FloatField(default=0)),
+                ('failure_reasons', models.JSONField(default=dict)),
+                ('failed_parts', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='printjob',
+            index=models.Index(fields=['started_at'], name='printjob_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printjob',
+            index=models.Index(fields=['completed_at'], name='printjob_completed_idx'),
+        ),
+        migrations.AddField(
+            model_name='printerdaystats',
+            name='machine_type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='core.machinetype'),
+        ),
+        migrations.AddField(
+            model_name='printerdaystats',
+            name='printer',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='fleet.printer'),
+        ),
+        migrations.AddIndex(
+            model_name='printerdaystats',
+            index=models.Index(fields=['day'], name='printerdaystats_day_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.1.2 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_printsetting_layer_thickness_mm'),
+        ('production', '0006_print_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asyncoperation',
+            name='payload',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='asyncoperation',
+            name='replayed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='sceneresult',
+            name='chain_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='sceneresult',
+            index=models.Index(fields=['chain_key', 'operation_type'], name='sceneresult_chain_idx'),
+        ),
+    ]
@@ -8,7 +8,7 @@ class Scene(models.Model):
     
     machine_type = models.ForeignKey('core.MachineType', on_delete=models.PROTECT)
     material = models.ForeignKey('core.Material', on_delete=models.PROTECT)
-    layer_thickness_mm = models.CharField(max_length=20)
+    layer_thickness_mm = models.DecimalField(max_digits=5, decimal_places=3)
     
     # Computed values from PreFormServer
     layer_count = models.IntegerField(null=True)
@@ -40,6 +40,10 @@ class SceneModel(models.Model):
     in_bounds = models.BooleanField(default=True)
 
 
+# Jobs still on the floor; the rest only grow the table
+ACTIVE_JOB_STATUSES = ['PENDING', 'READY', 'QUEUED', 'PRINTING']
+
+
 class PrintJob(models.Model):
     """A single print run"""
     
@@ -52,6 +56,8 @@ class PrintJob(models.Model):
         ('FAILED', 'Failed'),
         ('CANCELLED', 'Cancelled'),
     ]
+
+    ACTIVE_STATUSES = ACTIVE_JOB_STATUSES
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     batch = models.ForeignKey('batching.PrintBatch', on_delete=models.CASCADE, related_name='jobs')
@@ -68,7 +74,7 @@ class PrintJob(models.Model):
     estimated_print_time_s = models.IntegerField(null=True)
     
     # Timestamps
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     queued_at = models.DateTimeField(null=True)
     started_at = models.DateTimeField(null=True)
     completed_at = models.DateTimeField(null=True)
@@ -87,6 +93,23 @@ class PrintJob(models.Model):
         related_name='started_jobs'
     )
 
+    class Meta:
+        indexes = [
+            # READY queue for the scheduler, oldest first; only active rows are
+            # indexed. PostgreSQL uses it for status='READY'; SQLite only for
+            # queries repeating the exact IN (...) predicate.
+            models.Index(
+                fields=['status', 'created_at'],
+                condition=models.Q(status__in=ACTIVE_JOB_STATUSES),
+                name='printjob_active_idx',
+            ),
+            # A printer's queued/printing jobs (scheduler, printer detail)
+            models.Index(fields=['printer', 'status'], name='printjob_printer_status_idx'),
+            # Daily rollup (production.analytics): jobs started / finished in a window
+            models.Index(fields=['started_at'], name='printjob_started_idx'),
+            models.Index(fields=['completed_at'], name='printjob_completed_idx'),
+        ]
+
 
 class PrintJobItem(models.Model):
     """Parts on a build plate"""
@@ -135,6 +158,12 @@ class FailedPartRecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey('employees.Employee', on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [
+            # Failures still waiting for a reprint batch, oldest first
+            models.Index(fields=['created_at'], condition=models.Q(requeued=False), name='failedpart_pending_idx'),
+        ]
+
 
 class AsyncOperation(models.Model):
     """Track long-running PreFormServer operations"""
@@ -164,6 +193,89 @@ class AsyncOperation(models.Model):
     
     result = models.JSONField(null=True)
     error_message = models.TextField(blank=True)
+
+    # Memoization (production.scene_cache): what the scene looked like when
+    # the operation was asked for, and whether the answer came from the cache
+    cache_key = models.CharField(max_length=64, blank=True)
+    cache_hit = models.BooleanField(default=False)
+    payload = models.JSONField(null=True)
+    # A cache hit later run on the PreFormServer scene after all
+    replayed = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Operations the poller still has to follow up
+            models.Index(
+                fields=['created_at'], condition=models.Q(status='IN_PROGRESS'), name='asyncop_in_progress_idx'
+            ),
+        ]
+
+
+class SceneResult(models.Model):
+    """Memoized output of a PreFormServer scene operation (production.scene_cache)"""
+    # Digest of the parts' content and placement, the payload and the
+    # operations already applied to the scene
+    parts_key = models.CharField(max_length=64)
+    machine_type = models.ForeignKey('core.MachineType', on_delete=models.CASCADE)
+    material = models.ForeignKey('core.Material', on_delete=models.CASCADE)
+    layer_thickness_mm = models.DecimalField(max_digits=5, decimal_places=3)
+    operation_type = models.CharField(max_length=30, choices=AsyncOperation.OPERATION_TYPES)
+    # parts_key of the first cached operation on the scene; the steps of
+    # one scene are only used, and evicted, together
+    chain_key = models.CharField(max_length=64, blank=True)
+
+    result = models.JSONField(null=True)
+    layer_count = models.IntegerField(null=True)
+    volume_ml = models.FloatField(null=True)
+    form_file_path = models.CharField(max_length=500, blank=True)
+
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['parts_key', 'material', 'layer_thickness_mm', 'machine_type', 'operation_type'],
+                name='sceneresult_unique_key',
+            ),
+        ]
+        indexes = [
+            # Eviction, least recently used first
+            models.Index(fields=['last_used_at'], name='sceneresult_lru_idx'),
+            models.Index(fields=['chain_key', 'operation_type'], name='sceneresult_chain_idx'),
+        ]
+
+
+class PrinterDayStats(models.Model):
+    """One printer's print activity on one day, rolled up by production.analytics"""
+    day = models.DateField()
+    # Null for failed parts whose job had no printer
+    printer = models.ForeignKey('fleet.Printer', on_delete=models.CASCADE, null=True, related_name='+')
+    machine_type = models.ForeignKey('core.MachineType', on_delete=models.PROTECT, null=True)
+
+    busy_s = models.FloatField(default=0)
+    jobs_started = models.PositiveIntegerField(default=0)
+    jobs_completed = models.PositiveIntegerField(default=0)
+    jobs_failed = models.PositiveIntegerField(default=0)
+
+    # Raw samples, so percentiles over any range are exact: started_at ->
+    # completed_at of completed jobs, queued_at -> started_at of started jobs
+    print_times_s = models.JSONField(default=list)
+    queue_waits_s = models.JSONField(default=list)
+
+    # Completed jobs that had an estimate: the estimates and actual - estimate
+    estimated_jobs = models.PositiveIntegerField(default=0)
+    estimate_s = models.FloatField(default=0)
+    estimate_error_s = models.FloatField(default=0)
+
+    failure_reasons = models.JSONField(default=dict)  # failure_reason -> failed jobs
+    failed_parts = models.JSONField(default=dict)  # FailedPartRecord.failure_type -> quantity
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day'], name='printerdaystats_day_idx'),
+        ]
@@ -0,0 +1,256 @@
+# production/preform.py
+"""
+Asyncio client for PreFormServer and the AsyncOperation poller.
+
+One PreFormClient wraps a pooled httpx.AsyncClient, so hundreds of scene
+operations share a bounded set of keep-alive connections instead of
+blocking one another. Long-running scene operations are started with
+?async=true and tracked as AsyncOperation rows; OperationPoller refreshes
+all of them each tick with bounded concurrency and a single bulk update.
+Orientation, supports and .form files are memoized (scene_cache), so a
+repeat scene skips PreFormServer.
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+
+from apps.core.events import change_bus, delta
+from . import scene_cache
+from .models import AsyncOperation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_TIMEOUT_S = 30.0
+
+# An operation still IN_PROGRESS (or unreachable) after this long is FAILED
+DEFAULT_MAX_OPERATION_AGE = timedelta(hours=2)
+
+# AsyncOperation.operation_type -> PreFormServer scene endpoint
+OPERATION_PATHS = {
+    'AUTO_ORIENT': 'auto-orient',
+    'AUTO_SUPPORT': 'auto-support',
+    'AUTO_LAYOUT': 'auto-layout',
+    'IMPORT_MODEL': 'import-model',
+    'PRINT': 'print',
+    'SAVE_FORM': 'save-form',
+}
+
+POLL_UPDATE_FIELDS = ['status', 'progress', 'result', 'error_message', 'completed_at']
+
+
+class PreFormError(Exception):
+    """PreFormServer answered with an error status"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"PreFormServer returned {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class PreFormClient:
+    """
+    Async PreFormServer client with a shared connection pool.
+
+    Use as an async context manager, or call aclose() when done.
+    `transport` lets tests plug in FakePreFormServer.
+    """
+
+    def __init__(self, base_url=None, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 timeout=DEFAULT_TIMEOUT_S, transport=None):
+        self._client = httpx.AsyncClient(
+            base_url=base_url or settings.PREFORM_SERVER_URL,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _request(self, method, path, **kwargs):
+        response = await self._client.request(method, path, **kwargs)
+        if response.is_error:
+            raise PreFormError(response.status_code, response.text)
+        return response.json() if response.content else None
+
+    async def create_scene(self, machine_type, material, layer_thickness_mm, print_setting='DEFAULT'):
+        """Create an empty scene; returns PreFormServer's scene JSON (with 'id')"""
+        return await self._request('POST', '/scene/', json={
+            'machine_type': machine_type,
+            'material_code': material,
+            'layer_thickness_mm': float(layer_thickness_mm),
+            'print_setting': print_setting,
+        })
+
+    async def start_operation(self, operation_type, preform_scene_id, payload=None):
+        """Start a scene operation asynchronously; returns its operation id"""
+        path = OPERATION_PATHS[operation_type]
+        data = await self._request(
+            'POST', f'/scene/{preform_scene_id}/{path}/',
+            params={'async': 'true'},
+            json=payload or {},
+        )
+        return data['operationId']
+
+    async def run_operation(self, operation_type, preform_scene_id, payload=None):
+        """Run a scene operation to completion (no ?async); returns its result"""
+        path = OPERATION_PATHS[operation_type]
+        return await self._request('POST', f'/scene/{preform_scene_id}/{path}/', json=payload or {})
+
+    async def get_operation(self, operation_id):
+        """Current {'status', 'progress', 'result', 'error'} of an operation"""
+        return await self._request('GET', f'/operations/{operation_id}/')
+
+    async def launch(self, operation_type, scene, payload=None, print_job=None):
+        """
+        Start an operation on a Scene and record it as an AsyncOperation.
+        Results memoized by scene_cache come back as an already SUCCEEDED
+        operation without a request to PreFormServer. Before anything is
+        sent, orient and support steps earlier served from the cache are
+        run on the PreFormServer scene.
+        """
+        key = await scene_cache.parts_key(scene, operation_type, payload)
+        cached = await scene_cache.replay(scene, operation_type, key, payload=payload, print_job=print_job)
+        if cached is not None:
+            return cached
+        for step in await scene_cache.pending_steps(scene):
+            await self.run_operation(step.operation_type, scene.preform_scene_id, step.payload)
+            step.replayed = True
+            await step.asave(update_fields=['replayed'])
+        operation_id = await self.start_operation(operation_type, scene.preform_scene_id, payload)
+        return await AsyncOperation.objects.acreate(
+            operation_id=operation_id,
+            operation_type=operation_type,
+            scene=scene,
+            print_job=print_job,
+            payload=payload,
+            cache_key=key or '',
+        )
+
+
+def apply_operation_status(operation, data, now):
+    """Copy a PreFormServer operation response onto the row; True if anything changed"""
+    status = data.get('status', operation.status)
+    if status not in dict(AsyncOperation.STATUS_CHOICES):
+        status = 'IN_PROGRESS'
+
+    changes = {
+        'status': status,
+        'progress': float(data.get('progress', operation.progress) or 0.0),
+        'result': data.get('result', operation.result),
+        'error_message': data.get('error') or operation.error_message,
+    }
+    if status != 'IN_PROGRESS':
+        changes['progress'] = 1.0 if status == 'SUCCEEDED' else changes['progress']
+        changes['completed_at'] = operation.completed_at or now
+
+    changed = False
+    for field, value in changes.items():
+        if getattr(operation, field) != value:
+            setattr(operation, field, value)
+            changed = True
+    return changed
+
+
+class OperationPoller:
+    """
+    Background refresher for IN_PROGRESS AsyncOperations.
+
+    Each tick fetches every in-flight operation from PreFormServer with at
+    most `concurrency` requests at a time and writes the changes with one
+    bulk_update. The tick interval doubles (up to max_interval) while
+    nothing changes or PreFormServer errors, and drops back to
+    min_interval as soon as any operation moves.
+
+    An operation PreFormServer answers 404 for (lost in a restart) is
+    FAILED, and so is one older than `max_age` that has not finished.
+    A SAVE_FORM that succeeds points its scene at the .form file.
+    """
+
+    def __init__(self, client, concurrency=10, min_interval=1.0, max_interval=30.0,
+                 max_age=DEFAULT_MAX_OPERATION_AGE):
+        self.client = client
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_age = max_age
+        self.interval = min_interval
+
+    async def tick(self):
+        """Poll once; returns (changed, failed) operation counts"""
+        operations = [
+            operation
+            async for operation in AsyncOperation.objects.filter(status='IN_PROGRESS')
+        ]
+        if not operations:
+            return 0, 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(operation):
+            async with semaphore:
+                try:
+                    return operation, await self.client.get_operation(operation.operation_id)
+                except PreFormError as exc:
+                    if exc.status_code == 404:
+                        return operation, {'status': 'FAILED', 'error': "Operation not found on PreFormServer"}
+                    logger.warning("Polling operation %s failed: %s", operation.operation_id, exc)
+                except httpx.HTTPError as exc:
+                    logger.warning("Polling operation %s failed: %s", operation.operation_id, exc)
+                return operation, None
+
+        now = timezone.now()
+        expired_before = now - self.max_age
+        changed = []
+        failed = 0
+        for operation, data in await asyncio.gather(*(fetch(operation) for operation in operations)):
+            if data is None:
+                failed += 1
+            if operation.created_at < expired_before and (data or {}).get('status', 'IN_PROGRESS') == 'IN_PROGRESS':
+                data = dict(data or {}, status='FAILED', error=f"Not finished after {self.max_age}")
+            if data is not None and apply_operation_status(operation, data, now):
+                changed.append(operation)
+
+        if changed:
+            await AsyncOperation.objects.abulk_update(changed, POLL_UPDATE_FIELDS)
+            await scene_cache.save_forms(changed)
+            await scene_cache.remember(changed)
+            for operation in changed:
+                change_bus.publish(delta(
+                    'async_operation', operation.operation_id,
+                    {'status': operation.status, 'progress': operation.progress},
+                    scene_id=operation.scene_id, print_job_id=operation.print_job_id
+                ))
+        return len(changed), failed
+
+    async def run(self, stop=None):
+        """Poll until `stop` (an asyncio.Event) is set"""
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                changed, _ = await self.tick()
+            except Exception:
+                logger.exception("AsyncOperation poll tick failed")
+                changed = 0
+
+            if changed:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except TimeoutError:
+                pass
@@ -0,0 +1,96 @@
+# production/preform_fake.py
+"""
+In-memory stand-in for PreFormServer, for tests and local development.
+
+    server = FakePreFormServer()
+    client = PreFormClient(base_url='http://preform.test', transport=server.transport)
+
+Scenes and operations live in dicts. Every GET of an operation advances it
+by one step, so an operation succeeds after `steps` polls (or fails, if
+its type is listed in `fail_operations`). Without ?async=true a scene
+operation completes at once. A SAVE_FORM result names the .form file
+(the payload's 'file', or one per scene) with a layer count and volume. Each scene lists the operation types run on
+it under 'operations'.
+"""
+
+import json
+import re
+import uuid
+
+import httpx
+
+from .preform import OPERATION_PATHS
+
+# What every saved .form file reports
+FORM_LAYER_COUNT = 1000
+FORM_VOLUME_ML = 25.0
+
+_PATH_TYPES = {path: operation_type for operation_type, path in OPERATION_PATHS.items()}
+
+
+class FakePreFormServer:
+
+    def __init__(self, steps=3, fail_operations=()):
+        self.steps = steps
+        self.fail_operations = set(fail_operations)
+        self.scenes = {}
+        self.operations = {}
+        self.requests = []
+        self.transport = httpx.MockTransport(self.handle)
+
+    def handle(self, request):
+        self.requests.append(request)
+        path = request.url.path
+        body = json.loads(request.content) if request.content else {}
+
+        if request.method == 'POST' and path == '/scene/':
+            scene_id = str(uuid.uuid4())
+            self.scenes[scene_id] = dict(body, id=scene_id, models=[], operations=[])
+            return httpx.Response(200, json=self.scenes[scene_id])
+
+        match = re.fullmatch(r'/scene/([^/]+)/([a-z-]+)/', path)
+        if request.method == 'POST' and match:
+            scene_id, action = match.groups()
+            if scene_id not in self.scenes:
+                return httpx.Response(404, json={'error': 'Scene not found'})
+            if action not in _PATH_TYPES:
+                return httpx.Response(404, json={'error': f'Unknown action {action}'})
+            operation_type = _PATH_TYPES[action]
+            self.scenes[scene_id]['operations'].append(operation_type)
+            if request.url.params.get('async') != 'true':
+                if operation_type in self.fail_operations:
+                    return httpx.Response(500, json={'error': f'{operation_type} failed'})
+                return httpx.Response(200, json={'scene_id': scene_id, 'operation': operation_type})
+            operation_id = str(uuid.uuid4())
+            self.operations[operation_id] = {
+                'id': operation_id,
+                'type': operation_type,
+                'scene_id': scene_id,
+                'payload': body,
+                'polls': 0,
+            }
+            return httpx.Response(202, json={'operationId': operation_id})
+
+        match = re.fullmatch(r'/operations/([^/]+)/', path)
+        if request.method == 'GET' and match:
+            operation = self.operations.get(match.group(1))
+            if operation is None:
+                return httpx.Response(404, json={'error': 'Operation not found'})
+            operation['polls'] += 1
+            return httpx.Response(200, json=self._operation_status(operation))
+
+        return httpx.Response(404, json={'error': f'No route for {request.method} {path}'})
+
+    def _operation_status(self, operation):
+        if operation['polls'] < self.steps:
+            return {'status': 'IN_PROGRESS', 'progress': operation['polls'] / self.steps}
+        if operation['type'] in self.fail_operations:
+            return {'status': 'FAILED', 'progress': 1.0, 'error': f"{operation['type']} failed"}
+        result = {'scene_id': operation['scene_id'], 'operation': operation['type']}
+        if operation['type'] == 'SAVE_FORM':
+            result.update(
+                file=operation['payload'].get('file') or f"/forms/{operation['scene_id']}.form",
+                layer_count=FORM_LAYER_COUNT,
+                volume_ml=FORM_VOLUME_ML,
+            )
+        return {'status': 'SUCCEEDED', 'progress': 1.0, 'result': result}
@@ -0,0 +1,210 @@
+# production/resin.py
+"""
+Resin ledger: will a printer's cartridge last until the end of a job?
+
+Each printer's resin is tracked per material in three parts:
+
+    remaining    original_volume_ml - volume_dispensed_ml, summed over
+                 the cartridges in one aggregate query
+    reserved     what QUEUED jobs on the printer will use, plus the part
+                 of a PRINTING job not yet printed (dispensing readings
+                 already cover what was printed, so only the unprinted
+                 share of the job is held back)
+    available    remaining - reserved - RESIN_HEADROOM_ML
+
+A job uses its scene's volume_ml from PreFormServer. A job without one
+uses the analysed volume of its parts (orders.geometry) times
+SUPPORT_ALLOWANCE. A job with neither is not held back.
+
+The scheduler loads one ResinLedger per run and reserves every job it
+plans. A printer that would run dry partway through is skipped for the
+next one in the group. A printer with no cartridge readings is not
+checked at all. can_run() answers the same question for one printer and
+one scene.
+
+shortage_forecast() compares, per material, the resin in the fleet's
+cartridges with what assigned and waiting jobs need, and with the
+recent daily usage.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from apps.core.reference import reference_data
+from apps.fleet.models import CartridgeData
+from .models import PrintJob
+
+# Never plan a cartridge below this (reading drift, tank fill)
+RESIN_HEADROOM_ML = 10.0
+
+# Supports and rafts on top of the parts' own volume, for jobs without a scene volume
+SUPPORT_ALLOWANCE = 1.25
+
+# Daily usage is averaged over jobs finished in this window
+USAGE_WINDOW_DAYS = 14
+
+RESERVING_JOB_STATUSES = ['QUEUED', 'PRINTING']
+WAITING_JOB_STATUSES = ['PENDING', 'READY']
+
+# Jobs whose resin is spent, printed or not
+FINISHED_JOB_STATUSES = ['COMPLETED', 'FAILED']
+
+
+def job_volume():
+    """Expression for the resin a PrintJob queryset row uses, in ml, NULL if unknown"""
+    parts = Sum(F('items__quantity') * F('items__batch_item__order_item__volume_ml'))
+    return Coalesce(F('scene__volume_ml'), parts * SUPPORT_ALLOWANCE)
+
+
+def job_volumes(jobs):
+    """{job_id: ml or None} for a PrintJob queryset"""
+    return dict(jobs.values('id').annotate(volume=job_volume()).values_list('id', 'volume'))
+
+
+def remaining_resin(printer_ids=None):
+    """{(printer_id, material_id): ml left in its cartridges}"""
+    cartridges = CartridgeData.objects.all()
+    if printer_ids is not None:
+        cartridges = cartridges.filter(printer_id__in=printer_ids)
+    return {
+        (printer_id, material_id): remaining
+        for printer_id, material_id, remaining in cartridges.values('printer_id', 'material_id').annotate(
+            remaining=Sum(Greatest(F('original_volume_ml') - F('volume_dispensed_ml'), 0.0))
+        ).values_list('printer_id', 'material_id', 'remaining')
+    }
+
+
+def reserved_resin(now=None, printer_ids=None):
+    """{(printer_id, material_id): ml still to be used by the printer's QUEUED and PRINTING jobs}"""
+    now = now or timezone.now()
+    jobs = PrintJob.objects.filter(status__in=RESERVING_JOB_STATUSES, printer__isnull=False)
+    if printer_ids is not None:
+        jobs = jobs.filter(printer_id__in=printer_ids)
+
+    reserved = defaultdict(float)
+    for printer_id, material_id, status, started_at, estimate, volume in jobs.values(
+        'id', 'printer_id', 'batch__material_id', 'status', 'started_at', 'estimated_print_time_s'
+    ).annotate(volume=job_volume()).values_list(
+        'printer_id', 'batch__material_id', 'status', 'started_at', 'estimated_print_time_s', 'volume'
+    ):
+        if volume is None:
+            continue
+        if status == 'PRINTING' and started_at is not None and estimate:
+            volume *= max(0.0, 1 - (now - started_at).total_seconds() / estimate)
+        reserved[(printer_id, material_id)] += volume
+    return dict(reserved)
+
+
+class ResinLedger:
+    """Resin left per (printer, material) after reservations; two queries to load"""
+
+    def __init__(self, remaining, reserved):
+        self.available = {
+            key: volume - reserved.get(key, 0.0) - RESIN_HEADROOM_ML
+            for key, volume in remaining.items()
+        }
+        self.tracked = {printer_id for printer_id, _ in remaining}
+
+    @classmethod
+    def load(cls, now=None, printer_ids=None):
+        return cls(remaining_resin(printer_ids), reserved_resin(now, printer_ids))
+
+    def can_run(self, printer_id, material_id, volume_ml):
+        """Whether the printer has `volume_ml` of the material left over; True if unknown"""
+        if volume_ml is None or printer_id not in self.tracked:
+            return True
+        return self.available.get((printer_id, material_id), -RESIN_HEADROOM_ML) >= volume_ml
+
+    def reserve(self, printer_id, material_id, volume_ml):
+        if volume_ml is not None and printer_id in self.tracked:
+            key = (printer_id, material_id)
+            self.available[key] = self.available.get(key, -RESIN_HEADROOM_ML) - volume_ml
+
+
+def can_run(printer_id, scene):
+    """
+    Whether the printer can run `scene` to the end with the resin left
+    after its QUEUED and PRINTING jobs. A scene PreFormServer has not
+    measured yet is not held back.
+    """
+    ledger = ResinLedger.load(printer_ids=[printer_id])
+    return ledger.can_run(printer_id, scene.material_id, scene.volume_ml)
+
+
+def printer_resin(printer_id, now=None):
+    """[{material, remaining_ml, reserved_ml, available_ml}] of one printer's cartridges"""
+    remaining = remaining_resin([printer_id])
+    reserved = reserved_resin(now, [printer_id])
+    return [
+        {
+            'material': material_id,
+            'remaining_ml': round(volume, 1),
+            'reserved_ml': round(reserved.get((printer_id, material_id), 0.0), 1),
+            'available_ml': round(volume - reserved.get((printer_id, material_id), 0.0), 1),
+        }
+        for (_, material_id), volume in sorted(remaining.items())
+    ]
+
+
+def shortage_forecast(now=None):
+    """
+    Per material: the resin in the fleet's cartridges, what assigned
+    (QUEUED / PRINTING) and waiting (PENDING / READY) jobs need, the
+    shortfall if they need more than there is, and the average daily
+    usage with the days the stock lasts at that rate. Materials short
+    of resin come first, then the ones running out soonest.
+    """
+    now = now or timezone.now()
+    remaining = defaultdict(float)
+    for (_, material_id), volume in remaining_resin().items():
+        remaining[material_id] += volume
+    reserved = defaultdict(float)
+    for (_, material_id), volume in reserved_resin(now).items():
+        reserved[material_id] += volume
+
+    waiting = defaultdict(float)
+    unmeasured = defaultdict(int)
+    for material_id, volume in PrintJob.objects.filter(status__in=WAITING_JOB_STATUSES).values(
+        'id', 'batch__material_id'
+    ).annotate(volume=job_volume()).values_list('batch__material_id', 'volume'):
+        if volume is None:
+            unmeasured[material_id] += 1
+        else:
+            waiting[material_id] += volume
+
+    since = now - timedelta(days=USAGE_WINDOW_DAYS)
+    used = dict(
+        PrintJob.objects.filter(status__in=FINISHED_JOB_STATUSES, completed_at__gte=since)
+        .values('batch__material_id')
+        .annotate(volume=Sum('scene__volume_ml', filter=Q(scene__volume_ml__isnull=False)))
+        .values_list('batch__material_id', 'volume')
+    )
+
+    forecast = []
+    for material_id in remaining.keys() | reserved.keys() | waiting.keys() | unmeasured.keys():
+        needed = reserved[material_id] + waiting[material_id]
+        daily = (used.get(material_id) or 0.0) / USAGE_WINDOW_DAYS
+        days = remaining[material_id] / daily if daily else None
+        material = reference_data.get('material', material_id)
+        forecast.append({
+            'material': material_id,
+            'material_label': material.label if material else None,
+            'remaining_ml': round(remaining[material_id], 1),
+            'reserved_ml': round(reserved[material_id], 1),
+            'waiting_ml': round(waiting[material_id], 1),
+            'shortfall_ml': round(max(0.0, needed - remaining[material_id]), 1),
+            'jobs_without_volume': unmeasured[material_id],
+            'daily_usage_ml': round(daily, 1),
+            'days_of_stock': round(days, 1) if days is not None else None,
+            'runs_out_at': now + timedelta(days=days) if days is not None else None,
+        })
+    forecast.sort(key=lambda row: (
+        -row['shortfall_ml'],
+        row['days_of_stock'] if row['days_of_stock'] is not None else float('inf'),
+        str(row['material']),
+    ))
+    return forecast
@@ -0,0 +1,283 @@
+# production/scene_cache.py
+"""
+Memoized PreFormServer scene operations.
+
+Recurring production parts come back as identical scenes, and orienting,
+supporting and saving them is the slowest stage of the pipeline. A
+SUCCEEDED operation of a CACHED_OPERATIONS type is stored as a
+SceneResult under
+
+    (parts_key, material, layer_thickness_mm, machine_type, operation_type)
+
+where parts_key digests everything else the output depends on: the
+content hash of every part's model file (orders.ModelFile) with its
+position, orientation and scale, the operation payload, and the keys of
+the operations already applied to the scene, in order. Two scenes share
+a key only if they hold the same models, placed the same way, and went
+through the same steps.
+
+The cached steps of one scene form a chain, named by the key of its
+first step (chain_key). PreFormClient.launch() looks the key up first. On
+a hit no request is sent: an AsyncOperation is recorded already
+SUCCEEDED with the stored result (cache_hit=True), and a SAVE_FORM hit
+points the scene at the stored .form file. The PreFormServer scene itself
+is left as it was, so an AUTO_ORIENT or AUTO_SUPPORT hit only counts when
+its chain ends in a cached SAVE_FORM with a .form file. If a later step
+on the scene misses after all, the orient and support steps served from
+the cache are first run on PreFormServer (pending_steps()), so the scene
+the server works on is never raw. Scenes with a part whose content is
+unknown are never cached.
+
+As a SAVE_FORM succeeds the poller copies the .form path, layer count
+and volume it reports onto the scene (save_forms()); a SAVE_FORM without
+a path is never served from the cache. The poller stores results as
+operations succeed (remember()) and keeps
+at most SCENE_CACHE_MAX_ENTRIES, dropping whole chains, least recently
+used first. cache_stats() reports hit rates from the AsyncOperation rows.
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .models import AsyncOperation, Scene, SceneModel, SceneResult
+
+CACHED_OPERATIONS = ['AUTO_ORIENT', 'AUTO_SUPPORT', 'SAVE_FORM']
+
+# Cached steps that change the PreFormServer scene rather than produce a file
+SCENE_STEPS = ['AUTO_ORIENT', 'AUTO_SUPPORT']
+
+# Placement is compared to this many decimals (mm, degrees)
+PLACEMENT_DECIMALS = 3
+
+# Scene fields a SAVE_FORM result carries
+FORM_FIELDS = ['layer_count', 'volume_ml', 'form_file_path']
+
+
+async def parts_key(scene, operation_type, payload=None):
+    """
+    Digest of the scene's parts, `payload` and prior operations for an
+    `operation_type` launch, or None if a part's content is unknown
+    """
+    parts = []
+    async for content, *placement in SceneModel.objects.filter(scene=scene).values_list(
+        'batch_item__order_item__model_file_id',
+        'position_x', 'position_y', 'position_z',
+        'orientation_x', 'orientation_y', 'orientation_z',
+        'scale',
+    ):
+        if content is None:
+            return None
+        parts.append([content, *(round(value, PLACEMENT_DECIMALS) for value in placement)])
+    if not parts:
+        return None
+
+    history = [
+        [kind, key]
+        async for kind, key in AsyncOperation.objects.filter(scene=scene, status='SUCCEEDED')
+        .order_by('created_at').values_list('operation_type', 'cache_key')
+    ]
+    document = {
+        'operation': operation_type,
+        'parts': sorted(parts),
+        'payload': payload or {},
+        'history': history,
+    }
+    return hashlib.sha256(json.dumps(document, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _lookup(scene, operation_type, key):
+    return SceneResult.objects.filter(
+        parts_key=key,
+        material_id=scene.material_id,
+        layer_thickness_mm=scene.layer_thickness_mm,
+        machine_type_id=scene.machine_type_id,
+        operation_type=operation_type,
+    )
+
+
+async def replay(scene, operation_type, key, payload=None, print_job=None):
+    """The cached answer as a SUCCEEDED AsyncOperation, or None on a miss"""
+    if key is None or operation_type not in CACHED_OPERATIONS:
+        return None
+    entry = await _lookup(scene, operation_type, key).afirst()
+    if entry is None or (operation_type == 'SAVE_FORM' and not entry.form_file_path):
+        # A SAVE_FORM whose scene had no .form path yet when it succeeded
+        return None
+    if operation_type in SCENE_STEPS and not (entry.chain_key and await SceneResult.objects.filter(
+        chain_key=entry.chain_key,
+        material_id=scene.material_id,
+        layer_thickness_mm=scene.layer_thickness_mm,
+        machine_type_id=scene.machine_type_id,
+        operation_type='SAVE_FORM',
+    ).exclude(form_file_path='').aexists()):
+        # Nothing would carry the orientation or supports to the printer
+        return None
+
+    now = timezone.now()
+    await SceneResult.objects.filter(pk=entry.pk).aupdate(hits=F('hits') + 1, last_used_at=now)
+    if operation_type == 'SAVE_FORM':
+        for field in FORM_FIELDS:
+            setattr(scene, field, getattr(entry, field))
+        await scene.asave(update_fields=FORM_FIELDS)
+    return await AsyncOperation.objects.acreate(
+        operation_id=uuid.uuid4(),
+        operation_type=operation_type,
+        scene=scene,
+        print_job=print_job,
+        status='SUCCEEDED',
+        progress=1.0,
+        result=entry.result,
+        payload=payload,
+        cache_key=key,
+        cache_hit=True,
+        completed_at=now,
+    )
+
+
+async def pending_steps(scene):
+    """Orient / support steps served from the cache and not yet run on the PreFormServer scene, in order"""
+    return [
+        operation
+        async for operation in AsyncOperation.objects.filter(
+            scene=scene, operation_type__in=SCENE_STEPS, cache_hit=True, replayed=False
+        ).order_by('created_at')
+    ]
+
+
+async def _chain_keys(scene_ids):
+    """{scene_id: key of its first SUCCEEDED cached operation}"""
+    chains = {}
+    async for scene_id, key in AsyncOperation.objects.filter(
+        scene_id__in=scene_ids, status='SUCCEEDED', operation_type__in=CACHED_OPERATIONS
+    ).exclude(cache_key='').order_by('created_at').values_list('scene_id', 'cache_key'):
+        chains.setdefault(scene_id, key)
+    return chains
+
+
+def form_fields(operation):
+    """
+    Scene fields a SUCCEEDED SAVE_FORM reports: the .form path it wrote
+    (the result's 'file', else the 'file' it was asked to write), and
+    'layer_count' and 'volume_ml' when the result carries them
+    """
+    result = operation.result if isinstance(operation.result, dict) else {}
+    payload = operation.payload if isinstance(operation.payload, dict) else {}
+    fields = {'form_file_path': result.get('file') or payload.get('file') or ''}
+    for field in ('layer_count', 'volume_ml'):
+        if result.get(field) is not None:
+            fields[field] = result[field]
+    return fields
+
+
+async def save_forms(operations):
+    """Copy what newly SUCCEEDED SAVE_FORM `operations` report onto their scenes"""
+    saved = 0
+    for operation in operations:
+        if operation.status == 'SUCCEEDED' and operation.operation_type == 'SAVE_FORM' and not operation.cache_hit:
+            fields = form_fields(operation)
+            if fields['form_file_path']:
+                saved += await Scene.objects.filter(pk=operation.scene_id).aupdate(**fields)
+    return saved
+
+
+async def remember(operations):
+    """Store the results of newly SUCCEEDED `operations` and evict beyond the limit"""
+    operations = [
+        operation for operation in operations
+        if operation.status == 'SUCCEEDED' and operation.operation_type in CACHED_OPERATIONS
+        and operation.cache_key and not operation.cache_hit
+    ]
+    if not operations:
+        return 0
+    scenes = {
+        scene.pk: scene
+        async for scene in Scene.objects.filter(pk__in={operation.scene_id for operation in operations})
+    }
+    chains = await _chain_keys(scenes)
+
+    now = timezone.now()
+    entries = {}
+    for operation in operations:
+        scene = scenes.get(operation.scene_id)
+        if scene is None:
+            continue
+        entry = SceneResult(
+            parts_key=operation.cache_key,
+            material_id=scene.material_id,
+            layer_thickness_mm=scene.layer_thickness_mm,
+            machine_type_id=scene.machine_type_id,
+            operation_type=operation.operation_type,
+            chain_key=chains.get(scene.pk, operation.cache_key),
+            result=operation.result,
+            last_used_at=now,
+        )
+        if operation.operation_type == 'SAVE_FORM':
+            for field in FORM_FIELDS:
+                setattr(entry, field, getattr(scene, field))
+        entries[(operation.cache_key, operation.operation_type, scene.material_id,
+                 scene.layer_thickness_mm, scene.machine_type_id)] = entry
+
+    await SceneResult.objects.abulk_create(
+        entries.values(),
+        update_conflicts=True,
+        unique_fields=['parts_key', 'material', 'layer_thickness_mm', 'machine_type', 'operation_type'],
+        update_fields=['chain_key', 'result', *FORM_FIELDS, 'last_used_at'],
+    )
+    await evict()
+    return len(entries)
+
+
+async def evict(max_entries=None):
+    """
+    Drop the least recently used chains until at most `max_entries`
+    (SCENE_CACHE_MAX_ENTRIES) entries are left. A chain goes as a whole:
+    orient and support entries are useless without their SAVE_FORM.
+    """
+    max_entries = settings.SCENE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    overflow = await SceneResult.objects.acount() - max_entries
+    if overflow <= 0:
+        return 0
+    stale = []
+    async for chain_key, size in SceneResult.objects.values('chain_key').annotate(
+        size=Count('pk'), used=Max('last_used_at')
+    ).order_by('used').values_list('chain_key', 'size'):
+        stale.append(chain_key)
+        overflow -= size
+        if overflow <= 0:
+            break
+    deleted, _ = await SceneResult.objects.filter(chain_key__in=stale).adelete()
+    return deleted
+
+
+def cache_stats(since=None):
+    """Lookups, hits and hit rate per cached operation type, and the entries stored"""
+    operations = AsyncOperation.objects.filter(operation_type__in=CACHED_OPERATIONS).exclude(cache_key='')
+    if since is not None:
+        operations = operations.filter(created_at__gte=since)
+    counts = {
+        row['operation_type']: row
+        for row in operations.values('operation_type').annotate(
+            lookups=Count('pk'), hits=Count('pk', filter=Q(cache_hit=True))
+        )
+    }
+    entries = dict(
+        SceneResult.objects.values('operation_type').annotate(count=Count('pk')).values_list(
+            'operation_type', 'count'
+        )
+    )
+
+    stats = {}
+    for operation_type in CACHED_OPERATIONS:
+        row = counts.get(operation_type, {'lookups': 0, 'hits': 0})
+        stats[operation_type] = {
+            'lookups': row['lookups'],
+            'hits': row['hits'],
+            'hit_rate': row['hits'] / row['lookups'] if row['lookups'] else None,
+            'entries': entries.get(operation_type, 0),
+        }
+    return stats
@@ -0,0 +1,191 @@
+# production/scheduler.py
+"""
+Dispatch of READY print jobs to the fleet.
+
+Jobs are planned with list scheduling: a heap of READY jobs ordered by
+batch priority, must_schedule_by and longest print first, and one heap of
+printers per (machine_type, tank_material) ordered by when each printer
+is next free. Every job goes to the compatible printer that frees up
+first, which keeps the fleet's makespan low while urgent work goes out
+first.
+
+Only jobs that can start now (on an IDLE printer with nothing queued)
+are written as QUEUED; the rest of the plan is returned as a Gantt chart.
+A printer that is PRINTING is only planned for: its job may run past
+the estimate, so nothing is sent to it until it reports IDLE.
+
+A printer is only given a job its cartridges can finish after everything
+already queued or planned on it (see resin.py). When a printer would run
+dry, the next printer in the group is tried. If none has enough resin,
+the job is reported as short of resin.
+"""
+
+import heapq
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.batching.models import PrintBatch
+from apps.core.events import change_bus, delta
+from apps.core.reference import reference_data
+from apps.fleet.models import Printer
+from apps.orders.models import Order
+from .models import PrintJob
+from .resin import ResinLedger, job_volumes
+
+# Used for planning when a job has no estimate from PreFormServer yet
+DEFAULT_PRINT_TIME_S = 4 * 60 * 60
+
+# Printers in these states are out of the plan entirely
+UNAVAILABLE_PRINTER_STATUSES = ['OFFLINE', 'MAINTENANCE', 'ERROR']
+
+
+def _printer_queues(now):
+    """
+    {(machine_type_id, tank_material_id): heap of (free_at, busy, printer_id)}
+    for connected printers. A printer is free once its current and
+    queued jobs are done; it is busy unless it is IDLE with nothing
+    queued, and at equal free_at idle printers come first.
+    """
+    printers = Printer.objects.filter(is_connected=True, tank_material__isnull=False).exclude(
+        status__in=UNAVAILABLE_PRINTER_STATUSES
+    ).values_list('id', 'machine_type_id', 'tank_material_id', 'status')
+
+    free_at = {printer_id: now for printer_id, _, _, _ in printers}
+    busy = {printer_id for printer_id, _, _, status in printers if status != 'IDLE'}
+    for printer_id, status, started_at, estimate in PrintJob.objects.filter(
+        printer__in=free_at.keys(), status__in=['QUEUED', 'PRINTING']
+    ).values_list('printer_id', 'status', 'started_at', 'estimated_print_time_s'):
+        busy.add(printer_id)
+        duration = timedelta(seconds=estimate or DEFAULT_PRINT_TIME_S)
+        if status == 'PRINTING' and started_at is not None:
+            free_at[printer_id] = max(free_at[printer_id], started_at + duration)
+        else:
+            free_at[printer_id] += duration
+
+    queues = {}
+    for printer_id, machine_type_id, material_id, _ in printers:
+        queues.setdefault((machine_type_id, material_id), []).append(
+            (free_at[printer_id], printer_id in busy, printer_id)
+        )
+    for queue in queues.values():
+        heapq.heapify(queue)
+    return queues
+
+
+def schedule_jobs(dry_run=False):
+    """
+    Plan every READY job onto the fleet and dispatch the ones that can
+    start now.
+
+    Returns the plan: one entry per job with printer, start and end, plus
+    the fleet makespan and the jobs that cannot run: no connected printer
+    fits, or their batch's print setting has since been removed. Jobs
+    no compatible printer has the resin for are listed apart.
+    With dry_run=True nothing is written.
+    """
+    now = timezone.now()
+    rank = Order.PRIORITY_RANK
+
+    with transaction.atomic():
+        jobs = PrintJob.objects.select_for_update().filter(status='READY').values_list(
+            'id', 'job_name', 'estimated_print_time_s', 'batch_id',
+            'batch__priority', 'batch__must_schedule_by', 'batch__machine_type_id', 'batch__material_id',
+            'batch__layer_thickness_mm'
+        )
+        compatibility = reference_data.compatibility()
+        volumes = job_volumes(PrintJob.objects.filter(status='READY'))
+        unschedulable = []
+        short_of_resin = []
+
+        # Most urgent first; within equal urgency the longest job first (LPT)
+        heap = []
+        for job_id, job_name, estimate, batch_id, priority, deadline, machine_type_id, material_id, layer in jobs:
+            if not compatibility.is_valid(machine_type_id, material_id, layer):
+                unschedulable.append(job_id)
+                continue
+            duration = estimate or DEFAULT_PRINT_TIME_S
+            key = (
+                -rank.get(priority, 0),
+                deadline.timestamp() if deadline else float('inf'),
+                -duration,
+                str(job_id),
+            )
+            heapq.heappush(heap, (
+                key, job_id, job_name, duration, volumes.get(job_id), batch_id, priority, deadline,
+                (machine_type_id, material_id)
+            ))
+
+        queues = _printer_queues(now)
+        ledger = ResinLedger.load(now)
+        plan = []
+        dispatch = []
+        while heap:
+            _, job_id, job_name, duration, volume, batch_id, priority, deadline, group = heapq.heappop(heap)
+            queue = queues.get(group)
+            if not queue:
+                unschedulable.append(job_id)
+                continue
+
+            # The first printer to free up whose cartridges can finish the job
+            skipped = []
+            while queue:
+                free_at, busy, printer_id = heapq.heappop(queue)
+                if ledger.can_run(printer_id, group[1], volume):
+                    break
+                skipped.append((free_at, busy, printer_id))
+            else:
+                printer_id = None
+            for entry in skipped:
+                heapq.heappush(queue, entry)
+            if printer_id is None:
+                short_of_resin.append(job_id)
+                continue
+
+            ledger.reserve(printer_id, group[1], volume)
+            start = max(free_at, now)
+            end = start + timedelta(seconds=duration)
+            heapq.heappush(queue, (end, True, printer_id))
+
+            # A busy printer's start is only a plan, even once its estimate has passed
+            starts_now = start <= now and not busy
+            if starts_now:
+                dispatch.append((job_id, printer_id, batch_id))
+            plan.append({
+                'job_id': job_id,
+                'job_name': job_name,
+                'printer_id': printer_id,
+                'start': start,
+                'end': end,
+                'priority': priority,
+                'must_schedule_by': deadline,
+                'late': deadline is not None and start > deadline,
+                'dispatched': starts_now and not dry_run,
+            })
+
+        if dispatch and not dry_run:
+            PrintJob.objects.bulk_update(
+                [
+                    PrintJob(id=job_id, printer_id=printer_id, status='QUEUED', queued_at=now)
+                    for job_id, printer_id, _ in dispatch
+                ],
+                ['printer', 'status', 'queued_at']
+            )
+            PrintBatch.objects.filter(
+                id__in={batch_id for _, _, batch_id in dispatch}, status='READY'
+            ).update(status='SCHEDULED', scheduled_at=now)
+            for job_id, printer_id, _ in dispatch:
+                change_bus.publish_on_commit(
+                    delta('print_job', job_id, {'status': 'QUEUED'}, printer_id=printer_id)
+                )
+
+    makespan = max((entry['end'] for entry in plan), default=now) - now
+    return {
+        'dispatched': len(dispatch) if not dry_run else 0,
+        'planned': len(plan),
+        'makespan_s': makespan.total_seconds(),
+        'unschedulable': unschedulable,
+        'short_of_resin': short_of_resin,
+        'plan': plan,
+    }
@@ -1,6 +1,7 @@
 # production/serializers.py
 
 from rest_framework import serializers
+from .analytics import BUCKETS, GROUPS
 from .models import PrintJob, PrintJobItem, FailedPartRecord
 
 
@@ -23,7 +24,8 @@ class PrintJobListSerializer(serializers.ModelSerializer):
     """For job queue list view"""
     printer_name = serializers.CharField(source='printer.name', read_only=True)
     batch_id = serializers.UUIDField(source='batch.id', read_only=True)
-    item_count = serializers.IntegerField(source='items.count', read_only=True)
+    # Annotated by PrintJobViewSet.get_queryset
+    item_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = PrintJob
@@ -71,4 +73,22 @@ class PrintJobUpdateSerializer(serializers.ModelSerializer):
                 f"Cannot transition from {instance.status} to {value}"
             )
         
-        return value
\ No newline at end of file
+        return value
+
+
+class ScheduleSerializer(serializers.Serializer):
+    """Options for POST /print-jobs/schedule/"""
+    dry_run = serializers.BooleanField(default=False)
+
+
+class AnalyticsSerializer(serializers.Serializer):
+    """Options for GET /print-jobs/analytics/"""
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+    bucket = serializers.ChoiceField(choices=BUCKETS, default='day')
+    group_by = serializers.ChoiceField(choices=GROUPS, default='printer')
+
+    def validate(self, attrs):
+        if 'since' in attrs and 'until' in attrs and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError({'until': "Must be after since."})
+        return attrs
@@ -0,0 +1,6 @@
+from apps.core.events import track_changes
+
+from .models import AsyncOperation, PrintJob
+
+track_changes(PrintJob, 'print_job', ['status'], context=['printer_id'])
+track_changes(AsyncOperation, 'async_operation', ['status', 'progress'], context=['scene_id', 'print_job_id'])
@@ -1,3 +1,622 @@
+import asyncio
+import uuid
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import httpx
+import numpy as np
+
+from asgiref.sync import async_to_sync, sync_to_async
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.batching.models import BatchItem, PrintBatch
+from apps.core.testing import make_order, reference_fixture
+from apps.fleet.models import CartridgeData, Printer
+from apps.orders.models import ModelFile
+from . import scene_cache
+from .analytics import fleet_analytics, rollup
+from .forecast import FINISHING_TIME_S, forecast_orders
+from .layout import layout_batch, pack_parts
+from .models import (
+    AsyncOperation, FailedPartRecord, PrintJob, PrintJobItem, PrinterDayStats, Scene, SceneModel, SceneResult,
+)
+from .preform import OperationPoller, PreFormClient
+from .preform_fake import FORM_LAYER_COUNT, FORM_VOLUME_ML, FakePreFormServer
+from .resin import RESIN_HEADROOM_ML, SUPPORT_ALLOWANCE, ResinLedger, reserved_resin, shortage_forecast
+from .scheduler import DEFAULT_PRINT_TIME_S, schedule_jobs
+
+
+def make_scene(preform_scene_id, content='a' * 64, external_id='order-1'):
+    """A Scene with one part whose model file content is `content`"""
+    model_file, _ = ModelFile.objects.get_or_create(sha256=content, defaults={'size_bytes': 1})
+    item = make_order(external_id).items.get()
+    item.model_file = model_file
+    item.save(update_fields=['model_file'])
+    batch = PrintBatch.objects.create(
+        material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), machine_type_id='FORM-4-0'
+    )
+    batch_item = BatchItem.objects.create(batch=batch, order_item=item, quantity=1)
+    scene = Scene.objects.create(
+        preform_scene_id=preform_scene_id,
+        machine_type_id='FORM-4-0',
+        material_id='FLGPGR05',
+        layer_thickness_mm=Decimal('0.1'),
+    )
+    SceneModel.objects.create(scene=scene, batch_item=batch_item, position_x=10.0)
+    return scene
+
+
+class SceneCacheTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.server = FakePreFormServer(steps=1)
+        self.client = PreFormClient(base_url='http://preform.test', transport=self.server.transport)
+        self.poller = OperationPoller(self.client)
+        self.addCleanup(async_to_sync(self.client.aclose))
+
+    async def new_scene(self, external_id, content='a' * 64):
+        data = await self.client.create_scene('FORM-4-0', 'FLGPGR05', '0.1')
+        return await sync_to_async(make_scene)(data['id'], content, external_id)
+
+    async def finish(self, operation_type, scene, payload=None):
+        operation = await self.client.launch(operation_type, scene, payload)
+        await self.poller.tick()
+        await operation.arefresh_from_db()
+        self.assertEqual(operation.status, 'SUCCEEDED')
+        return operation
+
+    async def run_chain(self, scene, steps=('AUTO_ORIENT', 'AUTO_SUPPORT', 'SAVE_FORM')):
+        for operation_type in steps:
+            await self.finish(operation_type, scene)
+
+    def server_operations(self, scene):
+        return self.server.scenes[scene.preform_scene_id]['operations']
+
+    async def test_repeat_scene_is_served_from_a_complete_chain(self):
+        first = await self.new_scene('a')
+        await self.run_chain(first)
+        self.assertEqual(await SceneResult.objects.acount(), 3)
+
+        second = await self.new_scene('b')
+        for operation_type in ['AUTO_ORIENT', 'AUTO_SUPPORT', 'SAVE_FORM']:
+            operation = await self.client.launch(operation_type, second)
+            self.assertTrue(operation.cache_hit)
+
+        self.assertEqual(self.server_operations(second), [])
+        await second.arefresh_from_db()
+        self.assertEqual(
+            (second.form_file_path, second.layer_count, second.volume_ml),
+            (f'/forms/{first.preform_scene_id}.form', FORM_LAYER_COUNT, FORM_VOLUME_ML),
+        )
+
+    async def test_poller_records_the_saved_form_on_the_scene(self):
+        scene = await self.new_scene('a')
+
+        await self.finish('SAVE_FORM', scene, {'file': '/forms/a.form'})
+
+        await scene.arefresh_from_db()
+        self.assertEqual(
+            (scene.form_file_path, scene.layer_count, scene.volume_ml),
+            ('/forms/a.form', FORM_LAYER_COUNT, FORM_VOLUME_ML),
+        )
+        entry = await SceneResult.objects.aget(operation_type='SAVE_FORM')
+        self.assertEqual((entry.form_file_path, entry.volume_ml), ('/forms/a.form', 25.0))
+
+    async def test_orient_is_not_a_hit_without_a_cached_form_file(self):
+        first = await self.new_scene('a')
+        await self.run_chain(first, steps=['AUTO_ORIENT', 'AUTO_SUPPORT'])
+
+        second = await self.new_scene('b')
+        operation = await self.client.launch('AUTO_ORIENT', second)
+
+        self.assertFalse(operation.cache_hit)
+        self.assertEqual(self.server_operations(second), ['AUTO_ORIENT'])
+
+    async def test_cached_steps_are_replayed_before_a_miss(self):
+        first = await self.new_scene('a')
+        await self.run_chain(first)
+
+        second = await self.new_scene('b')
+        self.assertTrue((await self.client.launch('AUTO_ORIENT', second)).cache_hit)
+        operation = await self.client.launch('AUTO_SUPPORT', second, {'density': 'high'})
+
+        self.assertFalse(operation.cache_hit)
+        self.assertEqual(self.server_operations(second), ['AUTO_ORIENT', 'AUTO_SUPPORT'])
+        self.assertEqual(await scene_cache.pending_steps(second), [])
+        self.assertTrue(await AsyncOperation.objects.filter(scene=second, replayed=True).aexists())
+
+    async def test_eviction_drops_whole_chains(self):
+        first = await self.new_scene('a')
+        await self.run_chain(first)
+        other = await self.new_scene('b', content='b' * 64)
+        await self.run_chain(other)
+
+        deleted = await scene_cache.evict(max_entries=4)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(
+            {key async for key in SceneResult.objects.values_list('chain_key', flat=True).distinct()},
+            {(await AsyncOperation.objects.filter(scene=other).order_by('created_at').afirst()).cache_key},
+        )
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.now = timezone.now()
+
+    def printer(self, serial, status='IDLE'):
+        return Printer.objects.create(
+            id=serial, name=serial, machine_type_id='FORM-4-0', tank_material_id='FLGPGR05',
+            status=status, is_connected=True,
+        )
+
+    def job(self, name, status='READY', printer=None, priority='STANDARD', hours=2, started_at=None):
+        batch = PrintBatch.objects.create(
+            material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), machine_type_id='FORM-4-0',
+            status='READY', priority=priority,
+        )
+        return PrintJob.objects.create(
+            batch=batch, job_name=name, status=status, printer=printer,
+            estimated_print_time_s=hours * 3600, started_at=started_at,
+        )
+
+    def test_idle_printer_gets_the_most_urgent_job(self):
+        printer = self.printer('SN-1')
+        standard = self.job('standard')
+        rush = self.job('rush', priority='RUSH')
+
+        summary = schedule_jobs()
+
+        self.assertEqual(summary['dispatched'], 1)
+        self.assertEqual(summary['planned'], 2)
+        rush.refresh_from_db()
+        self.assertEqual((rush.status, rush.printer_id), ('QUEUED', printer.id))
+        self.assertEqual(PrintJob.objects.get(pk=standard.pk).status, 'READY')
+        self.assertEqual(PrintBatch.objects.get(pk=rush.batch_id).status, 'SCHEDULED')
+        self.assertEqual(summary['plan'][1]['start'], summary['plan'][0]['end'])
+
+    def test_printing_printer_past_its_estimate_is_only_planned(self):
+        printer = self.printer('SN-1', status='PRINTING')
+        self.job('running', status='PRINTING', printer=printer, started_at=self.now - timedelta(hours=5))
+        waiting = self.job('waiting')
+
+        summary = schedule_jobs()
+
+        self.assertEqual(summary['dispatched'], 0)
+        self.assertEqual(summary['plan'][0]['printer_id'], printer.id)
+        self.assertFalse(summary['plan'][0]['dispatched'])
+        self.assertEqual(PrintJob.objects.get(pk=waiting.pk).status, 'READY')
+
+    def test_idle_printer_is_preferred_over_an_overrunning_one(self):
+        printing = self.printer('SN-1', status='PRINTING')
+        self.job('running', status='PRINTING', printer=printing, started_at=self.now - timedelta(hours=5))
+        idle = self.printer('SN-2')
+        waiting = self.job('waiting')
+
+        self.assertEqual(schedule_jobs()['dispatched'], 1)
+        self.assertEqual(PrintJob.objects.get(pk=waiting.pk).printer_id, idle.id)
+
+    def test_job_without_a_matching_printer_is_unschedulable(self):
+        job = self.job('orphan')
+
+        summary = schedule_jobs()
+
+        self.assertEqual(summary['unschedulable'], [job.pk])
+        self.assertEqual(summary['planned'], 0)
+
+    def test_dry_run_dispatches_nothing(self):
+        self.printer('SN-1')
+        job = self.job('job')
+
+        summary = schedule_jobs(dry_run=True)
+
+        self.assertEqual(summary['dispatched'], 0)
+        self.assertEqual(summary['planned'], 1)
+        self.assertEqual(PrintJob.objects.get(pk=job.pk).status, 'READY')
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.now = timezone.now()
+
+    def printer(self):
+        return Printer.objects.create(
+            id='SN-1', name='SN-1', machine_type_id='FORM-4-0', tank_material_id='FLGPGR05',
+            status='IDLE', is_connected=True,
+        )
+
+    def risks(self, **kwargs):
+        return {row['external_id']: row['risk'] for row in forecast_orders(**kwargs)['orders']}
+
+    def test_order_without_a_printer_has_no_capacity(self):
+        make_order('a', due_date=self.now + timedelta(days=30))
+
+        forecast = forecast_orders()
+
+        self.assertEqual((forecast['no_capacity'], forecast['open_orders']), (1, 1))
+        self.assertEqual(self.risks(), {'a': 'NO_CAPACITY'})
+        self.assertIsNone(forecast['orders'][0]['projected_ready_at'])
+
+    def test_risk_levels(self):
+        self.printer()
+        make_order('on-track', due_date=self.now + timedelta(days=30))
+        make_order('at-risk', due_date=self.now + timedelta(seconds=FINISHING_TIME_S + 3600))
+        make_order('late', due_date=self.now + timedelta(hours=1))
+        make_order('undated')
+
+        self.assertEqual(self.risks(), {'late': 'LATE', 'at-risk': 'AT_RISK'})
+        self.assertEqual(
+            list(self.risks(include_on_track=True).items()),
+            [('late', 'LATE'), ('at-risk', 'AT_RISK'), ('on-track', 'ON_TRACK'), ('undated', None)],
+        )
+
+    def test_running_job_delays_the_queue(self):
+        printer = self.printer()
+        make_order('a', due_date=self.now + timedelta(days=30))
+        self.assertEqual(self.risks(include_on_track=True), {'a': 'ON_TRACK'})
+
+        batch = PrintBatch.objects.create(
+            material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), machine_type_id='FORM-4-0', status='PRINTING',
+        )
+        PrintJob.objects.create(
+            batch=batch, job_name='long', status='PRINTING', printer=printer,
+            started_at=self.now, estimated_print_time_s=200 * DEFAULT_PRINT_TIME_S,
+        )
+
+        self.assertEqual(self.risks(), {'a': 'LATE'})
+
+
+class ResinTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.now = timezone.now()
+
+    def printer(self, serial, remaining_ml=None):
+        printer = Printer.objects.create(
+            id=serial, name=serial, machine_type_id='FORM-4-0', tank_material_id='FLGPGR05',
+            status='IDLE', is_connected=True,
+        )
+        if remaining_ml is not None:
+            CartridgeData.objects.create(
+                printer=printer, slot='A', material_id='FLGPGR05',
+                original_volume_ml=1000, volume_dispensed_ml=1000 - remaining_ml,
+            )
+        return printer
+
+    def job(self, name, status='READY', printer=None, volume_ml=None, **fields):
+        batch = PrintBatch.objects.create(
+            material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), machine_type_id='FORM-4-0', status='READY',
+        )
+        scene = Scene.objects.create(
+            machine_type_id='FORM-4-0', material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), volume_ml=volume_ml,
+        )
+        return PrintJob.objects.create(
+            batch=batch, job_name=name, status=status, printer=printer, scene=scene, **fields
+        )
+
+    def test_queued_jobs_are_reserved(self):
+        printer = self.printer('SN-1', remaining_ml=100)
+        self.job('queued', status='QUEUED', printer=printer, volume_ml=50)
+        ledger = ResinLedger.load(self.now)
+
+        self.assertTrue(ledger.can_run('SN-1', 'FLGPGR05', 100 - 50 - RESIN_HEADROOM_ML))
+        self.assertFalse(ledger.can_run('SN-1', 'FLGPGR05', 100 - 50 - RESIN_HEADROOM_ML + 1))
+        self.assertFalse(ledger.can_run('SN-1', 'FLTO2001', 1))
+        self.assertTrue(ledger.can_run('SN-1', 'FLGPGR05', None))
+        # No cartridge readings, nothing to check against
+        self.assertTrue(ledger.can_run('SN-2', 'FLGPGR05', 10_000))
+
+        ledger.reserve('SN-1', 'FLGPGR05', 30)
+        self.assertFalse(ledger.can_run('SN-1', 'FLGPGR05', 30))
+
+    def test_printing_job_holds_back_its_unprinted_share(self):
+        printer = self.printer('SN-1', remaining_ml=500)
+        self.job(
+            'printing', status='PRINTING', printer=printer, volume_ml=100,
+            started_at=self.now - timedelta(hours=1), estimated_print_time_s=4 * 3600,
+        )
+
+        self.assertAlmostEqual(reserved_resin(self.now)[('SN-1', 'FLGPGR05')], 75)
+
+    def test_job_without_scene_volume_uses_its_parts(self):
+        printer = self.printer('SN-1', remaining_ml=500)
+        job = self.job('queued', status='QUEUED', printer=printer)
+        item = make_order(items=((4, 'FLGPGR05', '0.1'),)).items.get()
+        item.volume_ml = 10
+        item.save(update_fields=['volume_ml'])
+        batch_item = BatchItem.objects.create(batch=job.batch, order_item=item, quantity=4)
+        PrintJobItem.objects.create(job=job, batch_item=batch_item, quantity=4)
+
+        self.assertAlmostEqual(reserved_resin(self.now)[('SN-1', 'FLGPGR05')], 40 * SUPPORT_ALLOWANCE)
+
+    def test_scheduler_skips_a_printer_that_would_run_dry(self):
+        self.printer('SN-1', remaining_ml=20)
+        self.printer('SN-2', remaining_ml=500)
+        # The longer job is planned first
+        fits = self.job('fits', volume_ml=200, estimated_print_time_s=7200)
+        too_big = self.job('too-big', volume_ml=400, estimated_print_time_s=3600)
+
+        result = schedule_jobs(dry_run=True)
+
+        self.assertEqual({row['job_id']: row['printer_id'] for row in result['plan']}, {fits.id: 'SN-2'})
+        self.assertEqual(result['short_of_resin'], [too_big.id])
+
+    def test_shortage_forecast(self):
+        printer = self.printer('SN-1', remaining_ml=300)
+        self.job('queued', status='QUEUED', printer=printer, volume_ml=200)
+        self.job('waiting', volume_ml=250)
+        self.job('unmeasured')
+        self.job('done', status='COMPLETED', volume_ml=140, completed_at=self.now - timedelta(days=1))
+
+        [row] = shortage_forecast(self.now)
+
+        self.assertEqual(row['material'], 'FLGPGR05')
+        self.assertEqual((row['remaining_ml'], row['reserved_ml'], row['waiting_ml']), (300, 200, 250))
+        self.assertEqual((row['shortfall_ml'], row['jobs_without_volume']), (150, 1))
+        self.assertEqual((row['daily_usage_ml'], row['days_of_stock']), (10, 30))
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.printer = Printer.objects.create(id='SN-1', name='SN-1', machine_type_id='FORM-4-0')
+        self.batch = PrintBatch.objects.create(
+            material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), machine_type_id='FORM-4-0',
+        )
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+        self.first = self.today - timedelta(days=2)
+        self.second = self.today - timedelta(days=1)
+
+    def at(self, day, hour):
+        return timezone.make_aware(datetime.combine(day, time(hour)))
+
+    def job(self, status, queued_at, started_at, completed_at=None, **fields):
+        return PrintJob.objects.create(
+            batch=self.batch, job_name=status, printer=self.printer, status=status,
+            queued_at=queued_at, started_at=started_at, completed_at=completed_at, **fields
+        )
+
+    def history(self):
+        # Overnight: two hours on each day, three hours estimated for four
+        self.job(
+            'COMPLETED', self.at(self.first, 21), self.at(self.first, 22), self.at(self.second, 2),
+            estimated_print_time_s=3 * 3600,
+        )
+        failed = self.job(
+            'FAILED', self.at(self.second, 2), self.at(self.second, 3), self.at(self.second, 4),
+            failure_reason='Resin tank worn\nreplace before the next print',
+        )
+        item = make_order().items.get()
+        FailedPartRecord.objects.create(
+            order_item=item, original_job=failed, quantity=3, failure_type='PRINT_FAILED',
+        )
+        FailedPartRecord.objects.update(created_at=self.at(self.second, 4))
+
+    def test_rollup_splits_prints_at_midnight(self):
+        self.history()
+
+        self.assertEqual(rollup(self.first, now=self.now), {'days': 2, 'rows': 2})
+
+        first, second = PrinterDayStats.objects.order_by('day')
+        self.assertEqual((first.day, first.busy_s, first.queue_waits_s), (self.first, 7200, [3600]))
+        self.assertEqual((first.jobs_started, first.jobs_completed), (1, 0))
+        self.assertEqual((second.busy_s, second.jobs_started), (3 * 3600, 1))
+        self.assertEqual((second.jobs_completed, second.jobs_failed), (1, 1))
+        self.assertEqual((second.print_times_s, second.estimate_error_s), ([4 * 3600], 3600))
+        self.assertEqual(second.failure_reasons, {'Resin tank worn': 1})
+        self.assertEqual(second.failed_parts, {'PRINT_FAILED': 3})
+        self.assertEqual(second.machine_type_id, 'FORM-4-0')
+
+    def test_rollup_sums_estimates_of_one_printer_day(self):
+        self.job(
+            'COMPLETED', self.at(self.second, 1), self.at(self.second, 1), self.at(self.second, 3),
+            estimated_print_time_s=3600,
+        )
+        self.job(
+            'COMPLETED', self.at(self.second, 4), self.at(self.second, 4), self.at(self.second, 5),
+            estimated_print_time_s=1800,
+        )
+        self.job('COMPLETED', self.at(self.second, 6), self.at(self.second, 6), self.at(self.second, 7))
+
+        rollup(self.second, now=self.now)
+
+        stats = PrinterDayStats.objects.get()
+        self.assertEqual((stats.jobs_started, stats.jobs_completed, stats.estimated_jobs), (3, 3, 2))
+        self.assertEqual((stats.estimate_s, stats.estimate_error_s), (5400, 3 * 3600 - 5400))
+        self.assertEqual(sorted(stats.print_times_s), [3600, 3600, 7200])
+
+    def test_rollup_replaces_and_never_stores_today(self):
+        self.history()
+        rollup(self.first, now=self.now)
+
+        self.assertEqual(rollup(self.first, self.today, now=self.now), {'days': 2, 'rows': 2})
+        self.assertEqual(PrinterDayStats.objects.count(), 2)
+        self.assertEqual(rollup(self.today, now=self.now), {'days': 0, 'rows': 0})
+
+    def test_fleet_analytics_reads_the_rollup_and_today_live(self):
+        self.history()
+        rollup(self.first, now=self.now)
+        self.job('PRINTING', self.at(self.today, 0), self.at(self.today, 0))
+
+        analytics = fleet_analytics(since=self.first, until=self.today + timedelta(days=1), now=self.now)
+
+        totals = analytics['totals']
+        self.assertEqual((totals['jobs_started'], totals['jobs_completed'], totals['jobs_failed']), (3, 1, 1))
+        self.assertEqual((totals['failure_rate'], totals['estimate_ratio']), (0.5, 1.333))
+        self.assertEqual(totals['print_time_s']['p50'], 4 * 3600)
+        self.assertEqual(totals['failure_reasons'], {'Resin tank worn': 1})
+        elapsed = self.now - self.at(self.first, 0)
+        busy = 5 * 3600 + (self.now - self.at(self.today, 0)).total_seconds()
+        self.assertEqual(totals['utilization'], round(busy / elapsed.total_seconds(), 3))
+        self.assertEqual([row['printer'] for row in analytics['groups']], ['SN-1'])
+        self.assertEqual([row['period'] for row in analytics['series']], [self.first, self.second, self.today])
+        self.assertEqual([row['jobs_started'] for row in analytics['series']], [1, 1, 1])
+
+
+class OperationPollerTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.server = FakePreFormServer(steps=3, fail_operations=['AUTO_LAYOUT'])
+        self.client = PreFormClient(base_url='http://preform.test', transport=self.server.transport)
+        self.addCleanup(async_to_sync(self.client.aclose))
+        self.poller = OperationPoller(self.client, min_interval=0.001, max_interval=0.004)
+
+    async def launch(self, operation_type):
+        data = await self.client.create_scene('FORM-4-0', 'FLGPGR05', '0.1')
+        scene = await sync_to_async(make_scene)(data['id'])
+        return await self.client.launch(operation_type, scene)
+
+    async def test_launch_starts_the_operation_asynchronously(self):
+        operation = await self.launch('AUTO_ORIENT')
+
+        self.assertEqual(operation.status, 'IN_PROGRESS')
+        request = self.server.requests[-1]
+        self.assertEqual(request.url.path, f'/scene/{operation.scene.preform_scene_id}/auto-orient/')
+        self.assertEqual(request.url.params['async'], 'true')
+        self.assertIn(str(operation.operation_id), self.server.operations)
+
+    async def test_poll_follows_the_operation_to_success(self):
+        operation = await self.launch('AUTO_ORIENT')
+
+        progress = []
+        for _ in range(3):
+            self.assertEqual(await self.poller.tick(), (1, 0))
+            await operation.arefresh_from_db()
+            progress.append(operation.progress)
+
+        self.assertEqual(operation.status, 'SUCCEEDED')
+        self.assertEqual(progress, [1 / 3, 2 / 3, 1.0])
+        self.assertIsNotNone(operation.completed_at)
+        self.assertEqual(await self.poller.tick(), (0, 0))
+
+    async def test_failed_operation_keeps_the_error(self):
+        operation = await self.launch('AUTO_LAYOUT')
+        for _ in range(3):
+            await self.poller.tick()
+
+        await operation.arefresh_from_db()
+        self.assertEqual(operation.status, 'FAILED')
+        self.assertEqual(operation.error_message, 'AUTO_LAYOUT failed')
+
+    async def test_operation_unknown_to_the_server_fails(self):
+        operation = await AsyncOperation.objects.acreate(operation_id=uuid.uuid4(), operation_type='AUTO_ORIENT')
+
+        self.assertEqual(await self.poller.tick(), (1, 0))
+
+        await operation.arefresh_from_db()
+        self.assertEqual(operation.status, 'FAILED')
+        self.assertIn('not found', operation.error_message)
+
+    async def test_unreachable_operation_fails_once_too_old(self):
+        def unreachable(request):
+            raise httpx.ConnectError('connection refused', request=request)
+
+        self.client = PreFormClient(base_url='http://preform.test', transport=httpx.MockTransport(unreachable))
+        poller = OperationPoller(self.client)
+        recent = await AsyncOperation.objects.acreate(operation_id=uuid.uuid4(), operation_type='AUTO_ORIENT')
+        stale = await AsyncOperation.objects.acreate(operation_id=uuid.uuid4(), operation_type='AUTO_ORIENT')
+        await AsyncOperation.objects.filter(pk=stale.pk).aupdate(created_at=timezone.now() - timedelta(hours=3))
+
+        with self.assertLogs('apps.production.preform', 'WARNING'):
+            self.assertEqual(await poller.tick(), (1, 2))
+
+        await recent.arefresh_from_db()
+        await stale.arefresh_from_db()
+        self.assertEqual((recent.status, stale.status), ('IN_PROGRESS', 'FAILED'))
+        await self.client.aclose()
+
+    async def run_ticks(self, count):
+        """Run the poller loop for `count` ticks"""
+        stop = asyncio.Event()
+        tick = self.poller.tick
+        ticks = []
+
+        async def counted():
+            ticks.append(self.poller.interval)
+            if len(ticks) == count:
+                stop.set()
+            return await tick()
+
+        self.poller.tick = counted
+        try:
+            await self.poller.run(stop)
+        finally:
+            del self.poller.tick
+        return ticks
+
+    async def test_interval_backs_off_while_idle_and_resets_on_change(self):
+        self.assertEqual(await self.run_ticks(4), [0.001, 0.002, 0.004, 0.004])
+
+        await self.launch('AUTO_ORIENT')
+        await self.run_ticks(1)
+        self.assertEqual(self.poller.interval, 0.001)
+
+
+class LayoutTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+
+    def test_parts_do_not_overlap_and_stay_on_the_plate(self):
+        sizes = [(40, 30, 10)] * 12 + [(90, 20, 5), (20, 90, 5)]
+        packed = pack_parts(sizes, 200, 125, 210, spacing_mm=2.0)
+
+        self.assertTrue(packed['in_bounds'].all())
+        footprints = [
+            (depth, width) if turned else (width, depth)
+            for (width, depth, _), turned in zip(sizes, packed['rotated'])
+        ]
+        for part, (width, depth) in enumerate(footprints):
+            self.assertLessEqual(abs(packed['x'][part]) + width / 2, 100)
+            self.assertLessEqual(abs(packed['y'][part]) + depth / 2, 62.5)
+            for other in range(part + 1, len(sizes)):
+                if packed['plate'][part] != packed['plate'][other]:
+                    continue
+                overlap_x = abs(packed['x'][part] - packed['x'][other]) < (width + footprints[other][0]) / 2
+                overlap_y = abs(packed['y'][part] - packed['y'][other]) < (depth + footprints[other][1]) / 2
+                self.assertFalse(overlap_x and overlap_y, (part, other))
+
+    def test_overflow_opens_another_plate(self):
+        packed = pack_parts([(90, 60, 10)] * 5, 200, 125, 210, spacing_mm=2.0)
+
+        self.assertEqual(packed['plate_count'], 2)
+        self.assertEqual(sorted(np.bincount(packed['plate'])), [1, 4])
+
+    def test_part_too_large_is_out_of_bounds(self):
+        packed = pack_parts([(10, 10, 300), (300, 10, 10), (10, 10, 10)], 200, 125, 210)
+
+        self.assertEqual(list(packed['in_bounds']), [False, False, True])
+        self.assertEqual(packed['plate_count'], 1)
+
+    def batch(self):
+        items = make_order(items=((3, 'FLGPGR05', '0.1'),)).items.all()
+        items.update(bounding_box_x=40, bounding_box_y=30, bounding_box_z=10)
+        batch = PrintBatch.objects.create(
+            material_id='FLGPGR05', layer_thickness_mm=Decimal('0.1'), machine_type_id='FORM-4-0'
+        )
+        BatchItem.objects.create(batch=batch, order_item=items.get(), quantity=3)
+        return batch
+
+    def test_rerun_replaces_the_earlier_layout(self):
+        batch = self.batch()
+        first = layout_batch(batch)
+
+        second = layout_batch(batch)
+
+        self.assertEqual((first['parts_placed'], second['scenes_replaced']), (3, 1))
+        self.assertEqual(list(Scene.objects.values_list('id', flat=True)), second['scene_ids'])
+        self.assertEqual(SceneModel.objects.count(), 3)
+
+    def test_rerun_keeps_a_scene_a_job_prints_from(self):
+        batch = self.batch()
+        printed = layout_batch(batch)['scene_ids'][0]
+        PrintJob.objects.create(batch=batch, job_name='job', scene_id=printed)
+
+        rerun = layout_batch(batch)
 
-# Create your tests here.
+        self.assertEqual(rerun['scenes_replaced'], 0)
+        self.assertEqual(Scene.objects.count(), 2)
+        self.assertEqual(SceneModel.objects.filter(scene_id=printed).count(), 3)
@@ -3,15 +3,23 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Count
 
+from apps.core.exports import ExportMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
+from .analytics import fleet_analytics
 from .models import PrintJob, PrintJobItem
+from .resin import shortage_forecast
+from .scheduler import schedule_jobs
 from .serializers import (
     PrintJobListSerializer,
     PrintJobDetailSerializer,
     PrintJobUpdateSerializer,
-    PrintJobItemSerializer
+    PrintJobItemSerializer,
+    ScheduleSerializer,
+    AnalyticsSerializer
 )
 
-class PrintJobViewSet(viewsets.ModelViewSet):
+class PrintJobViewSet(ExportMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Manages the Print Queue.
     
@@ -19,12 +27,39 @@ class PrintJobViewSet(viewsets.ModelViewSet):
     - List View: Fetches printer, batch, and assigned employee info.
     - Detail View: Deeply prefetches items -> batch_item -> order_item -> order 
       to populate the nested item fields without N+1 queries.
+    - Export: one row per part (see core.exports).
     """
+    cursor_ordering = ('-created_at', '-id')
+    query_budget = {'list': 1, 'retrieve': 5}
+    required_permissions = {'claim': 'can_print', 'schedule': 'can_print'}
     queryset = PrintJob.objects.all().select_related(
         'printer', 
         'batch', 
         'assigned_to__user'
     )
+    export_date_field = 'created_at'
+    export_ordering = ('items__id',)
+    export_fields = {
+        'job_id': 'id',
+        'job_name': 'job_name',
+        'status': 'status',
+        'batch_id': 'batch_id',
+        'printer_id': 'printer_id',
+        'material': 'batch__material_id',
+        'machine_type': 'batch__machine_type_id',
+        'estimated_print_time_s': 'estimated_print_time_s',
+        'failure_reason': 'failure_reason',
+        'created_at': 'created_at',
+        'queued_at': 'queued_at',
+        'started_at': 'started_at',
+        'completed_at': 'completed_at',
+        'job_item_id': 'items__id',
+        'order_id': 'items__batch_item__order_item__order_id',
+        'order_item_id': 'items__batch_item__order_item_id',
+        'is_reprint': 'items__batch_item__is_reprint',
+        'quantity': 'items__quantity',
+        'item_status': 'items__status',
+    }
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -46,6 +81,11 @@ class PrintJobViewSet(viewsets.ModelViewSet):
         # Use the specific state-transition serializer for updates
         if self.action in ['update', 'partial_update']:
             return PrintJobUpdateSerializer
+
+        if self.action == 'schedule':
+            return ScheduleSerializer
+        if self.action == 'analytics':
+            return AnalyticsSerializer
             
         return PrintJobDetailSerializer
 
@@ -62,12 +102,45 @@ class PrintJobViewSet(viewsets.ModelViewSet):
             return Response({'status': 'job claimed', 'assigned_to': str(request.user.employee)})
         return Response({'error': 'User is not an employee'}, status=400)
 
+    @action(detail=False, methods=['post'])
+    def schedule(self, request):
+        """
+        Assign READY jobs to compatible idle printers.
+        With dry_run=true, only returns the planned Gantt chart.
+        """
+        serializer = ScheduleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(schedule_jobs(**serializer.validated_data))
+
+    @action(detail=False, methods=['get'])
+    def resin(self, request):
+        """
+        Per material: resin in the fleet's cartridges against what queued
+        and waiting jobs need, and how many days it lasts at recent usage.
+        Materials short of resin first.
+        """
+        return Response(shortage_forecast())
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Fleet utilization, throughput, print time against estimate,
+        failure rates and queue wait percentiles for ?since=..&until=..
+        (the last 30 days by default), per ?group_by=printer|machine_type
+        and over time per ?bucket=day|week|month. Read from the daily
+        rollup (manage.py rollup_print_stats); today is computed live.
+        """
+        serializer = AnalyticsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(fleet_analytics(**serializer.validated_data))
+
 
-class PrintJobItemViewSet(viewsets.ReadOnlyModelViewSet):
+class PrintJobItemViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """
     Read-only access to individual job items.
     Useful for looking up a specific label/part on the floor.
     """
+    query_budget = {'list': 1, 'retrieve': 1}
     queryset = PrintJobItem.objects.all().select_related(
         'batch_item__order_item__order'
     )
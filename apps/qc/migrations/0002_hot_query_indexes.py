@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qc', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='qcinspection',
+            index=models.Index(fields=['status'], name='qcinspection_status_idx'),
+        ),
+    ]
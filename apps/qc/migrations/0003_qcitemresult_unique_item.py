@@ -0,0 +1,34 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:43
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_results(apps, schema_editor):
+    """Keep the newest result per (inspection, print_job_item) so the constraint can be added"""
+    QCItemResult = apps.get_model('qc', 'QCItemResult')
+    duplicates = (
+        QCItemResult.objects.values('inspection', 'print_job_item')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        QCItemResult.objects.filter(
+            inspection=row['inspection'], print_job_item=row['print_job_item']
+        ).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0004_hot_query_indexes'),
+        ('qc', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_results, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='qcitemresult',
+            constraint=models.UniqueConstraint(fields=('inspection', 'print_job_item'), name='qcitemresult_unique_item'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.1.2 on 2026-10-17 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0001_initial'),
+        ('production', '0004_hot_query_indexes'),
+        ('qc', '0003_qcitemresult_unique_item'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='qcinspection',
+            index=models.Index(fields=['completed_at'], name='qcinspection_completed_idx'),
+        ),
+    ]
@@ -32,6 +32,14 @@ class QCInspection(models.Model):
     
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Inspection queue (PENDING / IN_PROGRESS)
+            models.Index(fields=['status'], name='qcinspection_status_idx'),
+            # Date-range exports
+            models.Index(fields=['completed_at'], name='qcinspection_completed_idx'),
+        ]
+
 
 class QCItemResult(models.Model):
     """Per-item QC results"""
@@ -50,6 +58,12 @@ class QCItemResult(models.Model):
     # Photo documentation
     photos = models.JSONField(default=list)  # List of file paths
 
+    class Meta:
+        constraints = [
+            # One result per part per inspection; QC submit upserts on it
+            models.UniqueConstraint(fields=['inspection', 'print_job_item'], name='qcitemresult_unique_item'),
+        ]
+
 
 class QCChecklist(models.Model):
     """Checklist template for QC inspections"""
@@ -0,0 +1,158 @@
+# qc/results.py
+"""
+QC submission: stores an inspection's per-part results and rolls them
+forward into production in one transaction and a fixed number of queries,
+however many parts are on the build plate:
+
+    1. the job's parts and their order items      PrintJobItem
+    2. lock on the inspection row                 QCInspection
+    3. results already stored for the inspection  QCItemResult
+    4. upsert of the submitted results            QCItemResult
+    5. reprint records for newly failed parts     FailedPartRecord
+    6. passed / failed state of every part        PrintJobItem (CASE)
+    7. the inspection itself                      QCInspection
+    8. the changes into order progress            OrderItem / Order
+       (quantity_completed and quantity_failed, see orders.progress)
+
+Re-submitting an inspection only applies the difference from what was
+stored before, so counts are never applied twice. Submissions of the same
+inspection are serialized by the row lock, so two at once cannot both
+apply their difference from the same stored results.
+
+A re-submission with fewer failed parts withdraws them from the job's
+QC_DEFECT records, newest first (a few more queries, only then; the
+progress receivers roll those saves and deletes forward). Failed parts
+already requeued as reprints cannot be withdrawn, and such a
+submission is rejected.
+"""
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from rest_framework import serializers
+
+from apps.orders import progress
+from apps.production.models import FailedPartRecord, PrintJobItem
+from .models import QCInspection, QCItemResult
+
+RESULT_FIELDS = ['quantity_passed', 'quantity_failed', 'failure_reason', 'photos']
+
+
+def load_job_items(inspection, item_ids):
+    """{PrintJobItem id: (quantity, order_item_id)} for the ids that belong to the inspected job"""
+    return {
+        item_id: (quantity, order_item_id)
+        for item_id, quantity, order_item_id in PrintJobItem.objects.filter(
+            job_id=inspection.print_job_id, id__in=item_ids
+        ).values_list('id', 'quantity', 'batch_item__order_item_id')
+    }
+
+
+def _case(values, output_field):
+    """CASE id WHEN ... THEN value END over {id: value}"""
+    return Case(
+        *(When(id=pk, then=Value(value)) for pk, value in values.items()),
+        output_field=output_field,
+    )
+
+
+def _withdraw_failures(inspection, order_item_id, quantity):
+    """
+    Take `quantity` failed parts of the order item off the job's unrequeued
+    QC_DEFECT records, newest first; False if fewer than that are left
+    """
+    records = list(FailedPartRecord.objects.filter(
+        original_job_id=inspection.print_job_id,
+        order_item_id=order_item_id,
+        failure_type='QC_DEFECT',
+        requeued=False,
+    ).order_by('-created_at', '-pk'))
+    if sum(record.quantity for record in records) < quantity:
+        return False
+    for record in records:
+        if quantity <= 0:
+            break
+        if record.quantity <= quantity:
+            quantity -= record.quantity
+            record.delete()
+        else:
+            record.quantity -= quantity
+            record.save(update_fields=['quantity'])
+            quantity = 0
+    return True
+
+
+def submit_inspection(inspection, result, notes, item_results, job_items):
+    """
+    Complete `inspection` with validated `item_results` (dicts with
+    print_job_item, quantity_passed, quantity_failed, failure_reason,
+    photos) for parts described by `job_items` (see load_job_items).
+    Raises ValidationError if it withdraws failures already requeued.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        QCInspection.objects.select_for_update().only('pk').get(pk=inspection.pk)
+        previous = {
+            item_id: (passed, failed)
+            for item_id, passed, failed in QCItemResult.objects.filter(inspection=inspection).values_list(
+                'print_job_item_id', 'quantity_passed', 'quantity_failed'
+            )
+        }
+
+        rows = []
+        failures = []
+        withdrawn = []  # (order_item_id, quantity) no longer failed
+        item_changes = progress.changes()
+        part_status = {}  # PrintJobItem id -> status
+        for data in item_results:
+            item_id = data['print_job_item']
+            passed, failed = data['quantity_passed'], data['quantity_failed']
+            _, order_item_id = job_items[item_id]
+            old_passed, old_failed = previous.get(item_id, (0, 0))
+
+            rows.append(QCItemResult(
+                inspection=inspection,
+                print_job_item_id=item_id,
+                quantity_passed=passed,
+                quantity_failed=failed,
+                failure_reason=data.get('failure_reason', ''),
+                photos=data.get('photos', []),
+            ))
+            item_changes[order_item_id]['quantity_completed'] += passed - old_passed
+            if failed > old_failed:
+                item_changes[order_item_id]['quantity_failed'] += failed - old_failed
+                failures.append(FailedPartRecord(
+                    order_item_id=order_item_id,
+                    original_job_id=inspection.print_job_id,
+                    quantity=failed - old_failed,
+                    failure_type='QC_DEFECT',
+                    failure_reason=data.get('failure_reason', ''),
+                    created_by_id=inspection.inspected_by_id,
+                ))
+            elif failed < old_failed:
+                withdrawn.append((order_item_id, old_failed - failed))
+            part_status[item_id] = 'FAILED' if failed and not passed else 'PRINTED'
+
+        QCItemResult.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['inspection', 'print_job_item'],
+            update_fields=RESULT_FIELDS,
+        )
+        FailedPartRecord.objects.bulk_create(failures)
+        for order_item_id, quantity in withdrawn:
+            if not _withdraw_failures(inspection, order_item_id, quantity):
+                raise serializers.ValidationError({
+                    'item_results': ["Failed parts already requeued as reprints cannot be withdrawn."]
+                })
+        if part_status:
+            PrintJobItem.objects.filter(id__in=part_status.keys()).update(
+                status=_case(part_status, PrintJobItem._meta.get_field('status'))
+            )
+
+        inspection.result = result
+        inspection.notes = notes
+        inspection.status = 'COMPLETED'
+        inspection.completed_at = now
+        inspection.save(update_fields=['result', 'notes', 'status', 'completed_at'])
+        progress.record(item_changes)
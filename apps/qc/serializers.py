@@ -1,8 +1,8 @@
 # qc/serializers.py
 
-from datetime import datetime
 from rest_framework import serializers
 from .models import QCInspection, QCItemResult
+from .results import load_job_items, submit_inspection
 
 
 class QCItemResultSerializer(serializers.ModelSerializer):
@@ -36,31 +36,50 @@ class QCInspectionSerializer(serializers.ModelSerializer):
         ]
 
 
+class QCItemSubmitSerializer(serializers.Serializer):
+    """
+    One part's result within a submit. The part is a plain id, checked
+    for the whole submission at once instead of one lookup per part.
+    """
+    print_job_item = serializers.IntegerField()
+    quantity_passed = serializers.IntegerField(min_value=0)
+    quantity_failed = serializers.IntegerField(min_value=0)
+    failure_reason = serializers.CharField(required=False, allow_blank=True, default='')
+    photos = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+
+
 class QCInspectionSubmitSerializer(serializers.Serializer):
     """For submitting QC results"""
     result = serializers.ChoiceField(choices=['PASSED', 'PARTIAL', 'FAILED'])
     notes = serializers.CharField(required=False, allow_blank=True)
-    item_results = QCItemResultSerializer(many=True)
-    
+    item_results = QCItemSubmitSerializer(many=True)
+
+    def validate_item_results(self, item_results):
+        item_ids = [data['print_job_item'] for data in item_results]
+        duplicates = sorted({item_id for item_id in item_ids if item_ids.count(item_id) > 1})
+        if duplicates:
+            raise serializers.ValidationError(f"Duplicate print_job_item: {', '.join(map(str, duplicates))}")
+
+        self.job_items = load_job_items(self.instance, item_ids)
+        errors = []
+        for data in item_results:
+            part = self.job_items.get(data['print_job_item'])
+            if part is None:
+                errors.append({'print_job_item': ["Not a part of this inspection's print job."]})
+            elif data['quantity_passed'] + data['quantity_failed'] > part[0]:
+                errors.append({'quantity_failed': [f"Passed and failed exceed the {part[0]} printed."]})
+            else:
+                errors.append({})
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return item_results
+
     def update(self, instance, validated_data):
-        item_results_data = validated_data.pop('item_results')
-        
-        instance.result = validated_data.get('result', instance.result)
-        instance.notes = validated_data.get('notes', instance.notes)
-        instance.status = 'COMPLETED'
-        instance.completed_at = datetime.now()
-        instance.save()
-        
-        for item_data in item_results_data:
-            QCItemResult.objects.update_or_create(
-                inspection=instance,
-                print_job_item=item_data['print_job_item'],
-                defaults={
-                    'quantity_passed': item_data['quantity_passed'],
-                    'quantity_failed': item_data['quantity_failed'],
-                    'failure_reason': item_data.get('failure_reason', ''),
-                    'photos': item_data.get('photos', [])
-                }
-            )
-        
-        return instance
\ No newline at end of file
+        submit_inspection(
+            instance,
+            result=validated_data['result'],
+            notes=validated_data.get('notes', instance.notes),
+            item_results=validated_data['item_results'],
+            job_items=self.job_items,
+        )
+        return instance
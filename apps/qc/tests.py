@@ -1,3 +1,100 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apps.batching.engine import form_batches
+from apps.batching.models import BatchItem
+from apps.core.testing import make_order, reference_fixture
+from apps.production.models import FailedPartRecord, PrintJob, PrintJobItem
+from .models import QCInspection
+
+
+class SubmitInspectionTests(TestCase):
+    def setUp(self):
+        reference_fixture()
+        self.item = make_order(items=[(4, 'FLGPGR05', '0.1')]).items.get()
+        form_batches()
+        batch_item = BatchItem.objects.get()
+        job = PrintJob.objects.create(batch=batch_item.batch, job_name='job', status='COMPLETED')
+        self.part = PrintJobItem.objects.create(job=job, batch_item=batch_item, quantity=4)
+        self.inspection = QCInspection.objects.create(print_job=job)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('qc', password=None))
+
+    def submit(self, passed, failed):
+        return self.client.post(f'/api/qc/inspections/{self.inspection.pk}/submit/', {
+            'result': 'PARTIAL',
+            'item_results': [{
+                'print_job_item': self.part.pk,
+                'quantity_passed': passed,
+                'quantity_failed': failed,
+                'failure_reason': 'layer shift',
+            }],
+        }, format='json')
+
+    def test_results_roll_forward_into_progress_and_reprints(self):
+        response = self.submit(3, 1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'COMPLETED')
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity_completed, self.item.quantity_failed), (3, 1))
+        failure = FailedPartRecord.objects.get()
+        self.assertEqual((failure.quantity, failure.failure_type), (1, 'QC_DEFECT'))
+        self.assertEqual(PrintJobItem.objects.get().status, 'PRINTED')
+
+    def test_resubmission_only_applies_the_difference(self):
+        self.submit(3, 1)
+        self.submit(2, 2)
+        self.submit(2, 2)
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity_completed, self.item.quantity_failed), (2, 2))
+        self.assertEqual(sorted(FailedPartRecord.objects.values_list('quantity', flat=True)), [1, 1])
+        self.assertEqual(self.inspection.item_results.count(), 1)
+
+    def test_resubmission_with_fewer_failures_withdraws_them(self):
+        self.submit(1, 3)
+        self.submit(2, 2)
+
+        self.submit(4, 0)
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity_completed, self.item.quantity_failed), (4, 0))
+        self.assertEqual(self.item.order.quantity_failed, 0)
+        self.assertFalse(FailedPartRecord.objects.exists())
+        self.assertEqual(self.inspection.item_results.get().quantity_failed, 0)
+
+    def test_partial_withdrawal_keeps_the_rest(self):
+        self.submit(0, 4)
+
+        self.submit(3, 1)
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity_completed, self.item.quantity_failed), (3, 1))
+        self.assertEqual(list(FailedPartRecord.objects.values_list('quantity', flat=True)), [1])
+        self.assertEqual(PrintJobItem.objects.get().status, 'PRINTED')
+
+    def test_requeued_failures_cannot_be_withdrawn(self):
+        self.submit(2, 2)
+        FailedPartRecord.objects.update(requeued=True)
+
+        response = self.submit(4, 0)
+
+        self.assertEqual(response.status_code, 400)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity_completed, self.item.quantity_failed), (2, 2))
+        self.assertEqual(self.inspection.item_results.get().quantity_failed, 2)
+
+    def test_part_with_only_failures_is_failed(self):
+        self.submit(0, 4)
+
+        self.assertEqual(PrintJobItem.objects.get().status, 'FAILED')
+
+    def test_more_than_printed_is_rejected(self):
+        response = self.submit(3, 2)
+
+        self.assertEqual(response.status_code, 400)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity_completed, 0)
+        self.assertFalse(FailedPartRecord.objects.exists())
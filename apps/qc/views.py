@@ -1,6 +1,9 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from apps.core.exports import ExportMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
 from .models import QCInspection, QCItemResult
 from .serializers import (
     QCInspectionSerializer, 
@@ -8,7 +11,7 @@ from .serializers import (
     QCInspectionSubmitSerializer
 )
 
-class QCInspectionViewSet(viewsets.ModelViewSet):
+class QCInspectionViewSet(ExportMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Manages QC Inspections.
     
@@ -17,13 +20,35 @@ class QCInspectionViewSet(viewsets.ModelViewSet):
     - prefetch_related: Deeply fetches the item results -> print_job_item -> 
       batch_item -> order_item. This is required to show 'model_name' 
       on the item results without hitting the DB for every single item.
+
+    GET /export/ streams one row per item result, dated by completion
+    (see core.exports).
     """
+    query_budget = {'list': 5, 'retrieve': 5}
+    required_permissions = {'submit': 'can_qc'}
     queryset = QCInspection.objects.all().select_related(
         'print_job', 
         'inspected_by__user'
     ).prefetch_related(
         'item_results__print_job_item__batch_item__order_item'
     )
+    export_date_field = 'completed_at'
+    export_ordering = ('item_results__id',)
+    export_fields = {
+        'inspection_id': 'id',
+        'print_job_id': 'print_job_id',
+        'status': 'status',
+        'result': 'result',
+        'inspected_by': 'inspected_by__employee_id',
+        'started_at': 'started_at',
+        'completed_at': 'completed_at',
+        'result_id': 'item_results__id',
+        'job_item_id': 'item_results__print_job_item_id',
+        'order_item_id': 'item_results__print_job_item__batch_item__order_item_id',
+        'quantity_passed': 'item_results__quantity_passed',
+        'quantity_failed': 'item_results__quantity_failed',
+        'failure_reason': 'item_results__failure_reason',
+    }
     
     def get_serializer_class(self):
         if self.action == 'submit':
@@ -54,19 +79,21 @@ class QCInspectionViewSet(viewsets.ModelViewSet):
             updated_inspection = serializer.save()
             
             # Return the full read-only representation of the updated inspection
-            # so the frontend can update its UI immediately.
-            read_serializer = QCInspectionSerializer(updated_inspection)
+            # so the frontend can update its UI immediately. Re-read through
+            # the prefetching queryset so the results don't cost a query each.
+            read_serializer = QCInspectionSerializer(self.get_queryset().get(pk=updated_inspection.pk))
             return Response(read_serializer.data, status=status.HTTP_200_OK)
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class QCItemResultViewSet(viewsets.ModelViewSet):
+class QCItemResultViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Direct access to specific item results.
     Useful if you want to update just ONE item's failure reason 
     without re-submitting the whole inspection.
     """
+    query_budget = {'list': 1, 'retrieve': 1}
     queryset = QCItemResult.objects.all().select_related(
         'print_job_item__batch_item__order_item'
     )
@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-17 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['status'], name='shipment_status_idx'),
+        ),
+    ]
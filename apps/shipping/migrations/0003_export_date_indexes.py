@@ -0,0 +1,19 @@
+# Generated by Django 6.1.2 on 2026-10-17 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0001_initial'),
+        ('orders', '0005_order_progress'),
+        ('shipping', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['shipped_at'], name='shipment_shipped_idx'),
+        ),
+    ]
@@ -31,6 +31,14 @@ class Shipment(models.Model):
     packed_at = models.DateTimeField(null=True)
     shipped_at = models.DateTimeField(null=True)
 
+    class Meta:
+        indexes = [
+            # Packing / ready-to-ship queues
+            models.Index(fields=['status'], name='shipment_status_idx'),
+            # Date-range exports
+            models.Index(fields=['shipped_at'], name='shipment_shipped_idx'),
+        ]
+
 
 class ShipmentItem(models.Model):
     """What's in the shipment"""
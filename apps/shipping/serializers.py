@@ -4,8 +4,8 @@ from apps.orders.models import OrderItem # Import needed for validation
 
 class ShipmentItemSerializer(serializers.ModelSerializer):
     # Read-only details for the UI (so the packer knows what item this is)
-    sku = serializers.CharField(source='order_item.sku', read_only=True)
-    product_name = serializers.CharField(source='order_item.product_name', read_only=True)
+    sku = serializers.CharField(source='order_item.material_id', read_only=True)
+    product_name = serializers.CharField(source='order_item.model_file_name', read_only=True)
     
     class Meta:
         model = ShipmentItem
@@ -41,9 +41,10 @@ class ShipmentItemSerializer(serializers.ModelSerializer):
     
 class ShipmentSerializer(serializers.ModelSerializer):
     # Helper fields
-    packer_name = serializers.CharField(source='packed_by.get_full_name', read_only=True)
-    order_number = serializers.CharField(source='order.order_number', read_only=True)
-    item_count = serializers.IntegerField(source='items.count', read_only=True)
+    packer_name = serializers.CharField(source='packed_by.user.get_full_name', read_only=True)
+    order_number = serializers.CharField(source='order.external_id', read_only=True)
+    # Annotated by ShipmentViewSet.get_queryset
+    item_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Shipment
@@ -74,7 +75,7 @@ class ShipmentDetailSerializer(ShipmentSerializer):
     shipping_address = serializers.SerializerMethodField()
 
     class Meta(ShipmentSerializer.Meta):
-        fields = ShipmentSerializer.Meta.fields + ['items']
+        fields = ShipmentSerializer.Meta.fields + ['shipping_address', 'items']
         
-    # def get_shipping_address(self, obj):
-    #     return ...
\ No newline at end of file
+    def get_shipping_address(self, obj):
+        return obj.order.shipping_address
\ No newline at end of file
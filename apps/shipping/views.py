@@ -1,16 +1,45 @@
 from typing import cast
+from django.db.models import Count
 from rest_framework import viewsets
 from rest_framework import permissions
+from apps.core.exports import ExportMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.instrumentation import InstrumentedViewMixin
+from apps.employees.permissions import HasFloorPermission
 from .models import Shipment, ShipmentItem
 from .serializers import ShipmentSerializer, ShipmentItemSerializer, ShipmentDetailSerializer
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.request import Request
 
-class ShipmentViewSet(viewsets.ModelViewSet):
-    queryset = Shipment.objects.all()
+class ShipmentViewSet(ExportMixin, InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    query_budget = {'list': 1, 'retrieve': 3}
+    queryset = Shipment.objects.all().select_related('order', 'packed_by__user')
     serializer_class = ShipmentSerializer
-    permission_classes = [permissions.IsAuthenticated]  # You can change this depending on your app's permissions
+    permission_classes = [permissions.IsAuthenticated, HasFloorPermission]
+    required_permissions = {'pack': 'can_ship'}
+    # One row per shipped item, dated by shipping (see core.exports)
+    export_date_field = 'shipped_at'
+    export_ordering = ('items__id',)
+    export_fields = {
+        'shipment_id': 'id',
+        'order_id': 'order_id',
+        'external_id': 'order__external_id',
+        'status': 'status',
+        'carrier': 'carrier',
+        'tracking_number': 'tracking_number',
+        'weight_oz': 'weight_oz',
+        'packed_at': 'packed_at',
+        'shipped_at': 'shipped_at',
+        'order_item_id': 'items__order_item_id',
+        'quantity': 'items__quantity',
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset().annotate(item_count=Count('items'))
+        if self.action == 'retrieve':
+            return queryset.prefetch_related('items__order_item')
+        return queryset
     
     def get_serializer_class(self):
         """
@@ -42,8 +71,9 @@ class ShipmentViewSet(viewsets.ModelViewSet):
         return Response(ShipmentSerializer(shipment).data)
 
 
-class ShipmentItemViewSet(viewsets.ModelViewSet):
-    queryset = ShipmentItem.objects.all()
+class ShipmentItemViewSet(InstrumentedViewMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    query_budget = {'list': 1, 'retrieve': 1}
+    queryset = ShipmentItem.objects.all().select_related('order_item')
     serializer_class = ShipmentItemSerializer
     permission_classes = [permissions.IsAuthenticated]  # Adjust permissions as needed
 
@@ -60,7 +90,7 @@ class ShipmentItemViewSet(viewsets.ModelViewSet):
         Optionally filter the queryset based on parameters
         like shipment ID, etc.
         """
-        queryset = ShipmentItem.objects.all()
+        queryset = super().get_queryset()
         request = cast(Request, self.request)
         shipment_id = request.query_params.get('shipment', None)
         if shipment_id:
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'formnow.settings')
 
 application = get_asgi_application()
+
+# Load reference data before the first request rather than during it
+from apps.core.reference import reference_data  # noqa: E402
+
+reference_data.warm()
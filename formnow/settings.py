@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.core.instrumentation.RequestMetricsMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,6 +69,16 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
+# Let the dashboard read the per-request metrics (apps.core.instrumentation)
+CORS_EXPOSE_HEADERS = [
+    'X-DB-Queries',
+    'X-DB-Time-ms',
+    'X-Serialization-Queries',
+    'X-Serialization-Time-ms',
+    'X-Query-Budget',
+    'Server-Timing',
+]
+
 ROOT_URLCONF = 'formnow.urls'
 
 TEMPLATES = [
@@ -87,13 +101,79 @@ WSGI_APPLICATION = 'formnow.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+#
+# DB_ENGINE=postgresql for production (needs the 'postgres' extra). With
+# DB_POOL_MAX_SIZE > 0 connections come from Django's native psycopg pool;
+# otherwise each worker keeps its connection for DB_CONN_MAX_AGE seconds
+# (the two cannot be combined). With SQLITE_TUNED=1 SQLite applies
+# SQLITE_TUNED_OPTIONS on every connection: WAL so readers never block the
+# writer, write transactions that take the lock up front and wait for it
+# instead of failing with "database is locked". It is off by default:
+# WAL is written into the database file's header, and db.sqlite3 is
+# tracked, so point SQLITE_PATH at a local copy before turning it on.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+SQLITE_TUNED_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-65536;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT_S', '20')),
+}
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+if DB_ENGINE == 'postgresql':
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '0'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'formnow'),
+            'USER': os.environ.get('DB_USER', 'formnow'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': not DB_POOL_MAX_SIZE,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': DB_POOL_MAX_SIZE,
+                    'timeout': float(os.environ.get('DB_POOL_TIMEOUT_S', '10')),
+                },
+            } if DB_POOL_MAX_SIZE else {},
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': SQLITE_TUNED_OPTIONS if os.environ.get('SQLITE_TUNED', '0') == '1' else {},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'postgresql' or 'sqlite', not {DB_ENGINE!r}")
+
+
+# Shared cache for state every worker should see (e.g. employee permission
+# sets). Without REDIS_URL each process gets its own in-memory cache.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 
 # Password validation
@@ -131,3 +211,44 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# PreFormServer (Formlabs local API) used for scene preparation and printing
+
+PREFORM_SERVER_URL = os.environ.get('PREFORM_SERVER_URL', 'http://localhost:44388')
+
+
+# Printer telemetry is buffered per process and written at most once per
+# window (seconds). 0 writes every request immediately.
+
+TELEMETRY_COALESCE_WINDOW_S = float(os.environ.get('TELEMETRY_COALESCE_WINDOW_S', '2.0'))
+
+
+# Downloaded model files live in a content-addressed store (orders.filestore);
+# least recently used files are evicted once it grows past the budget.
+
+MODEL_FILE_STORE_DIR = os.environ.get('MODEL_FILE_STORE_DIR', BASE_DIR / 'model_files')
+MODEL_FILE_STORE_BUDGET_GB = float(os.environ.get('MODEL_FILE_STORE_BUDGET_GB', '50'))
+MODEL_FILE_DOWNLOAD_CONCURRENCY = int(os.environ.get('MODEL_FILE_DOWNLOAD_CONCURRENCY', '8'))
+
+
+# Memoized PreFormServer results (production.scene_cache); the least
+# recently used are dropped beyond this many.
+
+SCENE_CACHE_MAX_ENTRIES = int(os.environ.get('SCENE_CACHE_MAX_ENTRIES', '100000'))
+
+
+# Every list endpoint is keyset-paginated (see apps.core.pagination);
+# clients follow the 'next' cursor and may pass ?page_size= up to 500.
+# Every request must be signed in; floor actions a view lists in
+# required_permissions are further checked against the employee
+# permission cache.
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.KeysetPagination',
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+        'apps.employees.permissions.HasFloorPermission',
+    ],
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', '50')),
+}
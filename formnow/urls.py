@@ -15,8 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/core/', include('apps.core.urls')),
+    path('api/orders/', include('apps.orders.urls')),
+    path('api/batching/', include('apps.batching.urls')),
+    path('api/production/', include('apps.production.urls')),
+    path('api/fleet/', include('apps.fleet.urls')),
+    path('api/qc/', include('apps.qc.urls')),
+    path('api/shipping/', include('apps.shipping.urls')),
+    path('api/employees/', include('apps.employees.urls')),
 ]
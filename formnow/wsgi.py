@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'formnow.settings')
 
 application = get_wsgi_application()
+
+# Load reference data before the first request rather than during it
+from apps.core.reference import reference_data  # noqa: E402
+
+reference_data.warm()